@@ -0,0 +1,632 @@
+#!/usr/bin/python
+import configparser
+import csv
+import math
+import sys
+
+import numpy as np
+
+DAY = 86400000
+WINDOW = 512
+
+
+class Settings:
+    """
+    The strategy relevant part of the bot configuration, defaults as in config.txt
+    """
+    __slots__ = 'change', 'auto_quota', 'quota', 'spread_factor', 'auto_leverage', 'auto_leverage_escape', \
+                'leverage_default', 'leverage_low', 'leverage_high', 'leverage_escape', 'mm_floor', 'mm_ceil', \
+                'mm_stop_buy', 'stop_on_top', 'close_on_stop', 'order_crypto_min', 'balance', 'maker_fee', \
+                'taker_fee', 'delay'
+
+    def __init__(self, **settings):
+        self.change = 0.005
+        self.auto_quota = False
+        self.quota = 5
+        self.spread_factor = 30
+        self.auto_leverage = True
+        self.auto_leverage_escape = False
+        self.leverage_default = 1.4
+        self.leverage_low = 0.8
+        self.leverage_high = 1.8
+        self.leverage_escape = 4
+        self.mm_floor = 1.0
+        self.mm_ceil = 2.2
+        self.mm_stop_buy = 2.3
+        self.stop_on_top = False
+        self.close_on_stop = False
+        self.order_crypto_min = 0.0025
+        self.balance = 1.0
+        self.maker_fee = -0.00025
+        self.taker_fee = 0.00075
+        # seconds until a buy order which could not be placed is retried
+        self.delay = 135
+        for name, value in settings.items():
+            setattr(self, name, value)
+
+    @staticmethod
+    def read(filename: str):
+        """
+        Reads the settings from a bot configuration file
+        :param filename: path of the configuration file
+        :return Settings
+        """
+        config = configparser.RawConfigParser()
+        config.read(filename)
+        try:
+            props = dict(config.items('config'))
+        except configparser.NoSectionError:
+            raise SystemExit('invalid configuration ' + filename)
+        settings = Settings()
+        for name in Settings.__slots__:
+            if name in props:
+                value = str(props[name]).strip('"')
+                default = getattr(settings, name)
+                if isinstance(default, bool):
+                    setattr(settings, name, value.lower() == 'true')
+                else:
+                    setattr(settings, name, type(default)(float(value)))
+        settings.quota = max(settings.quota, 1)
+        return settings
+
+
+class Candles:
+    """
+    OHLC history as numpy arrays, timestamps in milliseconds
+    """
+    __slots__ = 'time', 'open', 'high', 'low', 'close'
+
+    def __init__(self, time, open_, high, low, close):
+        self.time = np.asarray(time, dtype=np.int64)
+        self.open = np.asarray(open_, dtype=np.float64)
+        self.high = np.asarray(high, dtype=np.float64)
+        self.low = np.asarray(low, dtype=np.float64)
+        self.close = np.asarray(close, dtype=np.float64)
+
+    def __len__(self):
+        return len(self.close)
+
+    @staticmethod
+    def read(filename: str):
+        """
+        Reads candles from a csv file with the columns timestamp, open, high, low, close (and optionally volume) as
+        written by ccxt fetch_ohlcv, a header line is skipped. Timestamps in seconds are converted to milliseconds.
+        :param filename: path of the csv file
+        :return Candles
+        """
+        with open(filename) as file:
+            first = file.readline()
+        skip = 0 if first.split(',')[0].strip().replace('.', '', 1).isdigit() else 1
+        data = np.loadtxt(filename, delimiter=',', skiprows=skip, usecols=(0, 1, 2, 3, 4), ndmin=2)
+        time = data[:, 0].astype(np.int64)
+        if len(time) and time[0] < 10 ** 11:
+            time = time * 1000
+        return Candles(time, data[:, 1], data[:, 2], data[:, 3], data[:, 4])
+
+
+def mayer_multiples(candles: Candles, days: int = 200):
+    """
+    Calculates the Mayer multiple of every candle: the close divided by the average of the daily closes of the
+    preceding days
+    :return array of multiples, nan where the history is too short
+    """
+    day = candles.time // DAY
+    last = np.flatnonzero(np.append(day[1:] != day[:-1], True))
+    daily = candles.close[last]
+    sums = np.concatenate(([0.0], np.cumsum(daily)))
+    averages = np.full(len(daily), np.nan)
+    if len(daily) > days:
+        averages[days:] = (sums[days:-1] - sums[:-days - 1]) / days
+    index = np.searchsorted(day[last], day)
+    return candles.close / averages[index]
+
+
+class Account:
+    """
+    Margin account in the base currency holding an inverse long position (quantity in quote) as on bitmex
+    """
+    __slots__ = 'wallet', 'quantity', 'entry', 'leverage', 'deposits', 'fees'
+
+    def __init__(self, balance: float, leverage: float):
+        self.wallet = balance
+        self.deposits = balance
+        self.quantity = 0
+        self.entry = 0.0
+        self.leverage = leverage
+        self.fees = 0.0
+
+    def fill(self, side: str, quantity: int, price: float, fee_rate: float):
+        if side == 'sell':
+            quantity = min(quantity, self.quantity)
+            if not quantity:
+                return 0
+        fee = quantity / price * fee_rate
+        self.wallet -= fee
+        self.fees += fee
+        if side == 'buy':
+            value = self.quantity / self.entry if self.quantity else 0
+            self.quantity += quantity
+            self.entry = self.quantity / (value + quantity / price)
+        else:
+            self.wallet += quantity * (1 / self.entry - 1 / price)
+            self.quantity -= quantity
+        return quantity
+
+    def equity(self, price):
+        if not self.quantity:
+            return self.wallet + 0 * price
+        return self.wallet + self.quantity * (1 / self.entry - 1 / price)
+
+    def used(self, buy_orders: list):
+        used = self.quantity / self.entry / self.leverage if self.quantity else 0.0
+        return used + sum(amount / price / self.leverage for price, amount in buy_orders)
+
+    def liquidation_price(self):
+        if not self.quantity:
+            return 0.0
+        return 1 / (self.wallet / self.quantity + 1 / self.entry)
+
+
+class Backtest:
+    """
+    Replays candles through the decision rules of holdntrade (buy_executed, sell_executed, keep_buying, spread,
+    shall_hibernate, calculate_buy_order_amount, calculate_quota, adjust_leverage) against a simulated bitmex account.
+    Between two events the state is constant, so the next fill, spread violation, retry or wake up is searched for with
+    numpy over windows of candles and the equity curve is computed for whole segments at once.
+    Orders placed at a candle are priced with its close and can be filled from the next candle on, at their limit
+    price. The bot does not notice fills while hibernating, they are followed up after waking up. Sell orders are
+    reduce only and funding is not taken into account.
+    """
+    __slots__ = 'settings', 'candles', 'mayer', 'account', 'sells', 'buys', 'current', 'hibernate', 'slept', \
+                'retry_at', 'fills', 'leverages', 'equity', 'liquidated', 'end'
+
+    def __init__(self, candles: Candles, settings: Settings, mayer=None):
+        self.settings = settings
+        self.candles = candles
+        self.mayer = mayer if mayer is not None else mayer_multiples(candles)
+        self.account = Account(settings.balance, settings.leverage_default)
+        # orders as [price, amount], the current buy order is the last one placed
+        self.sells = []
+        self.buys = []
+        self.current = None
+        self.hibernate = False
+        self.slept = 0
+        self.retry_at = None
+        self.fills = []
+        self.leverages = []
+        self.equity = np.full(len(candles), np.nan)
+        self.liquidated = None
+        self.end = len(candles)
+
+    # ------------------------------------------------------------------ decision rules
+
+    def get_mayer(self, index: int):
+        mayer = self.mayer[index]
+        return None if np.isnan(mayer) else float(mayer)
+
+    def get_target_leverage(self, mayer: float):
+        if self.settings.auto_leverage:
+            if mayer is not None and mayer > self.settings.mm_ceil:
+                return self.settings.leverage_low
+            if mayer is not None and mayer < self.settings.mm_floor:
+                return self.settings.leverage_high
+        return self.settings.leverage_default
+
+    def adjust_leverage(self, index: int):
+        leverage = round(self.account.leverage, 1)
+        if not self.settings.auto_leverage:
+            self.set_leverage(index, self.settings.leverage_default)
+            return
+        target = self.get_target_leverage(self.get_mayer(index))
+        if leverage < target:
+            self.set_leverage(index, leverage + 0.1)
+        elif leverage > target:
+            if leverage - target > 1:
+                leverage -= math.floor(leverage - target)
+            for step in (0.3, 0.2, 0.1):
+                if round(leverage - target, 1) >= step:
+                    leverage -= step
+            self.set_leverage(index, leverage)
+
+    def set_leverage(self, index: int, leverage: float):
+        leverage = round(leverage, 1)
+        if leverage != self.account.leverage:
+            self.account.leverage = leverage
+            self.leverages.append((int(self.candles.time[index]), leverage))
+
+    def shall_hibernate(self, index: int):
+        mayer = self.get_mayer(index)
+        if mayer is not None:
+            if mayer > self.settings.mm_stop_buy:
+                return True
+            leverage = round(self.account.leverage, 1)
+            if not self.settings.auto_leverage:
+                return leverage > self.settings.leverage_default
+            if self.settings.auto_leverage_escape:
+                return leverage > self.settings.leverage_escape
+            return leverage > self.get_target_leverage(mayer)
+        return self.hibernate
+
+    def keep_buying(self, price: float):
+        if not self.settings.stop_on_top:
+            return True
+        if self.sells:
+            return round(price * (1 + self.settings.change)) < max(order[0] for order in self.sells)
+        return False
+
+    def get_balance(self, price: float):
+        total = self.account.equity(price)
+        used = min(total, self.account.used(self.buys))
+        return {'free': total - used, 'used': used, 'total': total}
+
+    def calculate_quota(self, price: float):
+        if not self.settings.auto_quota:
+            return self.settings.quota
+        margin_balance = self.account.equity(price)
+        if margin_balance < 0:
+            return 2
+        quota = round((math.sqrt(margin_balance * price) / 15) * 0.8 + (self.settings.change * 200))
+        return 2 if quota < 2 else 20 if quota > 20 else quota
+
+    def calculate_buy_order_amount(self, price: float):
+        available = self.get_balance(price)['free']
+        if available < 0:
+            return 0
+        return math.floor(available / self.calculate_quota(price) * price)
+
+    def calculate_sell_order_amount(self, price: float):
+        return math.floor(self.account.quantity / self.calculate_quota(price))
+
+    def is_order_below_limit(self, amount: int, price: float):
+        return abs(amount / price) < self.settings.order_crypto_min
+
+    # ------------------------------------------------------------------ orders
+
+    def create_sell_order(self, price: float, amount: int):
+        if self.account.quantity < amount or self.is_order_below_limit(amount, price):
+            return False
+        self.sells.append([price, amount])
+        return True
+
+    def create_buy_order(self, index: int, price: float, amount: int):
+        buy_price = round(price * (1 - self.settings.change))
+        margin = amount / buy_price / self.account.leverage
+        if not self.is_order_below_limit(amount, buy_price) and margin <= self.get_balance(price)['free']:
+            self.current = [buy_price, amount]
+            self.buys.append(self.current)
+            self.retry_at = None
+            return True
+        if self.sells:
+            # delay_buy_order
+            self.retry_at = int(self.candles.time[index]) + self.settings.delay * 1000
+        return False
+
+    def retry_buy_order(self, index: int, price: float):
+        self.retry_at = None
+        if self.is_order_below_limit(self.calculate_buy_order_amount(price), price) and self.settings.auto_leverage:
+            if self.settings.auto_leverage_escape:
+                if self.account.leverage + 0.1 <= self.settings.leverage_escape:
+                    self.set_leverage(index, self.account.leverage + 0.1)
+            else:
+                self.adjust_leverage(index)
+        self.create_buy_order(index, price, self.calculate_buy_order_amount(price))
+
+    def create_buy_and_sell_order(self, index: int, price: float, buy_amount: int, sell_amount: int):
+        self.create_buy_order(index, price, buy_amount)
+        self.create_sell_order(round(price * (1 + self.settings.change)), sell_amount)
+
+    def cancel_current_buy_order(self):
+        if self.current is not None:
+            self.buys.remove(self.current)
+            self.current = self.buys[0] if self.buys else None
+
+    def market(self, index: int, side: str, amount: int, price: float):
+        quantity = self.account.fill(side, amount, price, self.settings.taker_fee)
+        if quantity:
+            self.fills.append((int(self.candles.time[index]), side, price, quantity))
+
+    # ------------------------------------------------------------------ main loop
+
+    def initialise(self, index: int):
+        """
+        The initialisation pass of the main loop: leverage, compensation and the first orders
+        """
+        settings = self.settings
+        price = float(self.candles.close[index])
+        self.adjust_leverage(index)
+        if not settings.stop_on_top:
+            balance = self.get_balance(price)
+            used = 100 - balance['free'] / balance['total'] * 100 if balance['total'] > 0 else 0
+            if used < 40 or used > 60:
+                crypto = balance['total'] / 2 - balance['used']
+                if crypto > 0:
+                    self.market(index, 'buy', round(crypto * price), price + 0.5)
+                else:
+                    self.market(index, 'sell', round(abs(crypto) * price), price - 0.5)
+            if not self.sells:
+                self.create_sell_order(round(price * (1 + settings.change)), self.calculate_sell_order_amount(price))
+            if not self.buys:
+                self.hibernate = self.shall_hibernate(index)
+                if not self.hibernate:
+                    self.create_buy_order(index, price, self.calculate_buy_order_amount(price))
+
+    def filled(self, orders: list, side: str, start: int, index: int):
+        """
+        Removes and books the orders filled between start and index
+        :return the filled orders
+        """
+        if side == 'buy':
+            lowest = self.candles.low[start:index + 1].min()
+            done = [order for order in orders if order[0] >= lowest]
+        else:
+            highest = self.candles.high[start:index + 1].max()
+            done = [order for order in orders if order[0] <= highest]
+        for order in done:
+            orders.remove(order)
+            quantity = self.account.fill(side, order[1], order[0], self.settings.maker_fee)
+            if quantity:
+                self.fills.append((int(self.candles.time[index]), side, order[0], quantity))
+        return done
+
+    def trade(self, start: int, index: int):
+        """
+        One pass of the main loop at the candle index, following up the orders filled since the candle start
+        """
+        settings = self.settings
+        price = float(self.candles.close[index])
+        current = self.current
+        bought = self.filled(self.buys, 'buy', start, index)
+        sold = self.filled(self.sells, 'sell', start, index)
+
+        # buy_executed
+        for order in bought:
+            if order is current:
+                continue
+            self.create_sell_order(round(order[0] * (1 + settings.change) / (1 - settings.change)), order[1])
+        if current is not None and current in bought:
+            self.current = None
+            self.adjust_leverage(index)
+            self.hibernate = self.shall_hibernate(index)
+            if not self.hibernate:
+                if self.keep_buying(price):
+                    self.create_buy_and_sell_order(index, price, self.calculate_buy_order_amount(price), current[1])
+                else:
+                    self.create_sell_order(round(price * (1 + settings.change)), current[1])
+
+        # sell_executed
+        for _ in sold:
+            if settings.stop_on_top and settings.close_on_stop and not self.sells:
+                break
+            self.adjust_leverage(index)
+            self.hibernate = self.shall_hibernate(index)
+            if not self.hibernate:
+                if not self.sells:
+                    self.create_sell_order(round(price * (1 + settings.change)),
+                                           self.calculate_sell_order_amount(price))
+                self.cancel_current_buy_order()
+                if self.keep_buying(price):
+                    self.create_buy_order(index, price, self.calculate_buy_order_amount(price))
+
+        if self.retry_at is not None and self.candles.time[index] >= self.retry_at and not self.hibernate:
+            self.retry_buy_order(index, price)
+
+        if not self.sells:
+            if not settings.stop_on_top:
+                # init_orders(True, False)
+                self.buys = []
+                self.current = None
+                self.initialise(index)
+            else:
+                self.hibernate = True
+                if settings.close_on_stop:
+                    self.market(index, 'sell', self.account.quantity, price - 0.5)
+        else:
+            self.spread(index, price)
+
+    def spread(self, index: int, price: float):
+        tolerance = self.settings.change * self.settings.spread_factor
+        if self.buys and self.sells:
+            highest_buy = max(self.buys, key=lambda order: order[0])
+            if highest_buy[0] < price * (1 - tolerance) and min(order[0] for order in self.sells) > \
+                    price * (1 + tolerance):
+                self.buys.remove(highest_buy)
+                if highest_buy is self.current:
+                    self.current = None
+                self.create_buy_and_sell_order(index, price, highest_buy[1], highest_buy[1])
+
+    def wake_up(self, index: int):
+        for _ in range(40):
+            leverage = self.account.leverage
+            self.adjust_leverage(index)
+            if self.account.leverage == leverage:
+                break
+        self.hibernate = self.shall_hibernate(index)
+
+    def next_event(self, start: int):
+        """
+        Searches for the first candle from start on at which the bot has something to do
+        :return index of the candle or the number of candles
+        """
+        candles = self.candles
+        size = WINDOW
+        while start < self.end:
+            stop = min(start + size, self.end)
+            if self.hibernate:
+                events = self.mayer[start:stop] <= self.settings.mm_stop_buy
+            else:
+                events = np.zeros(stop - start, dtype=bool)
+                if self.buys:
+                    highest_buy = max(order[0] for order in self.buys)
+                    events |= candles.low[start:stop] <= highest_buy
+                if self.sells:
+                    lowest_sell = min(order[0] for order in self.sells)
+                    events |= candles.high[start:stop] >= lowest_sell
+                if self.buys and self.sells:
+                    tolerance = self.settings.change * self.settings.spread_factor
+                    close = candles.close[start:stop]
+                    events |= (close * (1 - tolerance) > highest_buy) & (close * (1 + tolerance) < lowest_sell)
+                if self.retry_at is not None:
+                    events |= candles.time[start:stop] >= self.retry_at
+            if not self.check_liquidation(start, stop, events):
+                return self.end
+            found = np.flatnonzero(events)
+            if len(found):
+                self.record(start, start + int(found[0]))
+                return start + int(found[0])
+            self.record(start, stop)
+            start = stop
+            size *= 2
+        return self.end
+
+    def check_liquidation(self, start: int, stop: int, events):
+        """
+        Ends the run at the first candle whose low wipes out the margin before the next event
+        :return False if liquidated
+        """
+        if not self.account.quantity:
+            return True
+        found = np.flatnonzero(events)
+        last = start + int(found[0]) if len(found) else stop
+        equity = self.account.equity(self.candles.low[start:last + 1 if last < stop else stop])
+        wiped = np.flatnonzero(equity <= 0)
+        if not len(wiped):
+            return True
+        self.liquidated = start + int(wiped[0])
+        self.record(start, self.liquidated)
+        self.account.wallet = 0.0
+        self.account.quantity = 0
+        self.equity[self.liquidated:] = 0.0
+        self.end = self.liquidated
+        return False
+
+    def record(self, start: int, stop: int):
+        self.equity[start:stop] = self.account.equity(self.candles.close[start:stop])
+
+    def run(self):
+        """
+        Replays all candles
+        :return self
+        """
+        if not len(self.candles):
+            return self
+        self.leverages.append((int(self.candles.time[0]), self.account.leverage))
+        self.initialise(0)
+        self.record(0, 1)
+        index = 0
+        # first candle whose fills have not been followed up yet
+        start = 1
+        while index < self.end - 1:
+            event = self.next_event(index + 1)
+            if event >= self.end:
+                break
+            if self.hibernate:
+                self.slept += event - index
+                self.wake_up(event)
+            if not self.hibernate:
+                self.trade(start, event)
+                start = event + 1
+            self.record(event, event + 1)
+            index = event
+        if self.hibernate:
+            self.slept += self.end - 1 - index
+        return self
+
+    # ------------------------------------------------------------------ results
+
+    def get_metrics(self):
+        """
+        The figures of the daily report at the end of the run plus drawdown and fill statistics
+        :return dict
+        """
+        last = (self.liquidated if self.liquidated is not None else len(self.candles)) - 1
+        price = float(self.candles.close[max(last, 0)])
+        balance = self.get_balance(price)
+        equity = self.equity[~np.isnan(self.equity)]
+        peaks = np.maximum.accumulate(equity) if len(equity) else equity
+        drawdown = float(np.max(1 - equity / peaks)) * 100 if len(equity) else 0.0
+        fiat = self.equity * self.candles.close
+        fiat = fiat[~np.isnan(fiat)]
+        return {'price': price,
+                'wallet_balance': self.account.wallet,
+                'margin_balance': balance['total'],
+                'available_balance': balance['free'],
+                'net_deposits': self.account.deposits,
+                'performance': balance['total'] - self.account.deposits,
+                'relative_performance': (balance['total'] / self.account.deposits - 1) * 100,
+                'fiat_performance': (fiat[-1] / fiat[0] - 1) * 100 if len(fiat) else 0.0,
+                'used_margin': 100 - balance['free'] / balance['total'] * 100 if balance['total'] > 0 else 0.0,
+                'actual_leverage': self.account.quantity / price / balance['total'] if balance['total'] > 0 else 0.0,
+                'leverage': self.account.leverage,
+                'position': self.account.quantity,
+                'liquidation_price': self.account.liquidation_price(),
+                'buy_orders': len(self.buys),
+                'sell_orders': len(self.sells),
+                'buy_order_value': sum(order[1] for order in self.buys),
+                'sell_order_value': sum(order[1] for order in self.sells),
+                'fills': len(self.fills),
+                'buys': sum(1 for fill in self.fills if fill[1] == 'buy'),
+                'sells': sum(1 for fill in self.fills if fill[1] == 'sell'),
+                'fees': self.account.fees,
+                'max_drawdown': drawdown,
+                'hibernated': self.slept / len(self.candles) * 100,
+                'liquidated': self.liquidated is not None}
+
+    def write(self, prefix: str):
+        """
+        Writes the equity curve, the fills and the leverage history as csv files
+        :param prefix: common beginning of the file names
+        """
+        with open(prefix + '.equity.csv', 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(['timestamp', 'price', 'equity'])
+            for row in zip(self.candles.time.tolist(), self.candles.close.tolist(), self.equity.tolist()):
+                writer.writerow(row)
+        with open(prefix + '.fills.csv', 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(['timestamp', 'side', 'price', 'amount'])
+            writer.writerows(self.fills)
+        with open(prefix + '.leverage.csv', 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(['timestamp', 'leverage'])
+            writer.writerows(self.leverages)
+
+
+def format_report(metrics: dict, base: str = 'BTC', quote: str = 'USD'):
+    """
+    Formats the metrics like the performance part of the daily report
+    :return text
+    """
+    lines = ["Net deposits {}: {:>20.4f}".format(base, metrics['net_deposits']),
+             "Overall performance in {}: {:>+10.4f} ({:+.2f}%)".format(base, metrics['performance'],
+                                                                       metrics['relative_performance']),
+             "Wallet balance {}: {:>18.4f}".format(base, metrics['wallet_balance']),
+             "Margin balance {}: {:>18.4f}".format(base, metrics['margin_balance']),
+             "Available balance {}: {:>15.4f}".format(base, metrics['available_balance']),
+             "{} price {}: {:>20.1f}".format(base, quote, metrics['price']),
+             "Liquidation price {}: {:>12.1f}".format(quote, metrics['liquidation_price']),
+             "Used margin: {:>22.2f}%".format(metrics['used_margin']),
+             "Actual leverage: {:>18.2f}x".format(metrics['actual_leverage']),
+             "Position {}: {:>21}".format(quote, metrics['position']),
+             "Value of buy orders {}: {:>10}".format(quote, int(metrics['buy_order_value'])),
+             "Value of sell orders {}: {:>9}".format(quote, int(metrics['sell_order_value'])),
+             "No. of buy orders: {:>16}".format(metrics['buy_orders']),
+             "No. of sell orders: {:>15}".format(metrics['sell_orders']),
+             "Fills (buy / sell): {:>15}".format('{} / {}'.format(metrics['buys'], metrics['sells'])),
+             "Fees {}: {:>25.4f}".format(base, metrics['fees']),
+             "Max. drawdown: {:>19.2f}%".format(metrics['max_drawdown']),
+             "Hibernated: {:>22.2f}%".format(metrics['hibernated'])]
+    if metrics['liquidated']:
+        lines.append('Liquidated!')
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print('Usage: backtest.py candles.csv [config name]')
+        sys.exit(1)
+    NAME = sys.argv[2] if len(sys.argv) > 2 else None
+    SETTINGS = Settings.read(NAME + '.txt') if NAME else Settings()
+    BACKTEST = Backtest(Candles.read(sys.argv[1]), SETTINGS).run()
+    print(format_report(BACKTEST.get_metrics()))
+    if NAME:
+        BACKTEST.write(NAME)
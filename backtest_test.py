@@ -0,0 +1,71 @@
+import unittest
+
+import numpy as np
+
+import backtest
+from backtest import Backtest, Candles, Settings
+
+
+def create_candles(closes: list, spread: float = 0.0):
+    closes = np.asarray(closes, dtype=np.float64)
+    times = 1546300800000 + np.arange(len(closes), dtype=np.int64) * 3600000
+    return Candles(times, closes, closes * (1 + spread), closes * (1 - spread), closes)
+
+
+class BacktestTest(unittest.TestCase):
+
+    def test_read_settings_from_config(self):
+        settings = Settings.read('config.txt')
+
+        self.assertEqual(0.005, settings.change)
+        self.assertEqual(5, settings.quota)
+        self.assertTrue(settings.auto_leverage)
+        self.assertEqual(1.4, settings.leverage_default)
+        self.assertEqual(-0.00025, settings.maker_fee)
+
+    def test_mayer_multiples_should_divide_by_average_of_preceding_days(self):
+        closes = [100.0] * 3 * 24 + [200.0] * 24
+        candles = create_candles(closes)
+
+        mayer = backtest.mayer_multiples(candles, 3)
+
+        self.assertTrue(np.isnan(mayer[:3 * 24]).all())
+        self.assertEqual(2, mayer[-1])
+
+    def test_buy_fill_should_be_followed_by_sell_order_and_sold_with_profit(self):
+        settings = Settings(auto_leverage=False, maker_fee=0.0, taker_fee=0.0)
+        candles = create_candles([10000, 9990, 9940, 9960, 10000, 10050, 10100])
+
+        result = Backtest(candles, settings).run()
+
+        # compensation, then the first buy order and its follow up sell order
+        self.assertEqual((candles.time[0], 'buy', 10000.5, 5000), result.fills[0])
+        self.assertEqual((candles.time[2], 'buy', 9950, 1285), result.fills[1])
+        self.assertEqual((candles.time[4], 'sell', 9990, 1285), result.fills[2])
+        self.assertEqual((candles.time[5], 'sell', 10050, 1000), result.fills[3])
+        metrics = result.get_metrics()
+        self.assertGreater(metrics['performance'], 0)
+        self.assertFalse(metrics['liquidated'])
+        self.assertEqual(len(candles), np.count_nonzero(~np.isnan(result.equity)))
+
+    def test_crash_should_liquidate(self):
+        settings = Settings(leverage_default=5, auto_leverage=False)
+        candles = create_candles(list(np.linspace(10000, 2000, 200)))
+
+        result = Backtest(candles, settings).run()
+
+        self.assertTrue(result.get_metrics()['liquidated'])
+        self.assertEqual(0, result.equity[-1])
+
+    def test_high_mayer_multiple_should_hibernate(self):
+        closes = [10000.0] * 200 * 24 + [30000.0] * 48
+        candles = create_candles(closes, 0.001)
+
+        result = Backtest(candles, Settings()).run()
+
+        self.assertGreater(result.get_metrics()['hibernated'], 0)
+        self.assertEqual(0, len(result.buys))
+
+
+if __name__ == '__main__':
+    unittest.main()
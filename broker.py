@@ -0,0 +1,231 @@
+#!/usr/bin/python
+import configparser
+import logging
+import mmap
+import os
+import struct
+import sys
+import time
+
+import ccxt
+import requests
+
+MAGIC = b'HNTB'
+VERSION = 1
+SLOTS = 64
+# magic, version, number of price slots
+HEADER = struct.Struct('<4sII')
+# every record starts with its sequence number
+SEQUENCE = struct.Struct('<Q')
+# updated, current, average
+MAYER = struct.Struct('<ddd')
+# updated, bid
+PRICE = struct.Struct('<dd')
+# key, sequence, updated, bid
+SLOT = struct.Struct('<32sQdd')
+MAYER_OFFSET = HEADER.size
+SLOTS_OFFSET = MAYER_OFFSET + SEQUENCE.size + MAYER.size
+SIZE = SLOTS_OFFSET + SLOTS * SLOT.size
+MAYER_URL = 'https://mayermultiple.info/current.json'
+TIMEOUT = (3.05, 10)
+
+
+def create_key(exchange: str, pair: str, test: bool = False):
+    """
+    :return the key of the price slot of a pair
+    """
+    return '{} {}{}'.format(exchange, pair, ' test' if test else '')
+
+
+def slot_offset(index: int):
+    return SLOTS_OFFSET + index * SLOT.size
+
+
+class Broker:
+    """
+    Fetches the price of every distinct pair and the Mayer multiple once for all instances on the host and publishes
+    them in a memory mapped file of fixed layout. Every record is guarded by a sequence number (seqlock): it is odd
+    while the record is written, so readers never need a lock.
+    """
+    __slots__ = 'filename', 'keys', 'memory', 'exchanges', 'session', 'interval', 'mayer_ttl', 'mayer_fetched', 'log'
+
+    def __init__(self, filename: str, keys: [tuple], interval: float = 2, mayer_ttl: float = 900):
+        """
+        :param filename: path of the memory mapped file
+        :param keys: (exchange, pair, test) of every pair to publish
+        :param interval: seconds between two rounds of price fetches
+        :param mayer_ttl: seconds between two fetches of the Mayer multiple
+        """
+        if len(keys) > SLOTS:
+            raise ValueError('At most {} pairs supported'.format(SLOTS))
+        self.filename = filename
+        self.keys = keys
+        self.interval = interval
+        self.mayer_ttl = mayer_ttl
+        self.mayer_fetched = 0
+        self.exchanges = {}
+        self.session = requests.Session()
+        self.log = logging.getLogger('broker')
+        # an existing file is reused, truncating it would crash the readers which mapped it
+        if not os.path.isfile(filename) or os.path.getsize(filename) != SIZE:
+            with open(filename, 'wb') as file:
+                file.write(bytes(SIZE))
+        with open(filename, 'r+b') as file:
+            self.memory = mmap.mmap(file.fileno(), SIZE)
+        HEADER.pack_into(self.memory, 0, MAGIC, VERSION, SLOTS)
+        self.memory[SLOTS_OFFSET:SIZE] = bytes(SIZE - SLOTS_OFFSET)
+        for index, key in enumerate(keys):
+            SLOT.pack_into(self.memory, slot_offset(index), create_key(*key).encode(), 0, 0, 0)
+
+    def write(self, offset: int, payload: struct.Struct, *values):
+        sequence = SEQUENCE.unpack_from(self.memory, offset)[0]
+        SEQUENCE.pack_into(self.memory, offset, sequence + 1)
+        payload.pack_into(self.memory, offset + SEQUENCE.size, *values)
+        SEQUENCE.pack_into(self.memory, offset, sequence + 2)
+
+    def publish_price(self, index: int, price: float):
+        self.write(slot_offset(index) + 32, PRICE, time.time(), price)
+
+    def publish_mayer(self, mayer: dict):
+        self.write(MAYER_OFFSET, MAYER, time.time(), mayer['current'], mayer['average'])
+
+    def get_exchange(self, name: str, test: bool):
+        if (name, test) not in self.exchanges:
+            exchange = getattr(ccxt, name)({'enableRateLimit': True, 'session': self.session})
+            if test and 'test' in exchange.urls:
+                exchange.urls['api'] = exchange.urls['test']
+            self.exchanges[(name, test)] = exchange
+        return self.exchanges[(name, test)]
+
+    def fetch_prices(self):
+        for index, (name, pair, test) in enumerate(self.keys):
+            try:
+                price = self.get_exchange(name, test).fetch_ticker(pair)['bid']
+                if price:
+                    self.publish_price(index, price)
+            except (ccxt.ExchangeError, ccxt.NetworkError) as error:
+                self.log.warning('Failed to fetch %s %s %s', create_key(name, pair, test), type(error).__name__,
+                                 str(error.args))
+
+    def fetch_mayer(self):
+        try:
+            mayer = self.session.get(MAYER_URL, timeout=TIMEOUT).json()['data']
+            self.publish_mayer({'current': float(mayer['current_mayer_multiple']),
+                                'average': float(mayer['average_mayer_multiple'])})
+            self.mayer_fetched = time.time()
+        except (requests.exceptions.RequestException, ValueError, KeyError, TypeError) as error:
+            self.log.warning('Failed to fetch Mayer multiple %s %s', type(error).__name__, str(error.args))
+
+    def run(self):
+        while True:
+            started = time.time()
+            self.fetch_prices()
+            if time.time() - self.mayer_fetched > self.mayer_ttl:
+                self.fetch_mayer()
+            time.sleep(max(0.0, self.interval - (time.time() - started)))
+
+
+class BrokerReader:
+    """
+    Reads the values published by the broker, values older than the requested age count as missing
+    """
+    __slots__ = 'filename', 'memory', 'offsets'
+
+    RETRIES = 100
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.memory = None
+        self.offsets = {}
+
+    def open(self):
+        if self.memory is None and os.path.isfile(self.filename) and os.path.getsize(self.filename) >= SIZE:
+            with open(self.filename, 'rb') as file:
+                memory = mmap.mmap(file.fileno(), SIZE, access=mmap.ACCESS_READ)
+            if HEADER.unpack_from(memory, 0)[:2] == (MAGIC, VERSION):
+                self.memory = memory
+        return self.memory is not None
+
+    def read(self, offset: int, payload: struct.Struct):
+        """
+        Reads a consistent record, retrying while it is written
+        :return tuple or None if the record could not be read
+        """
+        for _ in range(self.RETRIES):
+            before = SEQUENCE.unpack_from(self.memory, offset)[0]
+            if before % 2:
+                continue
+            values = payload.unpack_from(self.memory, offset + SEQUENCE.size)
+            if SEQUENCE.unpack_from(self.memory, offset)[0] == before:
+                return values if before else None
+        return None
+
+    def find(self, key: str):
+        """
+        :return the offset of the record of the pair, the slot is checked on every call as the broker may have been
+        restarted with other pairs
+        """
+        encoded = key.encode()
+        offset = self.offsets.get(key)
+        if offset is not None and self.memory[offset - 32:offset].rstrip(b'\0') == encoded:
+            return offset
+        for index in range(SLOTS):
+            offset = slot_offset(index)
+            if self.memory[offset:offset + 32].rstrip(b'\0') == encoded:
+                self.offsets[key] = offset + 32
+                return offset + 32
+        return None
+
+    def get_price(self, exchange: str, pair: str, test: bool, max_age: float):
+        """
+        :return the price of the pair or None if the broker does not publish it or it is stale
+        """
+        if not self.open():
+            return None
+        offset = self.find(create_key(exchange, pair, test))
+        if offset is None:
+            return None
+        values = self.read(offset, PRICE)
+        if values is None or time.time() - values[0] > max_age:
+            return None
+        return values[1]
+
+    def get_mayer(self, max_age: float):
+        """
+        :return dict with the current and the average Mayer multiple or None if stale
+        """
+        if not self.open():
+            return None
+        values = self.read(MAYER_OFFSET, MAYER)
+        if values is None or time.time() - values[0] > max_age:
+            return None
+        return {'current': values[1], 'average': values[2]}
+
+
+def read_keys(names: [str]):
+    """
+    Collects the distinct pairs of the instance configurations
+    :return list of (exchange, pair, test)
+    """
+    keys = []
+    for name in names:
+        config = configparser.ConfigParser()
+        config.read(name + '.txt')
+        try:
+            props = config['config']
+            key = (str(props['exchange']).strip('"').lower(), str(props['pair']).strip('"'),
+                   str(props.get('test', 'false')).strip('"').lower() == 'true')
+        except KeyError:
+            raise SystemExit('invalid configuration for ' + name)
+        if key not in keys:
+            keys.append(key)
+    return keys
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
+    if len(sys.argv) < 2:
+        print('Usage: broker.py config1 [config2 ...]')
+        sys.exit(1)
+    print('Starting Hold n Trade market data broker')
+    Broker('broker.mmap', read_keys([os.path.basename(arg) for arg in sys.argv[1:]])).run()
@@ -0,0 +1,75 @@
+import os
+import time
+import unittest
+from unittest.mock import patch
+
+import broker
+import holdntrade
+from broker import Broker, BrokerReader
+
+
+class BrokerTest(unittest.TestCase):
+
+    def tearDown(self):
+        if os.path.isfile('test.mmap'):
+            os.remove('test.mmap')
+
+    def test_reader_should_get_published_values_until_stale(self):
+        publisher = Broker('test.mmap', [('bitmex', 'BTC/USD', True), ('kraken', 'BTC/USD', False)])
+        reader = BrokerReader('test.mmap')
+
+        self.assertIsNone(reader.get_price('kraken', 'BTC/USD', False, 5))
+        self.assertIsNone(reader.get_mayer(900))
+
+        publisher.publish_price(1, 9000.5)
+        publisher.publish_mayer({'current': 1.2, 'average': 1.4})
+
+        self.assertEqual(9000.5, reader.get_price('kraken', 'BTC/USD', False, 5))
+        self.assertIsNone(reader.get_price('bitmex', 'BTC/USD', False, 5))
+        self.assertIsNone(reader.get_price('kraken', 'BTC/USD', False, -1))
+        self.assertEqual({'current': 1.2, 'average': 1.4}, reader.get_mayer(900))
+
+    def test_reader_should_skip_record_being_written(self):
+        publisher = Broker('test.mmap', [('bitmex', 'BTC/USD', False)])
+        publisher.publish_price(0, 9000.5)
+        reader = BrokerReader('test.mmap')
+        self.assertEqual(9000.5, reader.get_price('bitmex', 'BTC/USD', False, 5))
+
+        offset = broker.slot_offset(0) + 32
+        broker.SEQUENCE.pack_into(publisher.memory, offset, 3)
+
+        self.assertIsNone(reader.get_price('bitmex', 'BTC/USD', False, 5))
+
+    def test_restarted_broker_should_keep_file_and_move_pairs(self):
+        Broker('test.mmap', [('bitmex', 'BTC/USD', False)]).publish_price(0, 9000.5)
+        reader = BrokerReader('test.mmap')
+        self.assertEqual(9000.5, reader.get_price('bitmex', 'BTC/USD', False, 5))
+
+        publisher = Broker('test.mmap', [('kraken', 'BTC/USD', False), ('bitmex', 'BTC/USD', False)])
+        self.assertIsNone(reader.get_price('bitmex', 'BTC/USD', False, 5))
+        publisher.publish_price(1, 9100)
+
+        self.assertEqual(9100, reader.get_price('bitmex', 'BTC/USD', False, 5))
+
+    @patch('holdntrade.logging')
+    def test_get_current_price_should_use_broker(self, mock_logging):
+        holdntrade.LOG = mock_logging
+        holdntrade.CONF = holdntrade.ExchangeConfig
+        holdntrade.CONF.exchange = 'bitmex'
+        holdntrade.CONF.pair = 'BTC/USD'
+        holdntrade.CONF.test = False
+        holdntrade.CONF.price_max_age = 5
+        holdntrade.TICKER = holdntrade.PriceTicker(5)
+        Broker('test.mmap', [('bitmex', 'BTC/USD', False)]).publish_price(0, 9000.5)
+        holdntrade.BROKER = BrokerReader('test.mmap')
+        try:
+            self.assertEqual(9000.5, holdntrade.get_current_price())
+            self.assertEqual(9000.5, holdntrade.TICKER.price)
+            self.assertLess(time.time() - holdntrade.TICKER.fetched, 5)
+        finally:
+            holdntrade.BROKER = None
+            holdntrade.TICKER = None
+
+
+if __name__ == '__main__':
+    unittest.main()
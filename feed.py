@@ -0,0 +1,197 @@
+#!/usr/bin/python
+import asyncio
+import hashlib
+import hmac
+import json
+import threading
+import time
+
+import aiohttp
+from aiohttp import web
+
+BITMEX_URL = 'wss://ws.bitmex.com/realtime'
+BITMEX_TEST_URL = 'wss://ws.testnet.bitmex.com/realtime'
+CLOSED_STATES = ['Filled', 'Canceled', 'Rejected']
+
+
+class BitmexFeed:
+    """
+    Receives order, execution and instrument updates pushed by the BitMEX websocket API in a background thread.
+    Closed order ids are collected until they are picked up, every closed order wakes up a waiting main loop.
+    """
+    def __init__(self, url: str, symbol: str, api_key: str = None, api_secret: str = None, on_price=None,
+                 log=None):
+        self.url = url
+        self.symbol = symbol
+        self.api_key = api_key
+        self.api_secret = api_secret
+        self.on_price = on_price
+        self.log = log
+        self.price = None
+        self.connected = False
+        self.closed_ids = set()
+        self.last_fill = None
+        self.fill_event = threading.Event()
+        self.lock = threading.Lock()
+        self.stopped = False
+        self.loop = None
+        self.task = None
+        self.thread = None
+
+    def start(self):
+        self.loop = asyncio.new_event_loop()
+        self.task = self.loop.create_task(self.listen())
+        self.thread = threading.Thread(target=self.run, name='feed', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped = True
+        self.loop.call_soon_threadsafe(self.task.cancel)
+        self.thread.join(10)
+
+    def run(self):
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_until_complete(self.task)
+        except asyncio.CancelledError:
+            # stopped by stop()
+            pass
+        finally:
+            self.loop.close()
+
+    async def listen(self):
+        """
+        Keeps the websocket connection up, reconnecting after about 5 seconds if it is lost
+        """
+        while not self.stopped:
+            try:
+                async with aiohttp.ClientSession() as session:
+                    async with session.ws_connect(self.url, heartbeat=30) as socket:
+                        await self.subscribe(socket)
+                        self.connected = True
+                        async for message in socket:
+                            if message.type == aiohttp.WSMsgType.TEXT:
+                                self.handle(json.loads(message.data))
+                            elif message.type in (aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
+                                break
+            except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as error:
+                if self.log is not None:
+                    self.log.error('Feed connection failed %s %s', type(error).__name__, str(error.args))
+            self.connected = False
+            if not self.stopped:
+                await asyncio.sleep(5)
+
+    async def subscribe(self, socket):
+        topics = ['instrument:' + self.symbol]
+        if self.api_key:
+            expires = int(time.time()) + 60
+            signature = hmac.new(self.api_secret.encode(), ('GET/realtime' + str(expires)).encode(),
+                                 hashlib.sha256).hexdigest()
+            await socket.send_json({'op': 'authKeyExpires', 'args': [self.api_key, expires, signature]})
+            topics += ['order:' + self.symbol, 'execution:' + self.symbol]
+        await socket.send_json({'op': 'subscribe', 'args': topics})
+
+    def handle(self, message: dict):
+        table = message.get('table')
+        if table == 'instrument':
+            for instrument in message.get('data', []):
+                if instrument.get('bidPrice'):
+                    self.price = instrument['bidPrice']
+                    if self.on_price is not None:
+                        self.on_price(self.price)
+        elif table == 'order':
+            for order in message.get('data', []):
+                if order.get('ordStatus') in CLOSED_STATES:
+                    self.closed(order['orderID'])
+        elif table == 'execution':
+            for execution in message.get('data', []):
+                if execution.get('execType') == 'Trade' and execution.get('leavesQty') == 0:
+                    self.closed(execution['orderID'])
+
+    def closed(self, order_id: str):
+        with self.lock:
+            self.closed_ids.add(order_id)
+        self.last_fill = time.time()
+        self.fill_event.set()
+
+    def pop_closed_ids(self):
+        """
+        Returns and forgets the ids of the orders closed since the last call
+        :return set of order ids
+        """
+        with self.lock:
+            closed_ids = self.closed_ids
+            self.closed_ids = set()
+        return closed_ids
+
+    def wait_for_fill(self, timeout: float):
+        """
+        Blocks until an order was closed or the timeout elapsed
+        :return True if an order was closed
+        """
+        filled = self.fill_event.wait(timeout)
+        self.fill_event.clear()
+        return filled
+
+
+class FeedStandIn:
+    """
+    Local websocket server standing in for the BitMEX realtime API. It acknowledges authentication and subscriptions
+    and then replays the scripted events, each as (delay in seconds, message).
+    """
+    def __init__(self, events: list, port: int = 0):
+        self.events = events
+        self.port = port
+        self.loop = None
+        self.runner = None
+        self.started = threading.Event()
+        self.thread = None
+
+    @property
+    def url(self):
+        return 'ws://127.0.0.1:{}/realtime'.format(self.port)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name='feed-stand-in', daemon=True)
+        self.thread.start()
+        self.started.wait(10)
+
+    def stop(self):
+        if self.loop is not None:
+            asyncio.run_coroutine_threadsafe(self.runner.cleanup(), self.loop).result(10)
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join(10)
+
+    def run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_until_complete(self.serve())
+        self.started.set()
+        self.loop.run_forever()
+
+    async def serve(self):
+        app = web.Application()
+        app.router.add_get('/realtime', self.realtime)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, '127.0.0.1', self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def realtime(self, request):
+        socket = web.WebSocketResponse()
+        await socket.prepare(request)
+        await socket.send_json({'info': 'Welcome to the stand-in'})
+        async for message in socket:
+            if message.type != aiohttp.WSMsgType.TEXT:
+                break
+            request = json.loads(message.data)
+            if request.get('op') == 'authKeyExpires':
+                await socket.send_json({'success': True, 'request': request})
+            elif request.get('op') == 'subscribe':
+                for topic in request['args']:
+                    await socket.send_json({'success': True, 'subscribe': topic, 'request': request})
+                for delay, event in self.events:
+                    await asyncio.sleep(delay)
+                    await socket.send_json(event)
+        return socket
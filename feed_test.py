@@ -0,0 +1,41 @@
+import unittest
+from unittest.mock import MagicMock
+
+import feed
+from feed import BitmexFeed, FeedStandIn
+
+
+class FeedTest(unittest.TestCase):
+
+    def test_feed_should_wake_up_on_pushed_fill_and_pass_on_price(self):
+        events = [(0, {'table': 'instrument', 'action': 'update', 'data': [{'symbol': 'XBTUSD', 'bidPrice': 9000}]}),
+                  (0.1, {'table': 'order', 'action': 'update', 'data': [{'orderID': '1s', 'ordStatus': 'Filled'}]})]
+        stand_in = FeedStandIn(events)
+        stand_in.start()
+        on_price = MagicMock()
+        stream = BitmexFeed(stand_in.url, 'XBTUSD', 'key', 'secret', on_price)
+        stream.start()
+        try:
+            self.assertTrue(stream.wait_for_fill(5))
+            self.assertEqual({'1s'}, stream.pop_closed_ids())
+            self.assertEqual(set(), stream.pop_closed_ids())
+            self.assertEqual(9000, stream.price)
+            on_price.assert_called_with(9000)
+        finally:
+            stream.stop()
+            stand_in.stop()
+
+    def test_handle_should_collect_fully_executed_orders_only(self):
+        stream = BitmexFeed(feed.BITMEX_TEST_URL, 'XBTUSD')
+        stream.handle({'table': 'execution', 'action': 'insert',
+                       'data': [{'orderID': '1b', 'execType': 'Trade', 'leavesQty': 10},
+                                {'orderID': '2b', 'execType': 'Trade', 'leavesQty': 0},
+                                {'orderID': '3b', 'execType': 'New', 'leavesQty': 0}]})
+        stream.handle({'table': 'order', 'action': 'update', 'data': [{'orderID': '4b', 'ordStatus': 'New'}]})
+
+        self.assertEqual({'2b'}, stream.pop_closed_ids())
+        self.assertTrue(stream.wait_for_fill(0))
+
+
+if __name__ == '__main__':
+    unittest.main()
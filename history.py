@@ -0,0 +1,142 @@
+#!/usr/bin/python
+import argparse
+import calendar
+import datetime
+import json
+import sqlite3
+import sys
+
+# metric and type of every column of the daily report, in the order of the table
+COLUMNS = (('price', 'REAL'), ('wallet_balance', 'REAL'), ('margin_balance', 'REAL'),
+           ('available_balance', 'REAL'), ('all_sold_balance', 'REAL'), ('net_deposits', 'REAL'),
+           ('performance', 'REAL'), ('liquidation_price', 'REAL'), ('used_margin', 'REAL'),
+           ('actual_leverage', 'REAL'), ('position', 'INTEGER'), ('buy_order_value', 'INTEGER'),
+           ('sell_order_value', 'INTEGER'), ('buy_orders', 'INTEGER'), ('sell_orders', 'INTEGER'),
+           ('highest_buy_order', 'REAL'), ('lowest_sell_order', 'REAL'), ('interest_rate', 'REAL'),
+           ('mayer_multiple', 'REAL'), ('mayer_average', 'REAL'), ('quota', 'INTEGER'), ('change', 'REAL'),
+           ('spread_factor', 'REAL'), ('leverage_default', 'REAL'), ('leverage_low', 'REAL'),
+           ('leverage_high', 'REAL'), ('leverage_escape', 'REAL'), ('mm_floor', 'REAL'), ('mm_ceil', 'REAL'),
+           ('mm_stop_buy', 'REAL'), ('resets', 'INTEGER'), ('polling_interval', 'REAL'),
+           ('generation_time', 'REAL'))
+NAMES = tuple(name for name, _ in COLUMNS)
+TIMEOUT = 30
+
+
+def to_timestamp(value):
+    """
+    :param value: unix time, datetime, date or iso formatted string (UTC)
+    :return unix time in seconds
+    """
+    if value is None or isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        value = datetime.datetime.fromisoformat(value)
+    if not isinstance(value, datetime.datetime):
+        value = datetime.datetime(value.year, value.month, value.day)
+    return calendar.timegm(value.utctimetuple())
+
+
+class History:
+    """
+    Stores the metrics of the daily reports as typed columns of an SQLite database, one row per instance and time.
+    The rows are clustered by instance and time, so the history of a date range is read without a scan.
+    """
+    __slots__ = 'filename'
+
+    def __init__(self, filename: str):
+        """
+        :param filename: path of the database, created if missing, may be shared by several instances
+        """
+        self.filename = filename
+        with self.connect() as connection:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('CREATE TABLE IF NOT EXISTS reports (instance TEXT NOT NULL, time INTEGER NOT NULL, {}, '
+                               'PRIMARY KEY (instance, time)) WITHOUT ROWID'
+                               .format(', '.join('{} {}'.format(name, kind) for name, kind in COLUMNS)))
+        connection.close()
+
+    def connect(self):
+        return sqlite3.connect(self.filename, timeout=TIMEOUT)
+
+    def insert(self, instance: str, time, metrics: dict):
+        """
+        Stores the metrics of a report, a report of the same instance and time is replaced
+        :param instance: name of the bot instance
+        :param time: time of the report
+        :param metrics: values by column name, missing ones are stored as NULL
+        """
+        with self.connect() as connection:
+            connection.execute('INSERT OR REPLACE INTO reports VALUES ({})'.format(', '.join('?' * (len(NAMES) + 2))),
+                               [instance, to_timestamp(time)] + [metrics.get(name) for name in NAMES])
+        connection.close()
+
+    def query(self, instances: [str] = None, start=None, end=None, columns: [str] = None):
+        """
+        Reads the reports of a time range
+        :param instances: names of the instances, all if None
+        :param start: first time included, unbounded if None
+        :param end: last time included, unbounded if None
+        :param columns: names of the columns, all if None
+        :return dict instance: dict column: list of values, including the column time
+        """
+        columns = list(NAMES if columns is None else columns)
+        unknown = set(columns) - set(NAMES)
+        if unknown:
+            raise ValueError('unknown columns ' + ', '.join(sorted(unknown)))
+        conditions = []
+        params = []
+        if instances is not None:
+            conditions.append('instance IN ({})'.format(', '.join('?' * len(instances))))
+            params.extend(instances)
+        if start is not None:
+            conditions.append('time >= ?')
+            params.append(to_timestamp(start))
+        if end is not None:
+            conditions.append('time <= ?')
+            params.append(to_timestamp(end))
+        sql = 'SELECT instance, time, {} FROM reports{} ORDER BY instance, time'.format(
+            ', '.join(columns), ' WHERE ' + ' AND '.join(conditions) if conditions else '')
+        result = {}
+        with self.connect() as connection:
+            for row in connection.execute(sql, params):
+                series = result.setdefault(row[0], {name: [] for name in ['time'] + columns})
+                for name, value in zip(['time'] + columns, row[1:]):
+                    series[name].append(value)
+        connection.close()
+        return result
+
+    def arrays(self, instance: str, columns: [str] = None, start=None, end=None):
+        """
+        Reads the reports of an instance as NumPy arrays (requires numpy), missing values are NaN
+        :return dict column: array, including the column time
+        """
+        import numpy as np
+
+        series = self.query([instance], start, end, columns).get(instance)
+        if series is None:
+            return {name: np.array([]) for name in ['time'] + list(NAMES if columns is None else columns)}
+        arrays = {'time': np.array(series.pop('time'), dtype=np.int64)}
+        for name, values in series.items():
+            arrays[name] = np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+        return arrays
+
+
+if __name__ == '__main__':
+    PARSER = argparse.ArgumentParser(description='Prints the report history of Hold n Trade instances as JSON')
+    PARSER.add_argument('database', help='the history database')
+    PARSER.add_argument('instances', nargs='*', help='names of the instances, all if none')
+    PARSER.add_argument('--from', dest='start', help='first date or time (UTC, iso format)')
+    PARSER.add_argument('--to', dest='end', help='last date or time (UTC, iso format)')
+    PARSER.add_argument('--columns', help='comma separated columns, all if not given')
+    ARGS = PARSER.parse_args()
+    if ARGS.end is not None and len(ARGS.end) == 10:
+        # a date includes the whole day
+        ARGS.end += 'T23:59:59'
+    try:
+        RESULT = History(ARGS.database).query(ARGS.instances or None, ARGS.start, ARGS.end,
+                                              ARGS.columns.split(',') if ARGS.columns else None)
+    except ValueError as error:
+        print(error)
+        sys.exit(1)
+    json.dump(RESULT, sys.stdout)
+    print()
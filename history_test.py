@@ -0,0 +1,50 @@
+import datetime
+import os
+import unittest
+
+import numpy as np
+
+from history import History
+
+
+class HistoryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.history = History('test.db')
+        for day in range(1, 11):
+            time = datetime.datetime(2019, 7, day, 12, 10)
+            self.history.insert('test_a', time, {'margin_balance': 1 + day / 100, 'actual_leverage': 2.0,
+                                                 'position': 1000 * day})
+            self.history.insert('test_b', time, {'margin_balance': 2 + day / 100})
+
+    def tearDown(self):
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.isfile('test.db' + suffix):
+                os.remove('test.db' + suffix)
+
+    def test_query_should_return_range_by_instance(self):
+        result = self.history.query(['test_a'], '2019-07-03', datetime.date(2019, 7, 5),
+                                    ['margin_balance', 'position'])
+
+        self.assertEqual(['test_a'], list(result))
+        self.assertEqual([1.03, 1.04], result['test_a']['margin_balance'])
+        self.assertEqual([3000, 4000], result['test_a']['position'])
+        self.assertEqual(1562155800, result['test_a']['time'][0])
+        self.assertEqual(['test_a', 'test_b'], list(self.history.query(columns=['price'])))
+        with self.assertRaises(ValueError):
+            self.history.query(columns=['margin_balance; DROP TABLE reports'])
+
+    def test_insert_should_replace_report_of_same_time_and_arrays_should_be_typed(self):
+        self.history.insert('test_b', datetime.datetime(2019, 7, 10, 12, 10), {'margin_balance': 3.0})
+
+        arrays = self.history.arrays('test_b', ['margin_balance', 'actual_leverage'])
+
+        self.assertEqual(10, len(arrays['time']))
+        self.assertEqual(np.int64, arrays['time'].dtype)
+        self.assertEqual(3.0, arrays['margin_balance'][-1])
+        self.assertTrue(np.isnan(arrays['actual_leverage']).all())
+        self.assertEqual(0, len(self.history.arrays('test_c', ['margin_balance'])['margin_balance']))
+
+
+if __name__ == '__main__':
+    unittest.main()
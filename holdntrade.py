@@ -1,6 +1,13 @@
 #!/usr/bin/python
+import array
+import asyncio
+import bisect
+import concurrent.futures
 import configparser
 import datetime
+import functools
+import hashlib
+import heapq
 import inspect
 import json
 import logging
@@ -10,17 +17,24 @@ import pickle
 import random
 import smtplib
 import socket
+import sqlite3
+import struct
 import sys
+import threading
 import time
+import types
 from email import encoders
 from email.mime.base import MIMEBase
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
+from email.utils import formatdate
 from logging.handlers import RotatingFileHandler
 
 import ccxt
 import requests
 
+import mailer
+
 # ------------------------------------------------------------------------------
 
 SELL_PRICE = 0
@@ -33,13 +47,38 @@ LOOP = False
 AUTO_CONF = False
 EMAIL_ONLY = False
 EMAIL_SENT = 0
+COMPACTED = 0
 POSITION_INFO = False
 STARTED = datetime.datetime.utcnow().replace(microsecond=0)
 STATS = None
+EXCHANGE = None
+ACCOUNT = None
+TICKER = None
+MAYER = None
+FILL_CURSOR = None
+FILL_CURSOR_NEXT = None
+FEED = None
+LAST_RECONCILE = 0
+# http session shared by the instances hosted in one process (runner.py)
+SESSION = None
+BROKER = None
+CADENCE = None
+REPORTER = None
+OUTBOX = None
 HIBERNATE = False
+# id of the lowest sell order whose price already woke the bot
+PRICE_WOKEN = None
 INITIAL_LEVERAGE_SET = False
+# exchanges filtering the closed orders since a time by their last update, not by their creation
+CLOSED_SINCE_UPDATE = ['bitmex']
 STOP_ERRORS = ['insufficient', 'too low', 'not_enough_free_balance', 'margin_below', 'liquidation price']
-RETRY_MESSAGE = 'Got an error %s %s, retrying in about 5 seconds...'
+RETRY_MESSAGE = 'Got an error %s %s, retrying in at most %.1f seconds...'
+RETRY_DEADLINE = 3600
+# (error class, first delay, maximal delay) - the first matching class applies
+RETRY_POLICY = [(ccxt.NullResponse, 1, 10), (ccxt.DDoSProtection, 10, 300), (ccxt.ExchangeNotAvailable, 10, 300),
+                (ccxt.AuthenticationError, 30, 600), (ccxt.NetworkError, 4, 120), (ccxt.ExchangeError, 4, 120)]
+NOT_RETRYABLE = (ccxt.InsufficientFunds, ccxt.InvalidOrder, ccxt.BadSymbol, ccxt.PermissionDenied,
+                 ccxt.AccountSuspended, ccxt.NotSupported, ccxt.ArgumentsRequired)
 
 # ------------------------------------------------------------------------------
 
@@ -91,44 +130,60 @@ class ExchangeConfig:
             self.sender_address = str(props['sender_address']).strip('"')
             self.sender_password = str(props['sender_password']).strip('"')
             self.mail_server = str(props['mail_server']).strip('"')
+            self.mail_port = int(props.get('mail_port', '587'))
+            self.mail_starttls = bool(str(props.get('mail_starttls', 'true')).strip('"').lower() == 'true')
+            self.mail_flush_timeout = abs(float(props.get('mail_flush_timeout', '10')))
             self.info = str(props['info']).strip('"')
+            self.price_max_age = abs(float(props.get('price_max_age', '5')))
+            self.mayer_ttl = abs(float(props.get('mayer_ttl', '900')))
+            self.fill_tracking = str(props.get('fill_tracking', 'poll')).strip('"').lower()
+            self.stream = bool(str(props.get('stream', 'false')).strip('"').lower() == 'true')
+            self.stream_reconcile = abs(float(props.get('stream_reconcile', '60')))
+            self.simulate = bool(str(props.get('simulate', 'false')).strip('"').lower() == 'true')
+            self.simulate_prices = str(props.get('simulate_prices', '')).strip('"')
+            self.broker = str(props.get('broker', '')).strip('"')
+            self.cadence_max = abs(float(props.get('cadence_max', '30')))
+            self.history = str(props.get('history', 'history.db')).strip('"')
+            self.stats_days = max(31, abs(int(props.get('stats_days', '365'))))
         except (configparser.NoSectionError, KeyError):
             raise SystemExit('invalid configuration for ' + INSTANCE)
 
 
 class OpenOrdersSummary:
     """
-    Creates and holds an open orders summary
+    Creates and holds an open orders summary, the totals are read from the running totals of its order books
     """
-    __slots__ = 'sell_orders', 'buy_orders', 'total_sell_order_value', 'total_buy_order_value'
+    __slots__ = 'sell_orders', 'buy_orders'
 
     def __init__(self, open_orders):
-        self.sell_orders = ()
-        self.buy_orders = ()
-        self.total_sell_order_value = 0
-        self.total_buy_order_value = 0
-
         sells = []
         buys = []
         for oo in open_orders:
             o = Order(oo)
             if o.side == 'sell':
-                if CONF.exchange == 'bitmex':
-                    self.total_sell_order_value += o.amount
-                else:
-                    self.total_sell_order_value += o.amount * o.price
                 sells.append(o)
             elif o.side == 'buy':
-                if CONF.exchange == 'bitmex':
-                    self.total_buy_order_value += o.amount
-                else:
-                    self.total_buy_order_value += o.amount * o.price
                 buys.append(o)
             else:
                 LOG.error(inspect.stack()[1][3], ' ?!?')
 
-        self.sell_orders = tuple(sorted(sells, key=lambda order: order.price, reverse=True))  # desc
-        self.buy_orders = tuple(sorted(buys, key=lambda order: order.price, reverse=True))  # desc
+        self.sell_orders = OrderBook(sorted(sells, key=lambda order: order.price, reverse=True))  # desc
+        self.buy_orders = OrderBook(sorted(buys, key=lambda order: order.price, reverse=True))  # desc
+
+    @staticmethod
+    def get_value(book):
+        """
+        :return the value of the orders of the book in fiat
+        """
+        return book.amount if CONF.exchange == 'bitmex' else book.weighted
+
+    @property
+    def total_sell_order_value(self):
+        return self.get_value(self.sell_orders)
+
+    @property
+    def total_buy_order_value(self):
+        return self.get_value(self.buy_orders)
 
     def get_orders(self):
         return tuple(self.sell_orders + self.buy_orders)
@@ -152,33 +207,936 @@ class Order:
                                                                             self.amount, self.datetime)
 
 
+class OrderBook:
+    """
+    Holds orders by id in the order they were added, indexed by price for the lowest and highest one.
+    Keeps running totals of the amount (fiat), the value (crypto) and the price weighted amount.
+    Iteration runs over a snapshot, so the book may be changed meanwhile.
+    """
+    __slots__ = 'orders', 'lows', 'highs', 'sequence', 'amount', 'value', 'weighted'
+
+    def __init__(self, orders=()):
+        self.orders = {}
+        self.lows = []
+        self.highs = []
+        self.sequence = 0
+        self.amount = 0
+        self.value = 0.0
+        self.weighted = 0.0
+        for order in orders:
+            self.append(order)
+
+    def append(self, order: Order):
+        if order.id in self.orders:
+            self.remove(self.orders[order.id])
+        self.orders[order.id] = order
+        self.sequence += 1
+        heapq.heappush(self.lows, (order.price, self.sequence, order))
+        heapq.heappush(self.highs, (-order.price, self.sequence, order))
+        self.amount += order.amount
+        self.value += order.amount / order.price
+        self.weighted += order.amount * order.price
+
+    def remove(self, order: Order):
+        if self.orders.get(order.id) is not order:
+            raise ValueError('{} not in order book'.format(order.id))
+        del self.orders[order.id]
+        if not self.orders:
+            self.lows, self.highs = [], []
+            self.amount, self.value, self.weighted = 0, 0.0, 0.0
+            return
+        self.amount -= order.amount
+        self.value -= order.amount / order.price
+        self.weighted -= order.amount * order.price
+        if len(self.lows) > 2 * len(self.orders) + 16:
+            self.lows = [entry for entry in self.lows if self.is_valid(entry)]
+            self.highs = [entry for entry in self.highs if self.is_valid(entry)]
+            heapq.heapify(self.lows)
+            heapq.heapify(self.highs)
+
+    def is_valid(self, entry: tuple):
+        return self.orders.get(entry[2].id) is entry[2]
+
+    def peek(self, heap: list):
+        while heap and not self.is_valid(heap[0]):
+            heapq.heappop(heap)
+        return heap[0][2] if heap else None
+
+    def lowest(self):
+        """
+        :return the order with the lowest price or None
+        """
+        return self.peek(self.lows)
+
+    def highest(self):
+        """
+        :return the order with the highest price or None
+        """
+        return self.peek(self.highs)
+
+    def get_stats(self):
+        """
+        :return dict with the average price, the amount (fiat) and the value (crypto) of the orders
+        """
+        if self.amount > 0:
+            return {'avg': self.weighted / self.amount, 'qty': self.amount, 'val': self.value}
+        return {'avg': 0, 'qty': 0}
+
+    def __contains__(self, order: Order):
+        return order is not None and self.orders.get(order.id) is order
+
+    def __len__(self):
+        return len(self.orders)
+
+    def __iter__(self):
+        return iter(list(self.orders.values()))
+
+    def __getitem__(self, index: int):
+        if index == 0 and self.orders:
+            return next(iter(self.orders.values()))
+        if index == -1 and self.orders:
+            return next(reversed(self.orders.values()))
+        return list(self.orders.values())[index]
+
+    def __delitem__(self, index: int):
+        self.remove(self[index])
+
+    def __add__(self, other):
+        return list(self) + list(other)
+
+    def __radd__(self, other):
+        return list(other) + list(self)
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __repr__(self):
+        return 'OrderBook({})'.format(', '.join(str(order) for order in self))
+
+
 class Stats:
     """
-    Holds the daily statistics in a ring memory (today plus the previous two)
-    """
-    def __init__(self, day_of_year: int, data: dict):
-        self.days = []
-        self.add_day(day_of_year, data)
-
-    def add_day(self, day_of_year: int, data: dict):
-        if self.get_day(day_of_year) is None:
-            data['day'] = day_of_year
-            if len(self.days) > 2:
-                self.days = sorted(self.days, key=lambda item: item['day'], reverse=True)  # desc
-                self.days.pop()
-            self.days.append(data)
-
-    def get_day(self, day_of_year: int):
-        matched = filter(lambda element: element['day'] == day_of_year, self.days)
-        if matched is not None:
-            for day in matched:
-                return day
+    Holds the daily statistics (margin balance and price) of the last capacity days in a ring buffer of array columns.
+    A day is keyed by its ordinal (datetime.date.toordinal()) and kept in the slot ordinal modulo capacity.
+    """
+    __slots__ = 'capacity', 'days', 'margin_balances', 'prices'
+
+    # ordinal, margin balance, price
+    RECORD = struct.Struct('<idd')
+
+    def __init__(self, capacity: int = 365):
+        self.capacity = capacity
+        self.days = array.array('l', [0]) * capacity
+        self.margin_balances = array.array('d', [0.0]) * capacity
+        self.prices = array.array('d', [math.nan]) * capacity
+
+    def __len__(self):
+        return sum(1 for day in self.days if day)
+
+    def add_day(self, day: int, data: dict):
+        """
+        Stores the statistics of a day unless there are some already, replacing the day capacity days before
+        :param day: ordinal of the day
+        :param data: mBal and optionally price
+        :return True if stored
+        """
+        slot = day % self.capacity
+        if self.days[slot] == day:
+            return False
+        self.days[slot] = day
+        self.margin_balances[slot] = data['mBal']
+        self.prices[slot] = data.get('price', math.nan)
+        return True
+
+    def get_day(self, day: int):
+        """
+        :return dict with day, mBal and price (if known) or None if the day is not held
+        """
+        slot = day % self.capacity
+        if self.days[slot] != day:
+            return None
+        data = {'day': day, 'mBal': self.margin_balances[slot]}
+        if not math.isnan(self.prices[slot]):
+            data['price'] = self.prices[slot]
+        return data
+
+    def to_bytes(self, day: int):
+        slot = day % self.capacity
+        return self.RECORD.pack(day, self.margin_balances[slot], self.prices[slot])
+
+    def append(self, filename: str, day: int):
+        """
+        Appends the record of a day to the file, which is compacted once it holds twice the capacity
+        """
+        with open(filename, 'ab') as file:
+            size = file.seek(0, os.SEEK_END)
+            file.write(self.to_bytes(day))
+        if size >= 2 * self.capacity * self.RECORD.size:
+            self.write(filename)
+
+    def write(self, filename: str):
+        records = b''.join(self.to_bytes(day) for day in sorted(day for day in self.days if day))
+        with open(filename + '.tmp', 'wb') as file:
+            file.write(records)
+        os.replace(filename + '.tmp', filename)
+
+    @classmethod
+    def read(cls, filename: str, capacity: int):
+        """
+        Reads the last capacity records of a file
+        """
+        stats = cls(capacity)
+        with open(filename, 'rb') as file:
+            size = file.seek(0, os.SEEK_END)
+            file.seek(max(0, size - size % cls.RECORD.size - capacity * cls.RECORD.size))
+            data = file.read()
+        for day, margin_balance, price in cls.RECORD.iter_unpack(data[:len(data) - len(data) % cls.RECORD.size]):
+            stats.add_day(day, {'mBal': margin_balance, 'price': price})
+        return stats
+
+    @classmethod
+    def convert(cls, legacy, capacity: int):
+        """
+        Takes over the days of a Stats pickled by former versions, keyed by year and day of the year (%Y%j)
+        """
+        stats = cls(capacity)
+        for data in legacy.days:
+            day = datetime.datetime.strptime(str(data['day']), '%Y%j').toordinal()
+            stats.add_day(day, data)
+        return stats
+
+
+class LegacyUnpickler(pickle.Unpickler):
+    """
+    Unpickles the Stats of former versions, which were lists of dicts, to a plain namespace
+    """
+    def find_class(self, module: str, name: str):
+        if name == 'Stats':
+            return types.SimpleNamespace
+        return super().find_class(module, name)
+
+
+class CsvStore:
+    """
+    Append only file of the daily report records, one line each. A sidecar index (<file>.idx) holds the date and the
+    offset of every record. At the turn of the year the file and its index are moved to <name>.<year>.csv and a new
+    file is started with the last record of the old one, so reading and writing never depends on the history.
+    """
+    __slots__ = 'filename', 'index', 'fsync'
+
+    BLOCK = 4096
+
+    def __init__(self, filename: str, fsync: bool = True):
+        """
+        :param filename: path of the csv file
+        :param fsync: whether every append is forced to disk
+        """
+        self.filename = filename
+        self.index = filename + '.idx'
+        self.fsync = fsync
+
+    @staticmethod
+    def get_date(record: str):
+        """
+        :return the date (yyyy-mm-dd) a record was generated or None if it has none
+        """
+        fields = record.split(';')
+        return fields[1][:10] if len(fields) > 1 else None
+
+    def get_archive(self, year: str):
+        root, extension = os.path.splitext(self.filename)
+        return '{}.{}{}'.format(root, year, extension)
+
+    def get_last_date(self):
+        """
+        :return the date of the last record or None if there is none
+        """
+        self.ensure_index()
+        entry = read_last_line(self.index)
+        return entry.split(';')[0] if entry else None
+
+    def find(self, date: str):
+        """
+        :return the record of the given date or None if there is none in the current file
+        """
+        self.ensure_index()
+        if not os.path.isfile(self.index):
+            return None
+        with open(self.index, 'r') as index:
+            offsets = [int(offset) for day, offset in (entry.split(';') for entry in index) if day == date]
+        if not offsets:
+            return None
+        with open(self.filename, 'rb') as file:
+            file.seek(offsets[-1])
+            return file.readline().decode()
+
+    def append(self, records: str):
+        """
+        Appends records, moving the file to its yearly archive first if the year changed
+        """
+        last_date = self.get_last_date()
+        date = self.get_date(records)
+        if last_date is not None and date is not None and last_date[:4] != date[:4]:
+            self.roll_over(last_date[:4])
+        self.write(records)
+
+    def write(self, records: str):
+        entries = []
+        with open(self.filename, 'ab') as file:
+            offset = file.seek(0, os.SEEK_END)
+            for record in records.splitlines(keepends=True):
+                entries.append('{};{}\n'.format(self.get_date(record), offset))
+                offset += len(record.encode())
+            file.write(records.encode())
+            self.sync(file)
+        with open(self.index, 'a') as index:
+            index.write(''.join(entries))
+            self.sync(index)
+
+    def sync(self, file):
+        file.flush()
+        if self.fsync:
+            os.fsync(file.fileno())
+
+    def roll_over(self, year: str):
+        last_line = read_last_line(self.filename)
+        archive = self.get_archive(year)
+        os.replace(self.filename, archive)
+        os.replace(self.index, archive + '.idx')
+        if last_line is not None:
+            self.write(last_line)
+
+    def ensure_index(self):
+        """
+        Builds the index of a file written without one
+        """
+        if os.path.isfile(self.filename) and not os.path.isfile(self.index):
+            offset = 0
+            entries = []
+            with open(self.filename, 'rb') as file:
+                for record in file:
+                    entries.append('{};{}\n'.format(self.get_date(record.decode()), offset))
+                    offset += len(record)
+            with open(self.index, 'w') as index:
+                index.write(''.join(entries))
+
+
+class AccountSnapshot:
+    """
+    Holds the account related responses (balance, position, trade balance) of the exchange until invalidated.
+    It is shared by the trading thread and the threads gathering the report: a response fetched while the snapshot
+    was invalidated is returned to its caller but not kept.
+    """
+    __slots__ = 'responses', 'generation', 'lock'
+
+    def __init__(self):
+        self.responses = {}
+        self.generation = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(method: str, params: dict = None):
+        return method if params is None else method + json.dumps(params, sort_keys=True)
+
+    def get(self, method: str, params: dict = None):
+        key = self.key(method, params)
+        with self.lock:
+            if key in self.responses:
+                return self.responses[key]
+            generation = self.generation
+        call = getattr(EXCHANGE, method)
+        response = call() if params is None else call(params)
+        with self.lock:
+            if generation == self.generation:
+                self.responses[key] = response
+        return response
+
+    def put(self, method: str, response, params: dict = None):
+        with self.lock:
+            self.responses[self.key(method, params)] = response
+
+    def invalidate(self):
+        with self.lock:
+            self.responses = {}
+            self.generation += 1
+
+
+class PriceTicker:
+    """
+    Holds the most recent price of the pair and the time it was fetched
+    """
+    __slots__ = 'price', 'fetched', 'max_age'
+
+    def __init__(self, max_age: float):
+        self.price = None
+        self.fetched = 0
+        self.max_age = max_age
+
+    def update(self, price: float):
+        self.price = price
+        self.fetched = time.time()
+
+    def age(self):
+        return time.time() - self.fetched
+
+    def get(self):
+        if self.price is not None and self.age() <= self.max_age:
+            return self.price
+        return None
+
+
+class MayerService:
+    """
+    Serves the Mayer multiple from a cache. An expired value is still served while it is refreshed in the background,
+    the last known value is persisted so it is available right after a restart.
+    """
+    __slots__ = 'session', 'ttl', 'cache_file', 'value', 'fetched', 'refreshing'
+
+    URL = 'https://mayermultiple.info/current.json'
+    TIMEOUT = (3.05, 10)
+
+    def __init__(self, ttl: float, cache_file: str, session: requests.Session = None):
+        self.session = session if session is not None else requests.Session()
+        self.ttl = ttl
+        self.cache_file = cache_file
+        self.value = None
+        self.fetched = 0
+        self.refreshing = None
+        self.load()
+
+    def get(self):
+        """
+        :return dict with the current and the average Mayer multiple or None if it was never fetched successfully
+        """
+        if self.value is None:
+            self.refresh()
+        elif time.time() - self.fetched > self.ttl and not self.is_refreshing():
+            self.refreshing = threading.Thread(target=self.refresh, name='mayer', daemon=True)
+            self.refreshing.start()
+        return self.value
+
+    def refresh(self):
+        try:
+            response = self.session.get(self.URL, timeout=self.TIMEOUT)
+            mayer = response.json()['data']
+            self.value = {'current': float(mayer['current_mayer_multiple']),
+                          'average': float(mayer['average_mayer_multiple'])}
+            self.fetched = time.time()
+            self.persist()
+        except (requests.exceptions.RequestException, ValueError, KeyError, TypeError) as error:
+            LOG.warning('Failed to fetch Mayer multiple %s %s', type(error).__name__, str(error.args))
+
+    def is_refreshing(self):
+        return self.refreshing is not None and self.refreshing.is_alive()
+
+    def load(self):
+        """
+        Reads the persisted value, a missing or unreadable cache file leaves it to be fetched
+        """
+        if os.path.isfile(self.cache_file):
+            try:
+                with open(self.cache_file, "rt") as file:
+                    cached = json.load(file)
+                self.value = {'current': float(cached['current']), 'average': float(cached['average'])}
+                self.fetched = float(cached['fetched'])
+            except (ValueError, KeyError, TypeError, OSError) as error:
+                LOG.warning('Ignoring Mayer multiple cache %s %s %s', self.cache_file, type(error).__name__,
+                            str(error.args))
+                self.value = None
+                self.fetched = 0
+
+    def persist(self):
+        with open(self.cache_file, "wt") as file:
+            json.dump({'current': self.value['current'], 'average': self.value['average'], 'fetched': self.fetched},
+                      file)
+
+
+class WakeConditions:
+    """
+    The conditions ending the hibernation, checked every few seconds from cached data: the Mayer multiple falling back
+    below mm_stop_buy, a new target leverage, the price reaching the lowest sell order, the wake command (an
+    <instance>.wake file) and, as a safety net, a deadline. If the leverage is above target it is adjusted again
+    after a minute.
+    """
+    __slots__ = 'mayer_below', 'target_leverage', 'price_above', 'leverage_due', 'deadline', 'price_checked'
+
+    INTERVAL = 5
+    PRICE_INTERVAL = 60
+    LEVERAGE_INTERVAL = 60
+    DEADLINE = 3600
+
+    def __init__(self, mayer: dict, price_above: float = None):
+        now = time.time()
+        self.mayer_below = None
+        self.leverage_due = None
+        if mayer is not None and mayer['current'] > CONF.mm_stop_buy:
+            self.mayer_below = CONF.mm_stop_buy
+        elif mayer is not None and round(get_leverage(), 1) > get_leverage_limit(mayer):
+            self.leverage_due = now + self.LEVERAGE_INTERVAL
+        self.target_leverage = get_target_leverage(mayer)
+        self.price_above = price_above
+        self.deadline = now + self.DEADLINE
+        self.price_checked = now
+
+    def get_price(self):
+        """
+        :return the cached price, fetched at most every PRICE_INTERVAL seconds if there is none
+        """
+        price = get_cached_price()
+        if price is None and time.time() - self.price_checked > self.PRICE_INTERVAL:
+            self.price_checked = time.time()
+            price = get_current_price()
+        return price
+
+    def check(self):
+        """
+        :return the reason to wake up or None
+        """
+        wake_file = INSTANCE + '.wake'
+        if os.path.isfile(wake_file):
+            os.remove(wake_file)
+            return 'command'
+        now = time.time()
+        if now >= self.deadline:
+            return 'deadline'
+        if self.leverage_due is not None and now >= self.leverage_due:
+            return 'leverage above target'
+        mayer = fetch_mayer()
+        if self.mayer_below is not None and mayer is not None and mayer['current'] <= self.mayer_below:
+            return 'Mayer multiple {:.2f}'.format(mayer['current'])
+        if get_target_leverage(mayer) != self.target_leverage:
+            return 'target leverage {:.1f}'.format(get_target_leverage(mayer))
+        if self.price_above is not None:
+            price = self.get_price()
+            if price is not None and price >= self.price_above:
+                return 'price {}'.format(price)
         return None
 
+    def wait(self):
+        """
+        Blocks until one of the conditions fires
+        :return the reason to wake up
+        """
+        reason = self.check()
+        while reason is None:
+            if FEED is not None and FEED.connected:
+                FEED.wait_for_fill(self.INTERVAL)
+            else:
+                time.sleep(self.INTERVAL)
+            reason = self.check()
+        return reason
+
+
+class Cadence:
+    """
+    Paces the passes of the main loop by the distance of the price to the nearest trigger price: the highest buy
+    order, the lowest sell order and the prices at which spread() acts. Near a trigger the passes follow each other
+    without delay, from far on they are max_delay seconds apart and in between the delay grows linearly.
+    """
+    __slots__ = 'max_delay', 'near', 'far', 'triggers', 'passes', 'waited', 'idle'
+
+    STEP = 5
+    FEED_DELAY = 5
+
+    def __init__(self, max_delay: float, change: float):
+        """
+        :param max_delay: seconds between two passes far from any trigger
+        :param change: the configured change, a quarter of it counts as near and twice as far
+        """
+        self.max_delay = max_delay
+        self.near = change / 4
+        self.far = change * 2
+        self.triggers = []
+        self.passes = 0
+        self.waited = 0.0
+        self.idle = 0
+
+    def update(self, sell_orders: OrderBook, buy_orders: OrderBook):
+        triggers = []
+        lowest_sell = sell_orders.lowest() if sell_orders else None
+        highest_buy = buy_orders.highest() if buy_orders else None
+        if lowest_sell is not None:
+            triggers.append(lowest_sell.price)
+        if highest_buy is not None:
+            triggers.append(highest_buy.price)
+        if lowest_sell is not None and highest_buy is not None:
+            tolerance = CONF.change * CONF.spread_factor
+            if tolerance < 1:
+                triggers.append(highest_buy.price / (1 - tolerance))
+            triggers.append(lowest_sell.price / (1 + tolerance))
+        self.triggers = sorted(triggers)
+
+    def get_distance(self, price: float):
+        """
+        :return the relative distance of the price to the nearest trigger price
+        """
+        if not self.triggers or not price:
+            return math.inf
+        index = bisect.bisect_left(self.triggers, price)
+        neighbours = self.triggers[max(index - 1, 0):index + 1]
+        return min(abs(price - trigger) for trigger in neighbours) / price
+
+    def get_delay(self, price: float):
+        distance = self.get_distance(price)
+        if distance <= self.near:
+            return 0.0
+        if distance >= self.far:
+            return self.max_delay
+        return self.max_delay * (distance - self.near) / (self.far - self.near)
+
+    def plan(self):
+        """
+        Updates the trigger prices from the order books and accounts the delay until the next pass
+        :return seconds
+        """
+        self.update(SELL_ORDERS, BUY_ORDERS)
+        seconds = self.get_delay(get_current_price())
+        if FEED is not None and FEED.connected:
+            seconds = max(seconds, self.FEED_DELAY)
+        self.passes += 1
+        if seconds >= self.max_delay:
+            self.idle += 1
+        return seconds
+
+    def wait(self):
+        """
+        Sleeps until the next pass is due. The sleep ends early on a fill pushed by the feed or when a cached price
+        comes close enough to a trigger.
+        """
+        seconds = self.plan()
+        waited = 0.0
+        while waited < seconds:
+            step = min(self.STEP, seconds - waited)
+            if FEED is not None and FEED.connected:
+                filled = FEED.wait_for_fill(step)
+            else:
+                time.sleep(step)
+                filled = False
+            waited += step
+            if filled:
+                break
+            price = get_cached_price()
+            if price is not None and self.get_delay(price) <= waited:
+                break
+        self.waited += waited
+
+    async def pause(self, loop: asyncio.AbstractEventLoop):
+        """
+        Sleeps without blocking the event loop until the next pass is due
+        :param loop: the event loop of the asyncio entry point
+        """
+        seconds = await loop.run_in_executor(None, self.plan)
+        await asyncio.sleep(seconds)
+        self.waited += seconds
+
+    def get_stats(self):
+        """
+        :return dict with the passes, the share of them paced with the maximum delay and the average delay
+        """
+        return {'passes': self.passes, 'idle': self.idle,
+                'average': round(self.waited / self.passes, 1) if self.passes else 0.0}
+
+    def reset(self):
+        self.passes = 0
+        self.waited = 0.0
+        self.idle = 0
+
+
+class ReportWorker:
+    """
+    Creates and sends the daily report in a thread of its own, so the trading loop is never blocked by it. The
+    trading loop publishes a snapshot of the bot state after every pass, the report is rendered from the latest one.
+    """
+    __slots__ = 'interval', 'state', 'lock', 'stopped', 'thread'
+
+    INTERVAL = 60
+
+    def __init__(self, interval: float = INTERVAL):
+        """
+        :param interval: seconds between two checks whether the report is due
+        """
+        self.interval = interval
+        self.state = {}
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def publish(self, state: dict):
+        with self.lock:
+            self.state = state
+
+    def get_state(self):
+        """
+        :return a copy of the latest snapshot of the bot state, empty if none was published yet
+        """
+        with self.lock:
+            return dict(self.state)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name='report', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                daily_report()
+            except Exception:
+                # the report is tried again at the next check
+                LOG.exception('Failed to create the daily report')
+
+
+class Backoff:
+    """
+    Paces the attempts of an operation: the delay doubles with every attempt (with jitter) up to the maximum of the
+    policy of the error. A wait demanded by the exchange is never cut short, after the deadline the operation is given
+    up.
+    """
+    __slots__ = 'operation', 'deadline', 'started', 'waited', 'attempts'
+
+    def __init__(self, operation: str, deadline: float = RETRY_DEADLINE):
+        self.operation = operation
+        self.deadline = deadline
+        self.started = time.time()
+        self.waited = 0
+        self.attempts = 0
+
+    @staticmethod
+    def policy(error: Exception):
+        for error_class, first, maximal in RETRY_POLICY:
+            if isinstance(error, error_class):
+                return first, maximal
+        return 4, 60
+
+    def delay(self, error: Exception):
+        """
+        :return the shortest and the longest delay before the next attempt, the jitter applies to the exponential
+        delay only and never goes below the wait demanded by the exchange
+        """
+        first, maximal = self.policy(error)
+        exponential = min(maximal, first * 2 ** self.attempts)
+        demanded = retry_after()
+        return max(exponential / 2, demanded), max(exponential, demanded)
+
+    def wait(self, error: Exception):
+        """
+        Sleeps until the next attempt is due
+        :param error: the error of the failed attempt
+        :return False if the operation should be given up
+        """
+        if isinstance(error, NOT_RETRYABLE):
+            LOG.error('Got an error %s %s, giving up %s', type(error).__name__, str(error.args), self.operation)
+            return False
+        shortest, seconds = self.delay(error)
+        self.attempts += 1
+        if self.deadline is not None and max(time.time() - self.started, self.waited) + seconds > self.deadline:
+            LOG.warning('Giving up %s after %d attempts', self.operation, self.attempts)
+            return False
+        LOG.error(RETRY_MESSAGE, type(error).__name__, str(error.args), seconds)
+        self.waited += seconds
+        sleep_for(shortest, seconds)
+        return True
+
+
+class RequestScheduler:
+    """
+    Token bucket in front of the exchange client. Every request takes a token of the budget, the lower priorities leave
+    a reserve of it to the higher ones: order placement and cancellation first, fill detection and the other trading
+    reads next, reporting last. The bucket allows a small burst only, unless the rate limit headers returned by the
+    exchange announce a larger one.
+    """
+    __slots__ = 'exchange', 'capacity', 'rate', 'tokens', 'updated', 'local', 'usage', 'lock'
+
+    # share of the capacity a priority has to leave untouched
+    RESERVES = {'order': 0, 'fill': 0.25, 'report': 0.5}
+    # requests sent at once until the exchange announces its limit, ccxt used to space out every request
+    BURST = 3
+    REQUEST_METHODS = ('fetch_', 'create_', 'cancel_', 'edit_', 'public_', 'private_')
+    ORDER_METHODS = ('create_', 'cancel_', 'edit_', 'private_post_order', 'private_delete_order',
+                     'private_post_position_leverage', 'private_put_trades_close_all')
+
+    def __init__(self, exchange):
+        self.exchange = exchange
+        # ccxt throttles every request alike, the scheduler takes over
+        exchange.enableRateLimit = False
+        self.rate = 1000 / exchange.rateLimit
+        self.capacity = float(self.BURST)
+        self.tokens = self.capacity
+        self.updated = time.time()
+        # the priority is set per thread, the report is gathered by threads of its own
+        self.local = threading.local()
+        self.usage = {priority: {'requests': 0, 'waited': 0.0} for priority in self.RESERVES}
+        self.lock = threading.Lock()
+
+    def __getattr__(self, name: str):
+        attribute = getattr(self.exchange, name)
+        if not callable(attribute) or not name.startswith(self.REQUEST_METHODS):
+            return attribute
+
+        @functools.wraps(attribute)
+        def call(*args, **kwargs):
+            self.acquire(self.classify(name))
+            try:
+                return attribute(*args, **kwargs)
+            except ccxt.DDoSProtection:
+                self.tokens = 0
+                raise
+            finally:
+                self.adjust()
+        return call
+
+    @property
+    def priority(self):
+        return getattr(self.local, 'priority', None)
+
+    @priority.setter
+    def priority(self, priority: str):
+        self.local.priority = priority
+
+    def classify(self, method: str):
+        if method.startswith(self.ORDER_METHODS):
+            return 'order'
+        return self.priority if self.priority is not None else 'fill'
+
+    def refill(self):
+        now = time.time()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, priority: str):
+        """
+        Blocks until the budget left exceeds the reserve of the priority and takes a token
+        :param priority: order, fill or report
+        """
+        reserve = self.RESERVES[priority] * self.capacity
+        while True:
+            with self.lock:
+                self.refill()
+                if self.tokens >= reserve + 1:
+                    self.tokens -= 1
+                    self.usage[priority]['requests'] += 1
+                    return
+                seconds = (reserve + 1 - self.tokens) / self.rate
+            self.usage[priority]['waited'] += seconds
+            time.sleep(seconds)
+
+    async def request(self, exchange, name: str, *args, **kwargs):
+        """
+        Sends a request of an async client (ccxt.async_support) within the same budget
+        :param exchange: async exchange of the same account
+        :param name: name of the request method
+        :return the response
+        """
+        await asyncio.get_event_loop().run_in_executor(None, self.acquire, self.classify(name))
+        try:
+            return await getattr(exchange, name)(*args, **kwargs)
+        except ccxt.DDoSProtection:
+            self.tokens = 0
+            raise
+        finally:
+            self.adjust(exchange)
+
+    def adjust(self, exchange=None):
+        """
+        Adopts the limit (per minute) and the remaining requests announced by the exchange
+        :param exchange: client of the last request, the wrapped one if None
+        """
+        headers = getattr(exchange if exchange is not None else self.exchange, 'last_response_headers', None)
+        if not isinstance(headers, dict):
+            return
+        headers = {key.lower(): value for key, value in headers.items()}
+        try:
+            with self.lock:
+                if 'x-ratelimit-limit' in headers:
+                    self.capacity = float(headers['x-ratelimit-limit'])
+                    self.rate = self.capacity / 60
+                if 'x-ratelimit-remaining' in headers:
+                    self.tokens = min(self.tokens, float(headers['x-ratelimit-remaining']))
+        except ValueError:
+            pass
+
+    def get_usage(self):
+        """
+        :return dict with the requests made and the seconds waited per priority plus the budget left
+        """
+        usage = {priority: dict(counters) for priority, counters in self.usage.items()}
+        usage['tokens'] = round(self.tokens, 1)
+        usage['capacity'] = self.capacity
+        return usage
+
+
+def with_priority(priority: str):
+    """
+    Decorates a function whose exchange requests are to be scheduled with the given priority
+    :param priority: order, fill or report
+    """
+    def decorate(function):
+        @functools.wraps(function)
+        def call(*args, **kwargs):
+            if not isinstance(EXCHANGE, RequestScheduler):
+                return function(*args, **kwargs)
+            previous = EXCHANGE.priority
+            EXCHANGE.priority = priority
+            try:
+                return function(*args, **kwargs)
+            finally:
+                EXCHANGE.priority = previous
+        return call
+    return decorate
+
+
+def retrying(deadline: float = RETRY_DEADLINE, errors: tuple = (ccxt.ExchangeError, ccxt.NetworkError),
+             give_up_silently: bool = False):
+    """
+    Decorates a function to be called again after a backoff whenever it raises one of the given errors.
+    Errors the function handles itself are not seen by the decorator, so it may re-raise the ones to be retried.
+    :param deadline: seconds after which the function is given up
+    :param errors: error classes leading to a retry
+    :param give_up_silently: return None instead of raising the last error once the function is given up
+    :return the result of the function
+    """
+    def decorate(function):
+        @functools.wraps(function)
+        def call(*args, **kwargs):
+            backoff = Backoff(function.__name__, deadline)
+            while True:
+                try:
+                    return function(*args, **kwargs)
+                except errors as error:
+                    if not backoff.wait(error):
+                        if give_up_silently:
+                            return None
+                        raise
+        return call
+    return decorate
+
+
+def retry_after():
+    """
+    Reads the seconds to wait as demanded by the exchange from the headers of its last response
+    :return seconds: float
+    """
+    headers = getattr(EXCHANGE, 'last_response_headers', None)
+    if not isinstance(headers, dict):
+        return 0.0
+    headers = {key.lower(): value for key, value in headers.items()}
+    try:
+        if 'retry-after' in headers:
+            return float(headers['retry-after'])
+        if headers.get('x-ratelimit-remaining') == '0' and 'x-ratelimit-reset' in headers:
+            return max(0.0, float(headers['x-ratelimit-reset']) - time.time())
+    except ValueError:
+        pass
+    return 0.0
+
 
 def function_logger(console_level: int, log_filename: str, file_level: int = None):
-    function_name = inspect.stack()[1][3]
-    logger = logging.getLogger(function_name)
+    # one logger per log file, several instances may be hosted in one process
+    logger = logging.getLogger(log_filename)
+    if logger.handlers:
+        return logger
     # By default log all messages
     logger.setLevel(logging.DEBUG)
 
@@ -200,9 +1158,11 @@ def function_logger(console_level: int, log_filename: str, file_level: int = Non
     return logger
 
 
-def buy_executed():
+def buy_executed(open_ids: set = None):
     """
     Check if the most recent buy order has been executed.
+    :param open_ids: ids of the currently open orders (optional), if given the order status is only fetched if the
+    most recent buy order is not among them
     output: if the most recent buy order is still open,
     the output is print statements containing the amount were trying to buy for which price.
     Else if the order is closed, we follow with the followup function and createbuyorder and
@@ -216,18 +1176,22 @@ def buy_executed():
     LOG.debug('----------------------------------')
     LOG.debug(time.ctime())
 
+    if open_ids is not None:
+        other_buys_executed(open_ids)
+
     if CURR_BUY_ORDER is None:
         if not CONF.stop_on_top:
             LOG.warning('Current buy order is None')
         return
 
-    status = fetch_order_status(CURR_BUY_ORDER.id)
+    status = get_order_status(CURR_BUY_ORDER, open_ids)
     if status == 'open':
         price = get_current_price()
         LOG.debug('Open Buy Order! Amount: %s @ %.1f', str(CURR_BUY_ORDER.amount), float(BUY_PRICE))
         LOG.debug('Current Price: %s', price)
     elif status in ['closed', 'canceled']:
         LOG.info('Buy executed %s, starting follow up', str(CURR_BUY_ORDER))
+        invalidate_account()
         # use amount of last (previous) buy order for next sell order
         last_buy_amount = CURR_BUY_ORDER.amount
         if CURR_BUY_ORDER in BUY_ORDERS:
@@ -240,17 +1204,43 @@ def buy_executed():
         if not HIBERNATE:
             price = get_current_price()
             if keep_buying(price):
-                create_buy_order(price, calculate_buy_order_amount(), False)
+                create_buy_and_sell_order(price, calculate_buy_order_amount(), last_buy_amount)
             else:
                 SELL_PRICE = round(price * (1 + CONF.change))
-            create_sell_order(last_buy_amount)
+                create_sell_order(last_buy_amount)
     else:
         LOG.warning('Should not be here, order status is %s', status)
 
 
-def sell_executed():
+def other_buys_executed(open_ids: set):
+    """
+    Checks if any of the buy orders other than the current one has been executed. Each executed buy order is removed
+    from the BUY_ORDERS and followed by a sell order over the same amount.
+    :param open_ids: ids of the currently open orders
+    """
+    global BUY_ORDERS
+    global SELL_PRICE
+
+    for order in BUY_ORDERS:
+        if order is CURR_BUY_ORDER or order.id in open_ids:
+            continue
+        status = fetch_order_status(order.id)
+        if status == 'closed':
+            LOG.info('Buy executed %s, creating follow up sell order', str(order))
+            BUY_ORDERS.remove(order)
+            invalidate_account()
+            SELL_PRICE = round(order.price * (1 + CONF.change) / (1 - CONF.change))
+            create_sell_order(order.amount)
+        elif status == 'canceled':
+            LOG.warning('Buy order %s was canceled', str(order))
+            BUY_ORDERS.remove(order)
+
+
+def sell_executed(open_ids: set = None):
     """
     Check if any of the open sell orders has been executed.
+    :param open_ids: ids of the currently open orders (optional), if given only the status of the sell orders missing
+    among them is fetched
     output: loop through all open sell orders and check if one has been executed. If no, exit with print statement.
     Else if it has been executed, remove the order from the list of open orders,
     cancel it on Bitmex and create a new buy order.
@@ -259,14 +1249,16 @@ def sell_executed():
     global HIBERNATE
 
     for order in SELL_ORDERS:
-        time.sleep(0.5)
-        status = fetch_order_status(order.id)
+        if open_ids is None:
+            time.sleep(0.5)
+        status = get_order_status(order, open_ids)
         if status == 'open':
             LOG.debug('Sell still open')
         elif status in ['closed', 'canceled']:
             if order in SELL_ORDERS:
                 SELL_ORDERS.remove(order)
             LOG.info('Sell executed %s', str(order))
+            invalidate_account()
             if CONF.stop_on_top and CONF.close_on_stop and not SELL_ORDERS:
                 return
             mamu = fetch_mayer()
@@ -292,7 +1284,7 @@ def keep_buying(price: float):
     if not CONF.stop_on_top:
         return True
     if SELL_ORDERS:
-        return round(price * (1 + CONF.change)) < sorted(SELL_ORDERS, key=lambda order: order.price, reverse=True)[0].price
+        return round(price * (1 + CONF.change)) < SELL_ORDERS.highest().price
     return False
 
 
@@ -302,14 +1294,21 @@ def shall_hibernate(mayer: dict = None):
     if mayer is not None and mayer['current']:
         if mayer['current'] > CONF.mm_stop_buy:
             return True
-        if not CONF.auto_leverage:
-            return round(get_leverage(), 1) > CONF.leverage_default
-        if CONF.auto_leverage_escape:
-            return round(get_leverage(), 1) > CONF.leverage_escape
-        return round(get_leverage(), 1) > get_target_leverage(mayer)
+        return round(get_leverage(), 1) > get_leverage_limit(mayer)
     return HIBERNATE
 
 
+def get_leverage_limit(mayer: dict):
+    """
+    :return the leverage above which the bot hibernates
+    """
+    if not CONF.auto_leverage:
+        return CONF.leverage_default
+    if CONF.auto_leverage_escape:
+        return CONF.leverage_escape
+    return get_target_leverage(mayer)
+
+
 def cancel_current_buy_order():
     """
     Cancels the current buy order
@@ -343,6 +1342,22 @@ def calculate_sell_order_amount():
     return math.floor(available / quota)
 
 
+def create_first_orders():
+    """
+    Creates the first sell and buy order together
+    """
+    global HIBERNATE
+
+    mamu = fetch_mayer()
+    adjust_leverage(mamu)
+    HIBERNATE = shall_hibernate(mamu)
+    if HIBERNATE:
+        create_first_sell_order()
+    else:
+        price = get_current_price()
+        create_buy_and_sell_order(price, calculate_buy_order_amount(price), calculate_sell_order_amount())
+
+
 def create_first_buy_order():
     global HIBERNATE
 
@@ -354,6 +1369,7 @@ def create_first_buy_order():
         create_buy_order(price, calculate_buy_order_amount(price), False)
 
 
+@retrying()
 def create_sell_order(fixed_order_size: int = None):
     """
     :param fixed_order_size the order volume (optional)
@@ -386,6 +1402,7 @@ def create_sell_order(fixed_order_size: int = None):
                                                          {'leverage_level': CONF.leverage_default,
                                                           'funding_currency': CONF.base})
         order = Order(new_order)
+        invalidate_account()
         SELL_ORDERS.append(order)
         LOG.info('Created %s', str(order))
         return True
@@ -394,11 +1411,93 @@ def create_sell_order(fixed_order_size: int = None):
         if any(e in str(error.args) for e in STOP_ERRORS):
             LOG.error('Insufficient funds - not selling %d', order_size)
             return False
-        LOG.error(RETRY_MESSAGE, type(error).__name__, str(error.args))
-        SELL_PRICE = round(get_current_price() * (1 + CONF.change))
-        create_sell_order(fixed_order_size)
+        SELL_PRICE = round(get_current_price(True) * (1 + CONF.change))
+        raise
+
 
+def create_buy_and_sell_order(price: float, buy_amount: int, sell_amount: int, sell_if_bought: bool = False):
+    """
+    Creates a buy order below and a sell order above the price with a single request where the exchange supports it.
+    Orders which could not be placed this way are created one by one.
+    :param price: current price of crypto
+    :param buy_amount: the volume of the buy order
+    :param sell_amount: the volume of the sell order
+    :param sell_if_bought: keep the sell order only if the buy order was created
+    :return True if the buy order was created
+    """
+    global SELL_PRICE
+    global BUY_PRICE
+    global CURR_BUY_ORDER
+    global BUY_ORDERS
+    global SELL_ORDERS
+
+    BUY_PRICE = round(price * (1 - CONF.change))
+    SELL_PRICE = round(price * (1 + CONF.change))
+    if CONF.exchange != 'bitmex' or is_order_below_limit(buy_amount, BUY_PRICE) or \
+            is_order_below_limit(sell_amount, SELL_PRICE) or get_position_balance() < sell_amount:
+        bought = create_buy_order(price, buy_amount, False)
+        if bought or not sell_if_bought:
+            create_sell_order(sell_amount)
+        return bought
+
+    buy, sell = place_orders([('buy', buy_amount, BUY_PRICE), ('sell', sell_amount, SELL_PRICE)])
+    if buy is not None:
+        CURR_BUY_ORDER = buy
+        BUY_ORDERS.append(buy)
+    if sell is not None:
+        SELL_ORDERS.append(sell)
+    bought = buy is not None or create_buy_order(price, buy_amount, False)
+    if not bought and sell_if_bought:
+        if sell is not None:
+            cancel_order(sell)
+            SELL_ORDERS.remove(sell)
+    elif sell is None:
+        SELL_PRICE = round(price * (1 + CONF.change))
+        create_sell_order(sell_amount)
+    return bought
+
+
+def place_orders(orders: list):
+    """
+    Places several limit orders with a single request (bitmex only)
+    :param orders: list of (side, amount, price)
+    :return list of the created orders in the requested order, None for each order which was not placed
+    """
+    bulk = [{'symbol': CONF.symbol, 'side': side.capitalize(), 'orderQty': amount, 'price': price, 'ordType': 'Limit'}
+            for side, amount, price in orders]
+    try:
+        responses = EXCHANGE.private_post_order_bulk({'orders': bulk})
+        invalidate_account()
+    except (ccxt.ExchangeError, ccxt.NetworkError) as error:
+        LOG.warning('Could not place %d orders at once %s %s', len(orders), type(error).__name__, str(error.args))
+        return [None] * len(orders)
+
+    created = []
+    for response in responses:
+        if response.get('ordStatus') == 'Rejected':
+            LOG.warning('Order rejected %s', response.get('ordRejReason'))
+            created.append(None)
+        else:
+            order = Order(EXCHANGE.parse_order(response))
+            LOG.info('Created %s', str(order))
+            created.append(order)
+    return created + [None] * (len(orders) - len(created))
 
+
+def get_order_status(order: Order, open_ids: set = None):
+    """
+    Returns the status of an order. Orders contained in the given open order ids are considered open,
+    the status of any other order is fetched
+    :param order: the order to check
+    :param open_ids: ids of the currently open orders (optional)
+    :return status of the order (open, closed, canceled)
+    """
+    if open_ids is not None and order.id in open_ids:
+        return 'open'
+    return fetch_order_status(order.id)
+
+
+@retrying()
 def fetch_order_status(order_id: str):
     """
     Fetches the status of an order
@@ -411,31 +1510,14 @@ def fetch_order_status(order_id: str):
     except ccxt.OrderNotFound as error:
         LOG.error('Order status not found  %s %s', order_id, str(error.args))
         return 'not found'
-    except (ccxt.ExchangeError, ccxt.NetworkError) as error:
-        LOG.error(RETRY_MESSAGE, type(error).__name__, str(error.args))
-        sleep_for(4, 6)
-        fetch_order_status(order_id)
 
 
 def cancel_order(order: Order):
     """
     Cancels an order
     """
-    try:
-        if order is not None:
-            status = EXCHANGE.fetch_order_status(order.id)
-            if status == 'open':
-                EXCHANGE.cancel_order(order.id)
-            else:
-                LOG.warning('Order to be canceled %s was in state %s', order.id, status)
-
-    except ccxt.OrderNotFound as error:
-        LOG.error('Order to be canceled not found %s %s', order.id, str(error.args))
-        return
-    except (ccxt.ExchangeError, ccxt.NetworkError) as error:
-        LOG.error(RETRY_MESSAGE, type(error).__name__, str(error.args))
-        sleep_for(4, 6)
-        cancel_order(order)
+    if order is not None:
+        cancel_orders([order])
 
 
 def create_buy_order(price: float, buy_amount: int, fixed_price: bool = False):
@@ -455,46 +1537,51 @@ def create_buy_order(price: float, buy_amount: int, fixed_price: bool = False):
     global CURR_BUY_ORDER
     global BUY_ORDERS
 
-    BUY_PRICE = price if fixed_price else round(price * (1 - CONF.change))
-    SELL_PRICE = round(price * (1 + CONF.change))
-    curr_price = get_current_price()
-
-    try:
-        if not is_order_below_limit(buy_amount, BUY_PRICE):
-            if CONF.exchange in ['bitmex', 'binance', 'bitfinex', 'coinbase']:
-                new_order = EXCHANGE.create_limit_buy_order(CONF.pair, buy_amount, BUY_PRICE)
-            elif CONF.exchange == 'kraken':
-                new_order = EXCHANGE.create_limit_buy_order(CONF.pair, to_crypto_amount(buy_amount, curr_price), BUY_PRICE,
-                                                            {'leverage': CONF.leverage_default, 'oflags': 'fcib'})
-            elif CONF.exchange == 'liquid':
-                new_order = EXCHANGE.create_limit_buy_order(CONF.pair, to_crypto_amount(buy_amount, curr_price), BUY_PRICE,
-                                                            {'leverage_level': CONF.leverage_default,
-                                                             'funding_currency': CONF.base})
-            order = Order(new_order)
-            LOG.info('Created %s', str(order))
-            CURR_BUY_ORDER = order
-            BUY_ORDERS.append(order)
-            return True
-        if SELL_ORDERS:
-            LOG.info('Could not create buy order, waiting for a sell order to be realised')
-            return delay_buy_order(curr_price, price)
-
-        LOG.warning('Could not create buy order over %d and there are no open sell orders, reset required', buy_amount)
-        return False
+    backoff = Backoff('create_buy_order')
+    while True:
+        BUY_PRICE = price if fixed_price else round(price * (1 - CONF.change))
+        SELL_PRICE = round(price * (1 + CONF.change))
+        curr_price = get_current_price(True)
 
-    except (ccxt.ExchangeError, ccxt.NetworkError) as error:
-        if any(e in str(error.args) for e in STOP_ERRORS):
+        try:
+            if not is_order_below_limit(buy_amount, BUY_PRICE):
+                if CONF.exchange in ['bitmex', 'binance', 'bitfinex', 'coinbase']:
+                    new_order = EXCHANGE.create_limit_buy_order(CONF.pair, buy_amount, BUY_PRICE)
+                elif CONF.exchange == 'kraken':
+                    new_order = EXCHANGE.create_limit_buy_order(CONF.pair, to_crypto_amount(buy_amount, curr_price),
+                                                                BUY_PRICE,
+                                                                {'leverage': CONF.leverage_default, 'oflags': 'fcib'})
+                elif CONF.exchange == 'liquid':
+                    new_order = EXCHANGE.create_limit_buy_order(CONF.pair, to_crypto_amount(buy_amount, curr_price),
+                                                                BUY_PRICE,
+                                                                {'leverage_level': CONF.leverage_default,
+                                                                 'funding_currency': CONF.base})
+                order = Order(new_order)
+                invalidate_account()
+                LOG.info('Created %s', str(order))
+                CURR_BUY_ORDER = order
+                BUY_ORDERS.append(order)
+                return True
             if SELL_ORDERS:
-                LOG.info(
-                    'Could not create buy order over %s, insufficient margin, waiting for a sell order to be realised',
-                    str(buy_amount))
+                LOG.info('Could not create buy order, waiting for a sell order to be realised')
                 return delay_buy_order(curr_price, price)
 
-            LOG.warning('Could not create buy order over %d, insufficient margin', buy_amount)
+            LOG.warning('Could not create buy order over %d and there are no open sell orders, reset required',
+                        buy_amount)
             return False
-        LOG.error(RETRY_MESSAGE, type(error).__name__, str(error.args))
-        sleep_for(4, 6)
-        create_buy_order(update_price(curr_price, price), buy_amount, fixed_price)
+
+        except (ccxt.ExchangeError, ccxt.NetworkError) as error:
+            if any(e in str(error.args) for e in STOP_ERRORS):
+                if SELL_ORDERS:
+                    LOG.info('Could not create buy order over %s, insufficient margin, waiting for a sell order to be '
+                             'realised', str(buy_amount))
+                    return delay_buy_order(curr_price, price)
+
+                LOG.warning('Could not create buy order over %d, insufficient margin', buy_amount)
+                return False
+            if not backoff.wait(error):
+                return False
+            price = update_price(curr_price, price)
 
 
 def delay_buy_order(crypto_price: float, price: float):
@@ -505,7 +1592,7 @@ def delay_buy_order(crypto_price: float, price: float):
     :param price: the price of the original buy order to be created
     """
     sleep_for(90, 180)
-    daily_report()
+    invalidate_account()
     new_amount = calculate_buy_order_amount()  # recalculate order size
     if is_order_below_limit(new_amount, update_price(crypto_price, price)):
         if CONF.auto_leverage and CONF.auto_leverage_escape:
@@ -537,6 +1624,7 @@ def calculate_buy_order_amount(price: float = None):
     return math.floor(wallet_available / quota * price) if price is not None else 0
 
 
+@retrying()
 def create_market_sell_order(amount_crypto: float):
     """
     Creates a market sell order and sets the values as global ones. Used to compensate margins above 50%.
@@ -546,7 +1634,7 @@ def create_market_sell_order(amount_crypto: float):
     global SELL_PRICE
     global SELL_ORDERS
 
-    cur_price = get_current_price()
+    cur_price = get_current_price(True)
     amount_fiat = round(amount_crypto * cur_price)
     BUY_PRICE = round(cur_price * (1 - CONF.change))
     SELL_PRICE = round(cur_price * (1 + CONF.change))
@@ -562,17 +1650,17 @@ def create_market_sell_order(amount_crypto: float):
                 new_order = EXCHANGE.create_market_sell_order(CONF.pair, amount_fiat,
                                                               {'leverage_level': CONF.leverage_default})
             order = Order(new_order)
+            invalidate_account()
             LOG.info('Created market %s', str(order))
 
     except (ccxt.ExchangeError, ccxt.NetworkError) as error:
         if any(e in str(error.args) for e in STOP_ERRORS):
             LOG.error('Insufficient balance/funds - not selling %d', amount_fiat)
             return
-        LOG.error(RETRY_MESSAGE, type(error).__name__, str(error.args))
-        sleep_for(4, 6)
-        create_market_sell_order(amount_crypto)
+        raise
 
 
+@retrying()
 def create_market_buy_order(amount_crypto: float):
     """
     Creates a market buy order and sets the values as global ones. Used to compensate margins below 50%.
@@ -581,7 +1669,7 @@ def create_market_buy_order(amount_crypto: float):
     global BUY_PRICE
     global SELL_PRICE
 
-    cur_price = get_current_price()
+    cur_price = get_current_price(True)
     amount_fiat = round(amount_crypto * cur_price)
     BUY_PRICE = round(cur_price * (1 - CONF.change))
     SELL_PRICE = round(cur_price * (1 + CONF.change))
@@ -598,37 +1686,51 @@ def create_market_buy_order(amount_crypto: float):
                                                              {'leverage_level': CONF.leverage_default,
                                                               'funding_currency': CONF.base})
             order = Order(new_order)
+            invalidate_account()
             LOG.info('Created market %s', str(order))
 
     except (ccxt.ExchangeError, ccxt.NetworkError) as error:
         if "not_enough_free" or "free_margin_below" in str(error.args):
             LOG.error('Not enough free margin/balance %s %s', type(error).__name__, str(error.args))
             return
+        raise
 
-        LOG.error(RETRY_MESSAGE, type(error).__name__, str(error.args))
-        sleep_for(4, 6)
-        create_market_buy_order(amount_crypto)
+
+def fetch_account(method: str, params: dict = None):
+    """
+    Calls an account endpoint of the exchange, using the account snapshot if there is one
+    :param method: name of the exchange method
+    :param params: optional request parameters
+    :return response of the exchange
+    """
+    if ACCOUNT is not None:
+        return ACCOUNT.get(method, params)
+    call = getattr(EXCHANGE, method)
+    return call() if params is None else call(params)
 
 
+def invalidate_account():
+    """
+    Discards the account snapshot, so that the next read fetches fresh data (after orders, fills or leverage changes)
+    """
+    if ACCOUNT is not None:
+        ACCOUNT.invalidate()
+
+
+@retrying()
 def get_margin_leverage():
     """
     Fetch the leverage
     :return margin leverage: float
     """
-    try:
-        if CONF.exchange in ['bitmex', 'binance', 'bitfinex', 'coinbase']:
-            return EXCHANGE.fetch_balance()['info'][0]['marginLeverage']
-        if CONF.exchange == 'kraken':
-            return float(EXCHANGE.private_post_tradebalance()['result']['ml'])
-        if CONF.exchange == 'liquid':
-            # TODO poi = get_position_info()
-            LOG.error("get_margin_leverage() not yet implemented for %s", CONF.exchange)
-        return None
-
-    except (ccxt.ExchangeError, ccxt.NetworkError) as error:
-        LOG.error(RETRY_MESSAGE, type(error).__name__, str(error.args))
-        sleep_for(4, 6)
-        get_margin_leverage()
+    if CONF.exchange in ['bitmex', 'binance', 'bitfinex', 'coinbase']:
+        return fetch_account('fetch_balance')['info'][0]['marginLeverage']
+    if CONF.exchange == 'kraken':
+        return float(fetch_account('private_post_tradebalance')['result']['ml'])
+    if CONF.exchange == 'liquid':
+        # TODO poi = get_position_info()
+        LOG.error("get_margin_leverage() not yet implemented for %s", CONF.exchange)
+    return None
 
 
 def get_relevant_leverage():
@@ -646,157 +1748,127 @@ def get_relevant_leverage():
     return position_leverage if 100 > position_leverage > margin_leverage else margin_leverage
 
 
+@retrying()
 def get_wallet_balance():
     """
     Fetch the wallet balance in crypto
     :return balance in crypto: float
     """
-    try:
-        if CONF.exchange in ['bitmex', 'binance', 'bitfinex', 'coinbase']:
-            return EXCHANGE.fetch_balance()['info'][0]['walletBalance'] * CONF.satoshi_factor
-        if CONF.exchange == 'kraken':
-            asset = CONF.base if CONF.base != 'BTC' else 'XBt'
-            return float(EXCHANGE.private_post_tradebalance({'asset': asset})['result']['tb'])
-        if CONF.exchange == 'liquid':
-            result = EXCHANGE.private_get_accounts_balance()
-            if result is not None:
-                for balance in result:
-                    if balance['currency'] == CONF.base:
-                        return float(balance['balance'])
-        return None
-
-    except (ccxt.ExchangeError, ccxt.NetworkError) as error:
-        LOG.error(RETRY_MESSAGE, type(error).__name__, str(error.args))
-        sleep_for(4, 6)
-        get_wallet_balance()
+    if CONF.exchange in ['bitmex', 'binance', 'bitfinex', 'coinbase']:
+        return fetch_account('fetch_balance')['info'][0]['walletBalance'] * CONF.satoshi_factor
+    if CONF.exchange == 'kraken':
+        asset = CONF.base if CONF.base != 'BTC' else 'XBt'
+        return float(fetch_account('private_post_tradebalance', {'asset': asset})['result']['tb'])
+    if CONF.exchange == 'liquid':
+        result = fetch_account('private_get_accounts_balance')
+        if result is not None:
+            for balance in result:
+                if balance['currency'] == CONF.base:
+                    return float(balance['balance'])
+    return None
 
 
+@retrying()
 def get_balance():
     """
     Fetch the balance in crypto.
     :return balance in crypto dict: used: float, free: float,total: float
     """
-    try:
-        if CONF.exchange != 'liquid':
-            bal = EXCHANGE.fetch_balance()[CONF.base]
-            if bal['used'] is None:
-                bal['used'] = 0
-            if bal['free'] is None:
-                bal['free'] = 0
-            return bal
-
-        bal = None
-        pos = get_position_info()
-        if pos is not None:
-            bal = {'used': float(pos['margin']), 'free': float(pos['free_margin']), 'total': float(pos['equity'])}
-        if bal is None:
-            # no position => return wallet balance
-            result = EXCHANGE.private_get_accounts_balance()
-            if result is not None:
-                for wallet in result:
-                    if wallet['currency'] == CONF.base:
-                        bal = {'used': 0, 'free': float(wallet['balance']), 'total': float(wallet['balance'])}
+    if CONF.exchange != 'liquid':
+        bal = fetch_account('fetch_balance')[CONF.base]
+        if bal['used'] is None:
+            bal['used'] = 0
+        if bal['free'] is None:
+            bal['free'] = 0
         return bal
 
-    except (ccxt.ExchangeError, ccxt.NetworkError) as error:
-        LOG.error(RETRY_MESSAGE, type(error).__name__, str(error.args))
-        sleep_for(4, 6)
-        get_balance()
+    bal = None
+    pos = get_position_info()
+    if pos is not None:
+        bal = {'used': float(pos['margin']), 'free': float(pos['free_margin']), 'total': float(pos['equity'])}
+    if bal is None:
+        # no position => return wallet balance
+        result = fetch_account('private_get_accounts_balance')
+        if result is not None:
+            for wallet in result:
+                if wallet['currency'] == CONF.base:
+                    bal = {'used': 0, 'free': float(wallet['balance']), 'total': float(wallet['balance'])}
+    return bal
 
 
+@retrying()
 def get_position_balance():
     """
     Fetch the position balance in fiat.
     :return balance: int
     """
-    try:
-        if CONF.exchange in ['bitmex', 'binance', 'bitfinex', 'coinbase']:
-            return EXCHANGE.private_get_position()[0]['currentQty']
-        if CONF.exchange == 'kraken':
-            result = EXCHANGE.private_post_tradebalance()['result']
-            return round(float(result['e']) - float(result['mf']))
-        if CONF.exchange == 'liquid':
-            return round(get_balance()['used'] * get_current_price())
-        return None
-
-    except (ccxt.ExchangeError, ccxt.NetworkError) as error:
-        LOG.error(RETRY_MESSAGE, type(error).__name__, str(error.args))
-        sleep_for(4, 6)
-        get_position_balance()
+    if CONF.exchange in ['bitmex', 'binance', 'bitfinex', 'coinbase']:
+        return fetch_account('private_get_position')[0]['currentQty']
+    if CONF.exchange == 'kraken':
+        result = fetch_account('private_post_tradebalance')['result']
+        return round(float(result['e']) - float(result['mf']))
+    if CONF.exchange == 'liquid':
+        return round(get_balance()['used'] * get_current_price())
+    return None
 
 
+@retrying()
 def get_net_deposits():
     """
     Get deposits and withdraws to calculate the net deposits in crypto.
     :return net deposits: float
     """
-    try:
-        currency = CONF.base if CONF.base != 'BTC' else 'XBt'
-        if CONF.exchange == 'bitmex':
-            result = EXCHANGE.private_get_user_wallet({'currency': currency})
-            return (result['deposited'] - result['withdrawn']) * CONF.satoshi_factor
-        if CONF.exchange == 'kraken':
-            net_deposits = 0
-            deposits = EXCHANGE.fetch_deposits(CONF.base)
-            for deposit in deposits:
-                net_deposits += deposit['amount']
-            ledgers = EXCHANGE.private_post_ledgers({'asset': currency, 'type': 'withdrawal'})['result']['ledger']
-            for withdrawal_id in ledgers:
-                net_deposits += float(ledgers[withdrawal_id]['amount'])
-            return net_deposits
-        LOG.error("get_net_deposit() not yet implemented for %s", CONF.exchange)
-        return None
-
-    except (ccxt.ExchangeError, ccxt.NetworkError) as error:
-        LOG.error(RETRY_MESSAGE, type(error).__name__, str(error.args))
-        sleep_for(4, 6)
-        get_net_deposits()
+    currency = CONF.base if CONF.base != 'BTC' else 'XBt'
+    if CONF.exchange == 'bitmex':
+        result = EXCHANGE.private_get_user_wallet({'currency': currency})
+        return (result['deposited'] - result['withdrawn']) * CONF.satoshi_factor
+    if CONF.exchange == 'kraken':
+        net_deposits = 0
+        deposits = EXCHANGE.fetch_deposits(CONF.base)
+        for deposit in deposits:
+            net_deposits += deposit['amount']
+        ledgers = EXCHANGE.private_post_ledgers({'asset': currency, 'type': 'withdrawal'})['result']['ledger']
+        for withdrawal_id in ledgers:
+            net_deposits += float(ledgers[withdrawal_id]['amount'])
+        return net_deposits
+    LOG.error("get_net_deposit() not yet implemented for %s", CONF.exchange)
+    return None
 
 
+@retrying()
 def get_position_info():
     """
     Fetch position information
     """
-    try:
-        if CONF.exchange in ['bitmex', 'binance', 'bitfinex', 'coinbase']:
-            response = EXCHANGE.private_get_position()
-            if response and response[0] and response[0]['avgEntryPrice']:
-                return response[0]
-            return None
-        if CONF.exchange == 'kraken':
-            LOG.error("get_position_info() not yet implemented for kraken")
-            return None
-        if CONF.exchange == 'liquid':
-            response = EXCHANGE.private_get_trading_accounts()
-            for pos in response:
-                if pos['currency_pair_code'] == CONF.symbol and pos['funding_currency'] == CONF.base and \
-                        float(pos['margin']) > 0:
-                    return pos
+    if CONF.exchange in ['bitmex', 'binance', 'bitfinex', 'coinbase']:
+        response = fetch_account('private_get_position')
+        if response and response[0] and response[0]['avgEntryPrice']:
+            return response[0]
         return None
-
-    except (ccxt.ExchangeError, ccxt.NetworkError) as error:
-        LOG.error(RETRY_MESSAGE, type(error).__name__, str(error.args))
-        sleep_for(4, 6)
-        get_position_info()
+    if CONF.exchange == 'kraken':
+        LOG.error("get_position_info() not yet implemented for kraken")
+        return None
+    if CONF.exchange == 'liquid':
+        response = fetch_account('private_get_trading_accounts')
+        for pos in response:
+            if pos['currency_pair_code'] == CONF.symbol and pos['funding_currency'] == CONF.base and \
+                    float(pos['margin']) > 0:
+                return pos
+    return None
 
 
+@retrying()
 def get_interest_rate():
     """
     Fetches and converts the interest rate
     """
-    try:
-        if CONF.exchange == 'bitmex':
-            today = datetime.date.today().isoformat()
-            result = EXCHANGE.public_get_funding({'symbol': CONF.symbol, 'startTime': today, 'count': 1})
-            if result is not None:
-                return result[0]['fundingRateDaily'] * -100
-        LOG.error("get_interest_rate() not yet implemented for %s", CONF.exchange)
-        return None
-
-    except (ccxt.ExchangeError, ccxt.NetworkError) as error:
-        LOG.error(RETRY_MESSAGE, type(error).__name__, str(error.args))
-        sleep_for(4, 6)
-        get_interest_rate()
+    if CONF.exchange == 'bitmex':
+        today = datetime.date.today().isoformat()
+        result = EXCHANGE.public_get_funding({'symbol': CONF.symbol, 'startTime': today, 'count': 1})
+        if result is not None:
+            return result[0]['fundingRateDaily'] * -100
+    LOG.error("get_interest_rate() not yet implemented for %s", CONF.exchange)
+    return None
 
 
 def compensate():
@@ -831,15 +1903,15 @@ def do_buy(crypto_amount: float):
     i = 1
     while i <= CONF.trade_trials:
         rise = i / 2
-        buy_price = get_current_price() + rise
+        buy_price = get_current_price(True) + rise
         if not create_buy_order(buy_price, round(crypto_amount * buy_price), True):
             return
         sleep_for(89, 91)
+        invalidate_account()
         order_status = fetch_order_status(CURR_BUY_ORDER.id)
         if order_status in ['open', 'not found']:
             cancel_current_buy_order()
             i += 1
-            daily_report()
         else:
             if CURR_BUY_ORDER in BUY_ORDERS:
                 BUY_ORDERS.remove(CURR_BUY_ORDER)
@@ -858,16 +1930,16 @@ def do_sell(crypto_amount: float):
     i = 1
     while i <= CONF.trade_trials:
         discount = i / 2
-        SELL_PRICE = get_current_price() - discount
+        SELL_PRICE = get_current_price(True) - discount
         if not create_sell_order(round(crypto_amount * SELL_PRICE)):
             return
         sleep_for(89, 91)
+        invalidate_account()
         order_status = fetch_order_status(SELL_ORDERS[-1].id)
         if order_status in ['open', 'not found']:
             cancel_order(SELL_ORDERS[-1])
             del SELL_ORDERS[-1]
             i += 1
-            daily_report()
         else:
             del SELL_ORDERS[-1]
             return
@@ -882,40 +1954,34 @@ def spread(price: float):
     to the market price
     """
     if BUY_ORDERS and SELL_ORDERS:
-        highest_buy_order = sorted(BUY_ORDERS, key=lambda order: order.price, reverse=True)[0]
+        highest_buy_order = BUY_ORDERS.highest()
         if highest_buy_order.price < price * (1 - CONF.change * CONF.spread_factor):
-            lowest_sell_order = sorted(SELL_ORDERS, key=lambda order: order.price)[0]
+            lowest_sell_order = SELL_ORDERS.lowest()
             if lowest_sell_order.price > price * (1 + CONF.change * CONF.spread_factor):
                 LOG.info("Orders above spread tolerance min sell: %f max buy: %f current rate: %f",
                          lowest_sell_order.price, highest_buy_order.price, price)
                 LOG.info("Canceling highest %s", str(highest_buy_order))
                 cancel_order(highest_buy_order)
                 BUY_ORDERS.remove(highest_buy_order)
-                if create_buy_order(price, highest_buy_order.amount, False):
-                    create_sell_order()
+                create_buy_and_sell_order(price, highest_buy_order.amount, highest_buy_order.amount, True)
 
 
+@retrying()
 def get_margin_balance():
     """
     Fetches the margin balance in fiat (free and total)
     :return balance in fiat
     """
-    try:
-        if CONF.exchange in ['bitmex', 'binance', 'bitfinex', 'coinbase']:
-            bal = EXCHANGE.fetch_balance()[CONF.base]
-        elif CONF.exchange == 'kraken':
-            bal = EXCHANGE.private_post_tradebalance({'asset': CONF.base})['result']
-            bal['free'] = float(bal['mf'])
-            bal['total'] = float(bal['e'])
-            bal['used'] = float(bal['m'])
-        elif CONF.exchange == 'liquid':
-            bal = get_balance()
-        return bal
-
-    except (ccxt.ExchangeError, ccxt.NetworkError) as error:
-        LOG.error(RETRY_MESSAGE, type(error).__name__, str(error.args))
-        sleep_for(4, 6)
-        get_margin_balance()
+    if CONF.exchange in ['bitmex', 'binance', 'bitfinex', 'coinbase']:
+        bal = fetch_account('fetch_balance')[CONF.base]
+    elif CONF.exchange == 'kraken':
+        bal = fetch_account('private_post_tradebalance', {'asset': CONF.base})['result']
+        bal['free'] = float(bal['mf'])
+        bal['total'] = float(bal['e'])
+        bal['used'] = float(bal['m'])
+    elif CONF.exchange == 'liquid':
+        bal = get_balance()
+    return bal
 
 
 def calculate_used_margin_percentage(bal=None):
@@ -934,6 +2000,8 @@ def calculate_order_stats(open_orders: [Order]):
     Calculates the average price and the fiat/crypto quantity (value) of a list of open orders
     :param open_orders: [Order]
     """
+    if isinstance(open_orders, OrderBook):
+        return open_orders.get_stats()
     total_amount_fiat = 0
     total_amount_crypto = 0
     total_price = 0
@@ -946,27 +2014,61 @@ def calculate_order_stats(open_orders: [Order]):
     return {'avg': 0, 'qty': 0}
 
 
-def get_current_price():
+@retrying()
+def get_current_price(fresh: bool = False):
     """
-    Fetch the current crypto price
+    Fetch the current crypto price, a cached price is returned as long as it is not older than the configured maximum
+    :param fresh: bypass the cache (order placement)
     :return last bid price: float
     """
+    if TICKER is not None and not fresh:
+        price = TICKER.get()
+        if price is not None:
+            LOG.debug('Using price %s fetched %.1f seconds ago', price, TICKER.age())
+            return price
+    if BROKER is not None and not fresh:
+        price = BROKER.get_price(CONF.exchange, CONF.pair, CONF.test, CONF.price_max_age)
+        if price is not None:
+            if TICKER is not None:
+                TICKER.update(price)
+            return price
     try:
         price = EXCHANGE.fetch_ticker(CONF.pair)['bid']
         if not price:
             LOG.warning('Price was None')
-            sleep_for(1, 2)
-            get_current_price()
-        else:
-            return price
+            raise ccxt.NullResponse('Price was None')
+        if TICKER is not None:
+            TICKER.update(price)
+        return price
 
     except (ccxt.ExchangeError, ccxt.NetworkError) as error:
         if "key is disabled" in str(error.args):
             LOG.warning('Key is disabled')
             return deactivate_bot()
-        LOG.error(RETRY_MESSAGE, type(error).__name__, str(error.args))
-        sleep_for(4, 6)
-        get_current_price()
+        raise
+
+
+def get_cached_price():
+    """
+    Returns the price if it is known without a request: from the ticker, the broker or the feed
+    :return price or None
+    """
+    price = TICKER.get() if TICKER is not None else None
+    if price is None and BROKER is not None:
+        price = BROKER.get_price(CONF.exchange, CONF.pair, CONF.test, CONF.price_max_age)
+    if price is None and FEED is not None and FEED.connected:
+        price = FEED.price
+    return price
+
+
+def get_price_age():
+    """
+    Returns the age of the most recently used price
+    :return seconds: float
+    """
+    if TICKER is None or TICKER.price is None:
+        return 0.0
+    return TICKER.age()
 
 
 def update_price(origin_price: float, price: float):
@@ -976,9 +2078,10 @@ def update_price(origin_price: float, price: float):
     :param price
     :return price float:
     """
-    return (get_current_price() / origin_price) * price
+    return (get_current_price(True) / origin_price) * price
 
 
+@retrying()
 def init_orders(force_close: bool, auto_conf: bool):
     """
     Initialize existing orders or remove all pending ones
@@ -997,61 +2100,55 @@ def init_orders(force_close: bool, auto_conf: bool):
     if force_close:
         RESET_COUNTER += 1
 
-    try:
-        if auto_conf:
-            LOG.warning("Bot was resurrected by hades")
-
-        # Handle open orders
-        oos = get_open_orders()
-
-        LOG.info("Used margin: {:>20.2f}%".format(calculate_used_margin_percentage()))
-        print_position_info(oos)
-
-        if oos.get_orders():
-            LOG .info("Value of buy orders {}: {:>5}".format(CONF.quote, int(oos.total_buy_order_value)))
-            LOG.info("Value of sell orders {}: {:>4}".format(CONF.quote, int(oos.total_sell_order_value)))
-            LOG.info("No. of buy orders: {:>11}".format(len(oos.buy_orders)))
-            LOG.info("No. of sell orders: {:>10}".format(len(oos.sell_orders)))
-            LOG.info('----------------------------------')
-
-            cancel_existing_orders = False
-            if not force_close and not auto_conf:
-                keep_existing_orders = input('There are open orders! Would you like to load them? (y/n) ')
-                cancel_existing_orders = keep_existing_orders.lower() not in ['y', 'yes']
-
-            if not force_close and (auto_conf or not cancel_existing_orders):
-                auto_configure(oos)
-                LOG.info('Initialization complete (using existing orders)')
-                # No "compensate" in auto configuration
-                return True
+    if auto_conf:
+        LOG.warning("Bot was resurrected by hades")
 
-            LOG.info('Unrealised PNL: %s %s', str(get_unrealised_pnl(CONF.symbol) * CONF.satoshi_factor), CONF.base)
-            if force_close or cancel_existing_orders:
-                cancel_orders(oos.get_orders())
+    # Handle open orders
+    oos = get_open_orders()
 
-            if not force_close:
-                clear_position = input('There is an open ' + CONF.base + ' position! Would you like to close it? (y/n) ')
-                if clear_position.lower() in ['y', 'yes']:
-                    cancel_orders(oos.get_orders())
-                    close_position(CONF.symbol)
-                else:
-                    compensate_position = input('Would you like to compensate to 50%? (y/n) ')
-                    if compensate_position.lower() in ['n', 'no']:
-                        # No "compensate" wanted
-                        return True
-
-        # Handle open positions if no orders are open
-        elif not force_close and not auto_conf and get_open_position(CONF.symbol) is not None:
-            msg = 'There is an open ' + CONF.base + ' position!\nUnrealised PNL: {:.8f} ' + CONF.base + \
-                  '\nWould you like to close it? (y/n) '
-            init = input(msg.format(get_unrealised_pnl(CONF.symbol) * CONF.satoshi_factor))
-            if init.lower() in ['y', 'yes']:
-                close_position(CONF.symbol)
+    LOG.info("Used margin: {:>20.2f}%".format(calculate_used_margin_percentage()))
+    print_position_info(oos)
+
+    if oos.get_orders():
+        LOG .info("Value of buy orders {}: {:>5}".format(CONF.quote, int(oos.total_buy_order_value)))
+        LOG.info("Value of sell orders {}: {:>4}".format(CONF.quote, int(oos.total_sell_order_value)))
+        LOG.info("No. of buy orders: {:>11}".format(len(oos.buy_orders)))
+        LOG.info("No. of sell orders: {:>10}".format(len(oos.sell_orders)))
+        LOG.info('----------------------------------')
+
+        cancel_existing_orders = False
+        if not force_close and not auto_conf:
+            keep_existing_orders = input('There are open orders! Would you like to load them? (y/n) ')
+            cancel_existing_orders = keep_existing_orders.lower() not in ['y', 'yes']
+
+        if not force_close and (auto_conf or not cancel_existing_orders):
+            auto_configure(oos)
+            LOG.info('Initialization complete (using existing orders)')
+            # No "compensate" in auto configuration
+            return True
 
-    except (ccxt.ExchangeError, ccxt.NetworkError) as error:
-        LOG.error(RETRY_MESSAGE, type(error).__name__, str(error.args))
-        sleep_for(4, 6)
-        return init_orders(force_close, auto_conf)
+        LOG.info('Unrealised PNL: %s %s', str(get_unrealised_pnl(CONF.symbol) * CONF.satoshi_factor), CONF.base)
+        if force_close or cancel_existing_orders:
+            cancel_orders(oos.get_orders(), True)
+
+        if not force_close:
+            clear_position = input('There is an open ' + CONF.base + ' position! Would you like to close it? (y/n) ')
+            if clear_position.lower() in ['y', 'yes']:
+                cancel_orders(oos.get_orders(), True)
+                close_position(CONF.symbol)
+            else:
+                compensate_position = input('Would you like to compensate to 50%? (y/n) ')
+                if compensate_position.lower() in ['n', 'no']:
+                    # No "compensate" wanted
+                    return True
+
+    # Handle open positions if no orders are open
+    elif not force_close and not auto_conf and get_open_position(CONF.symbol) is not None:
+        msg = 'There is an open ' + CONF.base + ' position!\nUnrealised PNL: {:.8f} ' + CONF.base + \
+              '\nWould you like to close it? (y/n) '
+        init = input(msg.format(get_unrealised_pnl(CONF.symbol) * CONF.satoshi_factor))
+        if init.lower() in ['y', 'yes']:
+            close_position(CONF.symbol)
 
     del oos
     # compensate
@@ -1062,9 +2159,11 @@ def auto_configure(oos: OpenOrdersSummary):
     load_existing_orders(oos)
     if not CONF.stop_on_top:
         adjust_leverage()
-        if not oos.sell_orders:
+        if not oos.sell_orders and not oos.buy_orders:
+            create_first_orders()
+        elif not oos.sell_orders:
             create_first_sell_order()
-        if not oos.buy_orders:
+        elif not oos.buy_orders:
             create_first_buy_order()
     del oos
 
@@ -1077,37 +2176,48 @@ def load_existing_orders(oos: OpenOrdersSummary):
     global BUY_PRICE
 
     if oos.sell_orders:
-        SELL_ORDERS = list(oos.sell_orders)
-        SELL_PRICE = SELL_ORDERS[-1].price  # lowest if several
+        SELL_ORDERS = OrderBook(oos.sell_orders)
+        SELL_PRICE = SELL_ORDERS.lowest().price
     if oos.buy_orders:
-        BUY_ORDERS = list(oos.buy_orders)
-        CURR_BUY_ORDER = BUY_ORDERS[0]  # highest if several
+        BUY_ORDERS = OrderBook(oos.buy_orders)
+        CURR_BUY_ORDER = BUY_ORDERS.highest()
         BUY_PRICE = CURR_BUY_ORDER.price
 
 
-def cancel_orders(orders: [Order]):
+@retrying()
+def cancel_orders(orders: [Order], all_open: bool = False):
     """
-    Close a list of orders
+    Close a list of orders without checking their state first - orders not found (already filled or canceled)
+    count as closed. Uses a single request where the exchange supports it.
     :param orders: [Order]
+    :param all_open: the orders are all open orders of the symbol
     """
-    try:
-        for order in orders:
-            LOG.debug('Cancel %s', str(order))
-            status = EXCHANGE.fetch_order_status(order.id)
-            if status == 'open':
-                EXCHANGE.cancel_order(order.id)
-            else:
-                LOG.warning('Cancel %s was in state %s', str(order), status)
-
-    except ccxt.OrderNotFound as error:
-        LOG.error('Cancel %s not found : %s', str(order), str(error.args))
+    if not orders:
         return
-    except (ccxt.ExchangeError, ccxt.NetworkError) as error:
-        LOG.error(RETRY_MESSAGE, type(error).__name__, str(error.args))
-        sleep_for(4, 6)
-        cancel_orders(orders)
+    for order in orders:
+        LOG.debug('Cancel %s', str(order))
+    if CONF.exchange == 'bitmex':
+        try:
+            if all_open:
+                responses = EXCHANGE.private_delete_order_all({'symbol': CONF.symbol})
+            else:
+                responses = EXCHANGE.private_delete_order({'orderID': [order.id for order in orders]})
+            for response in responses:
+                if 'error' in response:
+                    LOG.warning('Cancel %s was in state %s', response['orderID'], response['ordStatus'])
+            invalidate_account()
+            return
+        except ccxt.InvalidOrder as error:
+            LOG.warning('Bulk cancel failed %s, canceling one by one', str(error.args))
+    for order in orders:
+        try:
+            EXCHANGE.cancel_order(order.id)
+        except ccxt.InvalidOrder as error:
+            LOG.warning('Cancel %s not found : %s', str(order), str(error.args))
+    invalidate_account()
 
 
+@retrying()
 def close_position(symbol: str):
     """
     Close any open position
@@ -1120,6 +2230,7 @@ def close_position(symbol: str):
             EXCHANGE.create_market_sell_order(CONF.pair, 0.0, {'leverage': CONF.leverage_default})
         elif CONF.exchange == 'liquid':
             EXCHANGE.private_put_trades_close_all()
+        invalidate_account()
 
     except (ccxt.ExchangeError, ccxt.NetworkError) as error:
         # no retry in case of "no volume to close position" (kraken specific error)
@@ -1129,59 +2240,140 @@ def close_position(symbol: str):
         if "overloaded" in str(error.args):
             LOG.info('Exchange is overloaded, close position is postponed')
             return
-        LOG.error(RETRY_MESSAGE, type(error).__name__, str(error.args))
-        sleep_for(4, 6)
-        close_position(symbol)
+        raise
 
 
+@retrying()
 def get_open_position(symbol: str):
     """
     Get all open positions
     :return positions
     """
-    try:
-        if CONF.exchange in ['bitmex', 'binance', 'bitfinex', 'coinbase']:
-            for position in EXCHANGE.private_get_position():
-                if position['isOpen'] and position['symbol'] == symbol:
+    if CONF.exchange in ['bitmex', 'binance', 'bitfinex', 'coinbase']:
+        for position in fetch_account('private_get_position'):
+            if position['isOpen'] and position['symbol'] == symbol:
+                return position
+    elif CONF.exchange == 'kraken':
+        response = fetch_account('private_post_openpositions')
+        if response['result'] == 'success':
+            for position in response['openPositions']:
+                if position['symbol'] == symbol:
                     return position
-        elif CONF.exchange == 'kraken':
-            response = EXCHANGE.private_post_openpositions()
-            if response['result'] == 'success':
-                for position in response['openPositions']:
-                    if position['symbol'] == symbol:
-                        return position
-        elif CONF.exchange == 'liquid':
-            trades = EXCHANGE.private_get_trades({'status': 'open'})
-            for model in trades['models']:
-                if model['currency_pair_code'] == CONF.pair:
-                    return model
-        return None
-
-    except (ccxt.ExchangeError, ccxt.NetworkError) as error:
-        LOG.error(RETRY_MESSAGE, type(error).__name__, str(error.args))
-        sleep_for(4, 6)
-        get_open_position(symbol)
+    elif CONF.exchange == 'liquid':
+        trades = fetch_account('private_get_trades', {'status': 'open'})
+        for model in trades['models']:
+            if model['currency_pair_code'] == CONF.pair:
+                return model
+    return None
 
 
-def get_open_orders(tries: int = 0):
+@retrying(deadline=86400)
+def get_open_orders():
     """
     Gets all open orders
     :return OpenOrdersSummary
     """
     try:
-        return OpenOrdersSummary(EXCHANGE.fetch_open_orders(CONF.pair, since=None, limit=None, params={}))
+        # bitmex returns at most 100 orders unless asked for more
+        limit = 500 if CONF.exchange == 'bitmex' else None
+        return OpenOrdersSummary(EXCHANGE.fetch_open_orders(CONF.pair, since=None, limit=limit, params={}))
 
     except (ccxt.ExchangeError, ccxt.NetworkError) as error:
         if "key is disabled" in str(error.args):
             LOG.warning('Key is disabled')
             return deactivate_bot()
+        raise
+
+
+def get_open_order_ids():
+    """
+    Fetches the ids of all open orders with a single request
+    :return set of order ids or None if the open orders could not be fetched
+    """
+    oos = get_open_orders()
+    if oos is None:
+        return None
+    return {order.id for order in oos.get_orders()}
+
+
+def get_unfilled_order_ids():
+    """
+    Derives the ids of the still open local orders from the orders closed since the fill cursor
+    :return set of order ids or None if the closed orders could not be fetched
+    """
+    closed_ids = fetch_closed_order_ids()
+    if closed_ids is None:
+        return None
+    return exclude_closed(closed_ids)
+
+
+def exclude_closed(closed_ids: set):
+    """
+    :param closed_ids: ids of orders known to be closed
+    :return set of the ids of the local orders not contained in closed_ids
+    """
+    return {order.id for order in SELL_ORDERS + BUY_ORDERS if order.id not in closed_ids}
+
+
+def fetch_closed_order_ids():
+    """
+    Fetches the ids of the orders closed or canceled since the fill cursor, on exchanges in CLOSED_SINCE_UPDATE only:
+    elsewhere an order created before the cursor and filled after it would be missed. The cursor is advanced by
+    advance_fill_cursor() once the fills are handled, so fills are fetched again if handling them fails.
+    The request overlaps the previous one by a minute, reporting an order twice is harmless.
+    :return set of order ids or None if the closed orders could not be fetched
+    """
+    global FILL_CURSOR
+    global FILL_CURSOR_NEXT
+
+    if FILL_CURSOR is None:
+        FILL_CURSOR = load_fill_cursor()
+    try:
+        limit = 500 if CONF.exchange == 'bitmex' else None
+        orders = EXCHANGE.fetch_closed_orders(CONF.pair, since=FILL_CURSOR - 60000, limit=limit)
 
-        LOG.error(RETRY_MESSAGE, type(error).__name__, str(error.args))
-        sleep_for(4, 6)
-        if tries < 20000:
-            get_open_orders(tries+1)
+    except (ccxt.ExchangeError, ccxt.NetworkError) as error:
+        LOG.error('Could not fetch closed orders %s %s', type(error).__name__, str(error.args))
         return None
 
+    closed_ids = set()
+    cursor = FILL_CURSOR
+    for order in orders:
+        closed_ids.add(order['id'])
+        timestamp = order.get('lastTradeTimestamp') or order.get('timestamp')
+        if timestamp is not None and timestamp > cursor:
+            cursor = timestamp
+    if cursor != FILL_CURSOR:
+        FILL_CURSOR_NEXT = cursor
+    return closed_ids
+
+
+def advance_fill_cursor():
+    """
+    Advances and persists the fill cursor to the last fetched fill, to be called after the fills are handled
+    """
+    global FILL_CURSOR
+    global FILL_CURSOR_NEXT
+
+    if FILL_CURSOR_NEXT is not None:
+        FILL_CURSOR = FILL_CURSOR_NEXT
+        FILL_CURSOR_NEXT = None
+        persist_fill_cursor()
+
+
+def load_fill_cursor():
+    cursor_file = CONF.bot_instance + '.cursor'
+    if os.path.isfile(cursor_file):
+        with open(cursor_file, "rt") as file:
+            return int(file.read())
+    return int(time.time() * 1000)
+
+
+def persist_fill_cursor():
+    cursor_file = CONF.bot_instance + '.cursor'
+    with open(cursor_file, "wt") as file:
+        file.write(str(FILL_CURSOR))
+
 
 def get_unrealised_pnl(symbol: str):
     """
@@ -1189,15 +2381,10 @@ def get_unrealised_pnl(symbol: str):
     :param symbol:
     :return float
     """
-    try:
-        if get_open_position(symbol) is not None:
-            return float(get_open_position(symbol)['unrealisedPnl'])
-        return 0.0
-
-    except (ccxt.ExchangeError, ccxt.NetworkError) as error:
-        LOG.error(RETRY_MESSAGE, type(error).__name__, str(error.args))
-        sleep_for(4, 6)
-        get_unrealised_pnl(symbol)
+    position = get_open_position(symbol)
+    if position is not None:
+        return float(position['unrealisedPnl'])
+    return 0.0
 
 
 def print_position_info(oos: OpenOrdersSummary):
@@ -1230,24 +2417,34 @@ def print_position_info(oos: OpenOrdersSummary):
         LOG.info("No open orders")
 
 
-def connect_to_exchange():
+def connect_to_exchange(library=ccxt):
     """
     Connects to the exchange.
+    :param library: ccxt or ccxt.async_support
     :return exchange
     """
-    exchanges = {'binance': ccxt.binance,
-                 'bitfinex': ccxt.bitfinex,
-                 'bitmex': ccxt.bitmex,
-                 'coinbase': ccxt.coinbase,
-                 'kraken': ccxt.kraken,
-                 'liquid': ccxt.liquid}
+    exchanges = {'binance': library.binance,
+                 'bitfinex': library.bitfinex,
+                 'bitmex': library.bitmex,
+                 'coinbase': library.coinbase,
+                 'kraken': library.kraken,
+                 'liquid': library.liquid}
 
-    exchange = exchanges[CONF.exchange]({
+    if hasattr(CONF, 'simulate') and CONF.simulate:
+        import simulator
+        LOG.info('Simulating %s', CONF.exchange)
+        return simulator.SimulatedExchange(CONF.exchange, simulator.load_prices(CONF.simulate_prices),
+                                           symbol=CONF.symbol, base=CONF.base, quote=CONF.quote)
+
+    options = {
         'enableRateLimit': True,
         'apiKey': CONF.api_key,
         'secret': CONF.api_secret,
         # 'verbose': True,
-    })
+    }
+    if SESSION is not None and library is ccxt:
+        options['session'] = SESSION
+    exchange = exchanges[CONF.exchange](options)
 
     # pprint(dir(exchange))
 
@@ -1297,6 +2494,8 @@ def daily_report(immediately: bool = False):
     """
     Creates a daily report email around 12:10 UTC or immediately if told to do so
     It also triggers the creation of the daily stats, which will be persisted
+    Runs in the thread of the report worker, the bot state is taken from the snapshot published by the trading loop.
+    It only reads, the position is compacted by the trading loop (compact_daily)
     """
     global EMAIL_SENT
 
@@ -1305,30 +2504,62 @@ def daily_report(immediately: bool = False):
         if (immediately and datetime.datetime(2012, 1, 17, 12, 30).time() < now.time()) \
                 or datetime.datetime(2012, 1, 17, 12, 30).time() > now.time() \
                 > datetime.datetime(2012, 1, 17, 12, 10).time() and EMAIL_SENT != now.day:
-            compact_position()
+            started = time.time()
             subject = "Daily report for {}".format(CONF.bot_instance)
-            content = create_mail_content()
+            data = gather_report_data()
+            data.update((REPORTER.get_state() if REPORTER is not None else None) or create_state())
+            data['generation_time'] = time.time() - started
+            content = create_mail_content(data)
             filename_csv = CONF.bot_instance + '.csv'
             write_csv(content['csv'], filename_csv)
+            if CONF.history:
+                store_history(data)
             send_mail(subject, content['text'], filename_csv)
             EMAIL_SENT = now.day
+            if isinstance(EXCHANGE, RequestScheduler):
+                LOG.info('Request budget usage %s', EXCHANGE.get_usage())
+            if CADENCE is not None:
+                LOG.info('Polling cadence %s', CADENCE.get_stats())
+                CADENCE.reset()
+
+
+def gather_report_data():
+    """
+    Fetches the data required for the daily report. The reads are independent of each other and run concurrently,
+    scheduled with the report priority, so gathering takes about as long as the slowest of them.
+    :return dict with the results by name
+    """
+    reads = {'price': get_current_price, 'oos': get_open_orders, 'margin_balance': get_margin_balance,
+             'net_deposits': get_net_deposits, 'poi': get_position_info, 'wallet_balance': get_wallet_balance,
+             'interest_rate': get_interest_rate, 'position_balance': get_position_balance, 'mayer': fetch_mayer,
+             'moving_average': read_moving_average}
+    if CONF.exchange != 'liquid':
+        reads['margin_leverage'] = get_margin_leverage
+    if CONF.auto_quota:
+        reads['quota'] = calculate_quota
+    with concurrent.futures.ThreadPoolExecutor(len(reads), 'report') as executor:
+        futures = {name: executor.submit(with_priority('report')(read)) for name, read in reads.items()}
+        return {name: future.result() for name, future in futures.items()}
 
 
-def create_mail_content():
+def create_mail_content(data: dict = None):
     """
-    Fetches and formats the data required for the daily report email
+    Formats the data required for the daily report email
+    :param data: the gathered data, fetched if not given
     :return dict: text: str, csv: str
     """
-    price = get_current_price()
-    oos = get_open_orders()
-    performance_part = create_report_part_performance(price, oos)
-    advice_part = create_report_part_advice()
+    if data is None:
+        data = gather_report_data()
+        data.update(create_state())
+    oos = data['oos']
+    performance_part = create_report_part_performance(data)
+    advice_part = create_report_part_advice(data['moving_average'], data['mayer'])
     if oos.sell_orders:
-        highest_sell_order_price = sorted(oos.sell_orders, key=lambda order: order.price, reverse=True)[0].price
+        highest_sell_order_price = oos.sell_orders.highest().price
     else:
         highest_sell_order_price = None
-    settings_part = create_report_part_settings(price, highest_sell_order_price )
-    general_part = create_mail_part_general()
+    settings_part = create_report_part_settings(data.get('quota', CONF.quota), highest_sell_order_price)
+    general_part = create_mail_part_general(data)
 
     performance = ["Performance", "-----------", '\n'.join(performance_part['mail']) + '\n* (change within 24 hours)', '\n\n']
     advice = ["Assessment / advice", "-------------------", '\n'.join(advice_part['mail']), '\n\n']
@@ -1351,8 +2582,55 @@ def create_mail_content():
     return {'text': text, 'csv': csv}
 
 
-def create_report_part_settings(price: float, highest_sell_order_price: float):
-    quota = calculate_quota(price) if CONF.auto_quota else CONF.quota
+def create_history_record(data: dict):
+    """
+    Extracts the metrics of the daily report as typed values
+    :param data: the gathered data and the bot state
+    :return dict metric: value, None if not available
+    """
+    margin_balance = data['margin_balance']
+    oos = data['oos']
+    poi = data['poi']
+    mayer = data['mayer']
+    net_deposits = data['net_deposits']
+    all_sold_balance = None
+    if poi is not None:
+        all_sold_balance = calculate_all_sold_balance(poi, oos.sell_orders, margin_balance['total'])
+    return {'price': data['price'], 'wallet_balance': data['wallet_balance'],
+            'margin_balance': margin_balance['total'], 'available_balance': margin_balance['free'],
+            'all_sold_balance': all_sold_balance, 'net_deposits': net_deposits,
+            'performance': margin_balance['total'] - net_deposits if net_deposits is not None else None,
+            'liquidation_price': poi.get('liquidationPrice') if poi is not None else None,
+            'used_margin': calculate_used_margin_percentage(margin_balance),
+            'actual_leverage': data.get('margin_leverage'), 'position': data['position_balance'],
+            'buy_order_value': int(oos.total_buy_order_value), 'sell_order_value': int(oos.total_sell_order_value),
+            'buy_orders': len(oos.buy_orders), 'sell_orders': len(oos.sell_orders),
+            'highest_buy_order': oos.buy_orders.highest().price if oos.buy_orders else None,
+            'lowest_sell_order': oos.sell_orders.lowest().price if oos.sell_orders else None,
+            'interest_rate': data['interest_rate'],
+            'mayer_multiple': mayer['current'] if mayer is not None else None,
+            'mayer_average': mayer['average'] if mayer is not None else None,
+            'quota': data.get('quota', CONF.quota), 'change': CONF.change, 'spread_factor': CONF.spread_factor,
+            'leverage_default': CONF.leverage_default, 'leverage_low': CONF.leverage_low,
+            'leverage_high': CONF.leverage_high, 'leverage_escape': CONF.leverage_escape, 'mm_floor': CONF.mm_floor,
+            'mm_ceil': CONF.mm_ceil, 'mm_stop_buy': CONF.mm_stop_buy, 'resets': data['reset_counter'],
+            'polling_interval': data['cadence']['average'] if data['cadence'] is not None else None,
+            'generation_time': data.get('generation_time')}
+
+
+def store_history(data: dict):
+    """
+    Stores the metrics of the daily report in the history database
+    """
+    import history
+
+    try:
+        history.History(CONF.history).insert(CONF.bot_instance, time.time(), create_history_record(data))
+    except sqlite3.Error as error:
+        LOG.warning('Failed to store the report history %s %s', type(error).__name__, str(error.args))
+
+
+def create_report_part_settings(quota: int, highest_sell_order_price: float):
     part = {'mail': [], 'csv': []}
     append_settings_mail(part, quota, highest_sell_order_price)
     append_settings_csv(part, quota, highest_sell_order_price)
@@ -1415,20 +2693,23 @@ def get_close_on_top_value():
     return 'N'
 
 
-def create_mail_part_general():
+def create_mail_part_general(data: dict):
     general = ["Generated: {:>28}".format(str(datetime.datetime.utcnow().replace(microsecond=0)) + " UTC")]
     if AUTO_CONF:
         general.append("Resurrected at: {:>18} UTC".format(str(STARTED)))
     else:
         general.append("Running since: {:>20} UTC".format(str(STARTED)))
-    general.append("No. of resets: {:>20}".format(RESET_COUNTER))
+    general.append("No. of resets: {:>20}".format(data['reset_counter']))
     general.append("Bot: {:>30}".format(CONF.bot_instance + '@' + socket.gethostname()))
     general.append("Version: {:>26}".format(CONF.bot_version))
+    if data['cadence'] is not None:
+        general.append("Avg. polling interval: {:>11.1f}s".format(data['cadence']['average']))
+    if 'generation_time' in data:
+        general.append("Generation time: {:>17.1f}s".format(data['generation_time']))
     return general
 
 
-def create_report_part_advice():
-    moving_average = read_moving_average()
+def create_report_part_advice(moving_average: str, mayer: dict):
     if moving_average is not None:
         padding = 6 + len(moving_average)
         part = {'mail': ["Moving average 144d/21d: {:>{}}".format(moving_average, padding)],
@@ -1436,23 +2717,18 @@ def create_report_part_advice():
     else:
         part = {'mail': ["Moving average 144d/21d: {:>10}".format('n/a')],
                 'csv': ["Moving average 144d/21d:;n/a;n/a;n/a"]}
-    append_mayer(part)
+    append_mayer(part, mayer)
     return part
 
 
-def create_report_part_performance(price: float, oos: OpenOrdersSummary):
+def create_report_part_performance(data: dict):
     part = {'mail': [], 'csv': []}
-    margin_balance = get_margin_balance()
-    net_deposits = get_net_deposits()
-    sleep_for(0, 1)
-    append_performance(part, margin_balance['total'], net_deposits)
-    poi = get_position_info()
-    wallet_balance = get_wallet_balance()
-    sleep_for(0, 1)
-    all_sold_balance = calculate_all_sold_balance(poi, oos.sell_orders, margin_balance['total'])
-    append_balances(part, margin_balance, poi, wallet_balance, price, all_sold_balance)
-    append_orders(part, oos, price)
-    append_interest_rate(part)
+    margin_balance = data['margin_balance']
+    append_performance(part, margin_balance['total'], data['net_deposits'])
+    all_sold_balance = calculate_all_sold_balance(data['poi'], data['oos'].sell_orders, margin_balance['total'])
+    append_balances(part, data, all_sold_balance)
+    append_orders(part, data['oos'], data['price'])
+    append_interest_rate(part, data['interest_rate'])
     return part
 
 
@@ -1472,7 +2748,7 @@ def append_orders(part: dict, oos: OpenOrdersSummary, price: float):
 
 
 def append_order_offset(part: dict, oos: OpenOrdersSummary, price: float):
-    highest_buy = oos.buy_orders[0].price if oos.buy_orders else None
+    highest_buy = oos.buy_orders.highest().price if oos.buy_orders else None
     if highest_buy is not None:
         buy_offset = calculate_price_offset(highest_buy, price)
         part['mail'].append("Highest buy order {}: {:>12} ({}% below actual {} price)".format(CONF.quote,
@@ -1484,7 +2760,7 @@ def append_order_offset(part: dict, oos: OpenOrdersSummary, price: float):
         part['mail'].append("Highest buy order {}: {:>12}".format(CONF.quote, 'n/a'))
         part['csv'].append("Highest buy order {}:;{}".format(CONF.quote, 'n/a'))
 
-    lowest_sell = oos.sell_orders[-1].price if oos.sell_orders else None
+    lowest_sell = oos.sell_orders.lowest().price if oos.sell_orders else None
     if lowest_sell is not None:
         sell_offset = calculate_price_offset(lowest_sell, price)
         part['mail'].append("Lowest sell order {}: {:>12} ({}% above actual {} price)".format(CONF.quote,
@@ -1497,8 +2773,7 @@ def append_order_offset(part: dict, oos: OpenOrdersSummary, price: float):
         part['csv'].append("Lowest sell order {}:;{}".format(CONF.quote, 'n/a'))
 
 
-def append_interest_rate(part: dict):
-    interest_rate = get_interest_rate()
+def append_interest_rate(part: dict, interest_rate: float):
     if interest_rate is not None:
         part['mail'].append("Interest rate: {:>+20.2f}%".format(interest_rate))
         part['csv'].append("Interest rate:;{:+.2f}%".format(interest_rate))
@@ -1507,11 +2782,14 @@ def append_interest_rate(part: dict):
         part['csv'].append("Interest rate:;{}".format('n/a'))
 
 
-def append_balances(part: dict, margin_balance: dict, poi: dict, wallet_balance: float, price: float,
-                    all_sold_balance: float = None):
+def append_balances(part: dict, data: dict, all_sold_balance: float = None):
     """
     Appends liquidation price, wallet balance, margin balance (including stats), used margin and leverage information
     """
+    margin_balance = data['margin_balance']
+    poi = data['poi']
+    wallet_balance = data['wallet_balance']
+    price = data['price']
     part['mail'].append("Wallet balance {}: {:>18.4f}".format(CONF.base, wallet_balance))
     part['csv'].append("Wallet balance {}:;{:.4f}".format(CONF.base, wallet_balance))
     today = calculate_daily_statistics(margin_balance['total'], price)
@@ -1525,6 +2803,7 @@ def append_balances(part: dict, margin_balance: dict, poi: dict, wallet_balance:
         part['mail'].append("All sold balance: {:>17}".format('n/a'))
         part['csv'].append("All sold balance:;n/a")
     append_price_change(part, today, price)
+    append_long_term_changes(part, today)
     if poi is not None and 'liquidationPrice' in poi:
         part['mail'].append("Liquidation price {}: {:>12.1f}".format(CONF.quote, poi['liquidationPrice']))
         part['csv'].append("Liquidation price {}:;{:.1f}".format(CONF.quote, poi['liquidationPrice']))
@@ -1535,17 +2814,17 @@ def append_balances(part: dict, margin_balance: dict, poi: dict, wallet_balance:
     part['mail'].append("Used margin: {:>22.2f}%".format(used_margin))
     part['csv'].append("Used margin:;{:.2f}%".format(used_margin))
     if CONF.exchange == 'kraken':
-        actual_leverage = get_margin_leverage()
+        actual_leverage = data['margin_leverage']
         part['mail'].append("Actual leverage: {:>18.2f}%".format(actual_leverage))
         part['csv'].append("Actual leverage:;{:.2f}%".format(actual_leverage))
     elif CONF.exchange == 'liquid':
         part['mail'].append("Actual leverage: {:>18}".format('n/a'))
         part['csv'].append("Actual leverage:;{}".format('n/a'))
     else:
-        actual_leverage = get_margin_leverage()
+        actual_leverage = data['margin_leverage']
         part['mail'].append("Actual leverage: {:>18.2f}x".format(actual_leverage))
         part['csv'].append("Actual leverage:;{:.2f}".format(actual_leverage))
-    used_balance = get_position_balance()
+    used_balance = data['position_balance']
     part['mail'].append("Position {}: {:>21}".format(CONF.quote, used_balance))
     part['csv'].append("Position {}:;{}".format(CONF.quote, used_balance))
 
@@ -1607,6 +2886,15 @@ def append_price_change(part: dict, today: dict, price: float):
         part['csv'].append("{} price {}:;{:.1f};% n/a".format(CONF.base, CONF.quote, price))
 
 
+def append_long_term_changes(part: dict, today: dict):
+    """
+    Appends the changes of the margin balance and the price within 7 and 30 days
+    """
+    for label, key in (('Margin balance', 'mBalChan'), ('Price', 'priceChan')):
+        changes = ['{:+.2f}%'.format(today[key + days]) if key + days in today else 'n/a' for days in ('7d', '30d')]
+        part['mail'].append("{} 7d/30d: {:>{}}".format(label, ' / '.join(changes), 26 - len(label)))
+
+
 def calculate_all_sold_balance(poi: dict, sell_orders: [Order], margin_balance: float):
     if CONF.exchange == 'bitmex':
         sells = calculate_order_stats(sell_orders)
@@ -1625,29 +2913,33 @@ def calculate_price_offset(order_price: float, market_price: float):
 
 def write_csv(csv: str, filename_csv: str):
     if not is_already_written(filename_csv):
-        if int(datetime.date.today().strftime("%j")) == 1:
-            last_line = read_last_line(filename_csv)
-            if last_line is not None:
-                csv = last_line + csv
-            write_mode = 'w'
-        else:
-            write_mode = 'a'
-        with open(filename_csv, write_mode) as file:
-            file.write(csv)
+        CsvStore(filename_csv).append(csv)
 
 
 def is_already_written(filename_csv: str):
-    last_line = read_last_line(filename_csv)
-    if last_line is not None:
-        return str(datetime.date.today().isoformat()) in last_line
-    return False
+    return CsvStore(filename_csv).get_last_date() == datetime.date.today().isoformat()
 
 
 def read_last_line(filename_csv: str):
-    if os.path.isfile(filename_csv):
-        with open(filename_csv, 'r') as file:
-            return list(file)[-1]
-    return None
+    """
+    Reads the last line by seeking backwards from the end of the file, block by block
+    :return the line including its line break or None if there is none
+    """
+    if not os.path.isfile(filename_csv):
+        return None
+    with open(filename_csv, 'rb') as file:
+        position = file.seek(0, os.SEEK_END)
+        tail = b''
+        while position > 0:
+            step = min(CsvStore.BLOCK, position)
+            position -= step
+            file.seek(position)
+            tail = file.read(step) + tail
+            # the line break terminating the last line does not count
+            start = tail.rfind(b'\n', 0, len(tail) - 1)
+            if start >= 0:
+                return tail[start + 1:].decode()
+    return tail.decode() if tail else None
 
 
 def send_mail(subject: str, text: str, attachment: str = None):
@@ -1656,6 +2948,8 @@ def send_mail(subject: str, text: str, attachment: str = None):
     msg['Subject'] = subject
     msg['From'] = CONF.sender_address
     msg['To'] = recipients
+    # the mail may be delivered later from the outbox
+    msg['Date'] = formatdate(localtime=True)
 
     readable_part = MIMEMultipart('alternative')
     readable_part.attach(MIMEText(text, 'plain', 'utf-8'))
@@ -1671,8 +2965,14 @@ def send_mail(subject: str, text: str, attachment: str = None):
         part.add_header('Content-Disposition', "attachment; filename={}".format(attachment))
         msg.attach(part)
 
-    server = smtplib.SMTP(CONF.mail_server, 587)
-    server.starttls()
+    if OUTBOX is not None:
+        # the report of a day is sent once, even if it was created twice
+        OUTBOX.put(msg, create_mail_key(subject, text, recipients))
+        return
+
+    server = smtplib.SMTP(CONF.mail_server, CONF.mail_port, timeout=mailer.TIMEOUT)
+    if CONF.mail_starttls:
+        server.starttls()
     server.set_debuglevel(0)
     server.login(CONF.sender_address, CONF.sender_password)
     server.send_message(msg)
@@ -1680,44 +2980,60 @@ def send_mail(subject: str, text: str, attachment: str = None):
     LOG.info("Sent email to %s", recipients)
 
 
+def create_mail_key(subject: str, text: str, recipients: str):
+    """
+    :return the key identifying duplicates of a mail, the time of generation in the text is not taken into account
+    """
+    text = '\n'.join(line for line in text.splitlines() if not line.startswith(('Generated:', 'Generation time:')))
+    return hashlib.sha256('\n'.join((subject, recipients, text)).encode()).hexdigest()
+
+
 def calculate_daily_statistics(m_bal: float, price: float):
     """
-    Calculates, updates and persists the change in the margin balance compared with yesterday
+    Calculates, updates and persists the change in the margin balance compared with yesterday, a week and a month ago
     :param m_bal: todays margin balance
     :param price: the current rate
-    :return todays statistics including price and margin balance changes compared with 24 hours ago
+    :return todays statistics including price and margin balance changes compared with 24 hours, 7 and 30 days ago
     """
     global STATS
 
     today = {'mBal': m_bal, 'price': price}
+    day = datetime.date.today().toordinal()
     if STATS is None:
-        STATS = Stats(int(datetime.date.today().strftime("%Y%j")), today)
-        persist_statistics()
-        return today
-
-    STATS.add_day(int(datetime.date.today().strftime("%Y%j")), today)
-    persist_statistics()
-    before_24h = STATS.get_day(int(datetime.date.today().strftime("%Y%j")) - 1)
-    if before_24h is not None:
-        today['mBalChan24'] = round((today['mBal']/before_24h['mBal']-1) * 100, 2)
-        if 'price' in before_24h:
-            today['priceChan24'] = round((today['price']/before_24h['price']-1) * 100, 2)
+        STATS = Stats(CONF.stats_days)
+    if STATS.add_day(day, today):
+        persist_statistics(day)
+    for suffix, days in (('24', 1), ('7d', 7), ('30d', 30)):
+        before = STATS.get_day(day - days)
+        if before is not None:
+            today['mBalChan' + suffix] = round((today['mBal']/before['mBal']-1) * 100, 2)
+            if 'price' in before:
+                today['priceChan' + suffix] = round((today['price']/before['price']-1) * 100, 2)
     return today
 
 
 def load_statistics():
-    content = None
-    stats_file = CONF.bot_instance + '.pkl'
+    """
+    Reads the statistics, taking over the pickle (.pkl) of former versions if there are none yet
+    :return Stats or None
+    """
+    stats_file = CONF.bot_instance + '.stats'
     if os.path.isfile(stats_file):
-        with open(stats_file, "rb") as file:
-            content = pickle.load(file)
-    return content
+        return Stats.read(stats_file, CONF.stats_days)
+    legacy_file = CONF.bot_instance + '.pkl'
+    if os.path.isfile(legacy_file):
+        with open(legacy_file, "rb") as file:
+            stats = Stats.convert(LegacyUnpickler(file).load(), CONF.stats_days)
+        stats.write(stats_file)
+        return stats
+    return None
 
 
-def persist_statistics():
-    stats_file = CONF.bot_instance + '.pkl'
-    with open(stats_file, "wb") as file:
-        pickle.dump(STATS, file)
+def persist_statistics(day: int):
+    """
+    Appends the statistics of the day to the statistics file
+    """
+    STATS.append(CONF.bot_instance + '.stats', day)
 
 
 def read_moving_average():
@@ -1729,23 +3045,23 @@ def read_moving_average():
     return None
 
 
-def fetch_mayer(tries: int = 0):
-    try:
-        response = requests.get('https://mayermultiple.info/current.json')
-        mayer = response.json()['data']
-        return {'current': float(mayer['current_mayer_multiple']), 'average': float(mayer['average_mayer_multiple'])}
-
-    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout, requests.exceptions.ReadTimeout) as error:
-        LOG.error(RETRY_MESSAGE, type(error).__name__, str(error.args))
-        sleep_for(4, 6)
-        if tries < 4:
-            return fetch_mayer(tries+1)
-        LOG.warning('Failed to fetch Mayer multiple, giving up after 4 attempts')
-        return None
+@retrying(deadline=30, errors=(requests.exceptions.ConnectionError, requests.exceptions.Timeout),
+          give_up_silently=True)
+def fetch_mayer():
+    if BROKER is not None:
+        mayer = BROKER.get_mayer(CONF.mayer_ttl)
+        if mayer is not None:
+            return mayer
+    if MAYER is not None:
+        return MAYER.get()
+    response = requests.get(MayerService.URL, timeout=MayerService.TIMEOUT)
+    mayer = response.json()['data']
+    return {'current': float(mayer['current_mayer_multiple']), 'average': float(mayer['average_mayer_multiple'])}
 
 
-def print_mayer():
-    mayer = fetch_mayer()
+def print_mayer(mayer: dict = None):
+    if mayer is None:
+        mayer = fetch_mayer()
     if mayer is not None:
         if mayer['current'] < mayer['average']:
             return "Mayer multiple: {:>19.2f} (< {:.2f} = BUY)".format(mayer['current'], mayer['average'])
@@ -1755,8 +3071,8 @@ def print_mayer():
     return None
 
 
-def append_mayer(part: dict):
-    text = print_mayer()
+def append_mayer(part: dict, mayer: dict = None):
+    text = print_mayer(mayer)
     if text is not None:
         part['mail'].append(text)
         part['csv'].append(text.replace('  ', '').replace('(', '').replace(')', '').replace(':', ':;').replace(' = ', ';'))
@@ -1822,28 +3138,25 @@ def get_target_leverage(mayer: dict):
     return CONF.leverage_default
 
 
+@retrying()
 def get_leverage():
-    try:
-        if CONF.exchange == 'bitmex':
-            return float(EXCHANGE.private_get_position({'symbol': CONF.symbol})[0]['leverage'])
-        if CONF.exchange == 'liquid':
-            response = EXCHANGE.private_get_trading_accounts()
-            for pos in response:
-                if pos['currency_pair_code'] == CONF.symbol:
-                    return pos['leverage_level']
-        LOG.error("get_leverage() not yet implemented for %s", CONF.exchange)
-        return None
-
-    except (ccxt.ExchangeError, ccxt.NetworkError) as error:
-        LOG.error(RETRY_MESSAGE, type(error).__name__, str(error.args))
-        sleep_for(4, 6)
-        get_leverage()
+    if CONF.exchange == 'bitmex':
+        return float(fetch_account('private_get_position', {'symbol': CONF.symbol})[0]['leverage'])
+    if CONF.exchange == 'liquid':
+        response = fetch_account('private_get_trading_accounts')
+        for pos in response:
+            if pos['currency_pair_code'] == CONF.symbol:
+                return pos['leverage_level']
+    LOG.error("get_leverage() not yet implemented for %s", CONF.exchange)
+    return None
 
 
+@retrying()
 def set_leverage(new_leverage: float):
     try:
         if CONF.exchange != 'liquid':
             EXCHANGE.private_post_position_leverage({'symbol': CONF.symbol, 'leverage': new_leverage})
+            invalidate_account()
             LOG.info('New leverage is {:.1f}'.format(new_leverage))
         return True
 
@@ -1851,9 +3164,7 @@ def set_leverage(new_leverage: float):
         if any(e in str(error.args) for e in STOP_ERRORS):
             LOG.warning('Insufficient available balance - not lowering leverage to {:.1f}'.format(new_leverage))
             return False
-        LOG.error(RETRY_MESSAGE, type(error).__name__, str(error.args))
-        sleep_for(4, 6)
-        set_leverage(new_leverage)
+        raise
 
 
 def calculate_quota(price: float = None):
@@ -1879,87 +3190,288 @@ def compact_position():
             leverage -= 0.1
 
 
+def compact_daily():
+    """
+    Compacts the position once a day around 12:10 UTC, right before the daily report. Called by the trading loop
+    """
+    global COMPACTED
+
+    now = datetime.datetime.utcnow()
+    if CONF.send_emails and COMPACTED != now.day and datetime.datetime(2012, 1, 17, 12, 30).time() > now.time() \
+            > datetime.datetime(2012, 1, 17, 12, 10).time():
+        compact_position()
+        COMPACTED = now.day
+
+
 def deactivate_bot():
     os.remove(INSTANCE + '.pid')
     text = "Deactivated {}".format(INSTANCE)
     LOG.error(text)
     send_mail(text, text)
+    flush_outbox()
     exit(0)
 
 
-# ------------------------------------------------------------------------------
-if __name__ == '__main__':
-    print('Starting Hold n Trade Bot')
-    print('ccxt version:', ccxt.__version__)
+def flush_outbox():
+    """
+    Gives the outbox a few seconds to deliver before the bot exits, what is left is delivered after the next start
+    """
+    if OUTBOX is not None:
+        OUTBOX.flush(CONF.mail_flush_timeout)
+        OUTBOX.stop()
 
-    if len(sys.argv) > 1:
-        INSTANCE = os.path.basename(sys.argv[1])
-        if len(sys.argv) > 2:
-            if sys.argv[2] == '-ac':
+
+def read_arguments(argv: [str]):
+    """
+    Reads the instance name and the optional mode (-ac, -eo, -pi) from the command line arguments
+    """
+    global INSTANCE
+    global AUTO_CONF
+    global EMAIL_ONLY
+    global POSITION_INFO
+
+    if len(argv) > 1:
+        INSTANCE = os.path.basename(argv[1])
+        if len(argv) > 2:
+            if argv[2] == '-ac':
                 AUTO_CONF = True
-            elif sys.argv[2] == '-eo':
+            elif argv[2] == '-eo':
                 EMAIL_ONLY = True
-            elif sys.argv[2] == '-pi':
+            elif argv[2] == '-pi':
                 POSITION_INFO = True
     else:
         INSTANCE = os.path.basename(input('Filename with API Keys (config): ') or 'config')
-    LOG_FILENAME = 'log' + os.path.sep + INSTANCE
 
-    if not EMAIL_ONLY and not POSITION_INFO:
-        write_control_file()
+
+def setup():
+    """
+    Sets up logging, configuration, exchange connection and caches of the bot instance
+    """
+    global LOG
+    global CONF
+    global EXCHANGE
+    global ACCOUNT
+    global TICKER
+    global MAYER
+    global STATS
+    global FEED
+    global BROKER
+    global CADENCE
+    global REPORTER
+    global OUTBOX
+    global SELL_ORDERS
+    global BUY_ORDERS
 
     if not os.path.exists('log'):
         os.makedirs('log')
 
-    LOG = function_logger(logging.DEBUG, LOG_FILENAME, logging.INFO)
+    LOG = function_logger(logging.DEBUG, 'log' + os.path.sep + INSTANCE, logging.INFO)
     LOG.info('----------------------------------')
     CONF = ExchangeConfig()
     LOG.info('Holdntrade version: %s', CONF.bot_version)
-    EXCHANGE = connect_to_exchange()
+    EXCHANGE = RequestScheduler(connect_to_exchange())
+    ACCOUNT = AccountSnapshot()
+    TICKER = PriceTicker(CONF.price_max_age)
+    MAYER = MayerService(CONF.mayer_ttl, CONF.bot_instance + '.mayer', SESSION)
+    SELL_ORDERS = OrderBook()
+    BUY_ORDERS = OrderBook()
     STATS = load_statistics()
+    if CONF.fill_tracking == 'cursor' and CONF.exchange not in CLOSED_SINCE_UPDATE:
+        LOG.warning('Fill tracking by cursor is not supported by %s, polling the open orders', CONF.exchange)
+    if CONF.stream:
+        FEED = start_feed()
+    if CONF.broker:
+        import broker
+
+        BROKER = broker.BrokerReader(CONF.broker)
+    if CONF.cadence_max:
+        CADENCE = Cadence(CONF.cadence_max, CONF.change)
+    REPORTER = ReportWorker()
+    OUTBOX = mailer.Outbox(CONF.bot_instance + '.outbox', CONF.mail_server, CONF.sender_address,
+                           CONF.sender_password, CONF.mail_port, CONF.mail_starttls, log=LOG)
+    OUTBOX.start()
+
+
+def start_feed():
+    """
+    Starts receiving the order, execution and price updates pushed by the exchange
+    :return the running feed or None
+    """
+    if CONF.exchange != 'bitmex':
+        LOG.error("start_feed() not yet implemented for %s", CONF.exchange)
+        return None
+    import feed
+
+    url = feed.BITMEX_TEST_URL if CONF.test else feed.BITMEX_URL
+    stream = feed.BitmexFeed(url, CONF.symbol, CONF.api_key, CONF.api_secret, TICKER.update, LOG)
+    stream.start()
+    LOG.info('Listening to %s', url)
+    return stream
+
+
+def track_fills():
+    """
+    Gathers the ids of the open orders according to the configured fill tracking. While the feed is connected the
+    orders closed are pushed by the exchange and the open orders are only fetched to reconcile from time to time.
+    :return set of order ids or None if they could not be determined
+    """
+    global LAST_RECONCILE
+
+    if FEED is not None:
+        closed_ids = FEED.pop_closed_ids()
+        if FEED.connected and time.time() - LAST_RECONCILE < CONF.stream_reconcile:
+            return exclude_closed(closed_ids)
+        LAST_RECONCILE = time.time()
+    if CONF.fill_tracking == 'cursor' and CONF.exchange in CLOSED_SINCE_UPDATE:
+        return get_unfilled_order_ids()
+    return get_open_order_ids()
+
+
+def trade(open_ids: set = None):
+    """
+    One pass of the main loop while not hibernating
+    :param open_ids: ids of the open orders if already known
+    """
+    global LOOP
+    global HIBERNATE
+    global INITIAL_LEVERAGE_SET
+
+    if LOOP:
+        if open_ids is None:
+            open_ids = track_fills()
+        buy_executed(open_ids)
+        sell_executed(open_ids)
+        advance_fill_cursor()
+        if not SELL_ORDERS:
+            if not CONF.stop_on_top:
+                LOG.info('No sell orders, resetting all orders')
+                LOOP = init_orders(True, False)
+            else:
+                HIBERNATE = True
+                if CONF.stop_on_top and CONF.close_on_stop:
+                    close_position(CONF.symbol)
+        else:
+            spread(get_current_price())
+    if not LOOP:
+        adjust_leverage()
+        compensate()
+        if not CONF.stop_on_top:
+            if not INITIAL_LEVERAGE_SET:
+                INITIAL_LEVERAGE_SET = set_initial_leverage()
+            if not SELL_ORDERS:
+                create_first_sell_order()
+            if not BUY_ORDERS:
+                create_first_buy_order()
+        LOG.info('Initialization complete')
+        LOOP = True
+
+
+def shall_sleep():
+    """
+    Decides at the begin of every pass of the main loop whether the bot hibernates
+    :return True if hibernating
+    """
+    global HIBERNATE
+
+    invalidate_account()
+    if not SELL_ORDERS and CONF.stop_on_top and CONF.close_on_stop:
+        HIBERNATE = True
+    if HIBERNATE:
+        LOG.info('Going to hibernate')
+    return HIBERNATE
+
+
+def wake_up(reason: str = None):
+    """
+    Adjusts the leverage after hibernating and decides whether to continue hibernating. If the price reached the
+    lowest sell order, the sell orders filled meanwhile are handled first.
+    :param reason: the wake condition which fired
+    """
+    global HIBERNATE
+    global PRICE_WOKEN
+
+    if reason is not None and reason.startswith('price') and SELL_ORDERS:
+        # the price condition is armed again only once there is a new lowest sell order
+        PRICE_WOKEN = SELL_ORDERS.lowest().id
+        sell_executed(track_fills())
+        advance_fill_cursor()
+    adjust_leverage()
+    HIBERNATE = shall_hibernate()
+
+
+def create_wake_conditions():
+    """
+    Registers the conditions ending the hibernation
+    :return WakeConditions
+    """
+    lowest = SELL_ORDERS.lowest() if SELL_ORDERS else None
+    price_above = lowest.price if lowest is not None and lowest.id != PRICE_WOKEN else None
+    return WakeConditions(fetch_mayer(), price_above)
+
+
+def hibernate():
+    """
+    Sleeps until a wake condition fires, then wakes up
+    """
+    reason = create_wake_conditions().wait()
+    LOG.info('Waking up: %s', reason)
+    wake_up(reason)
+
+
+def create_state():
+    """
+    :return a snapshot of the bot state shown in the daily report
+    """
+    return {'reset_counter': RESET_COUNTER, 'cadence': CADENCE.get_stats() if CADENCE is not None else None}
+
+
+def publish_state():
+    """
+    Hands a snapshot of the bot state to the report worker
+    """
+    if REPORTER is not None:
+        REPORTER.publish(create_state())
+
+
+def run():
+    REPORTER.start()
+    try:
+        while True:
+            if not shall_sleep():
+                trade()
+                compact_daily()
+                publish_state()
+                if CADENCE is not None:
+                    CADENCE.wait()
+                elif FEED is not None and FEED.connected:
+                    FEED.wait_for_fill(5)
+            else:
+                publish_state()
+                hibernate()
+    finally:
+        REPORTER.stop()
+        OUTBOX.stop()
+
+
+# ------------------------------------------------------------------------------
+if __name__ == '__main__':
+    print('Starting Hold n Trade Bot')
+    print('ccxt version:', ccxt.__version__)
+
+    read_arguments(sys.argv)
+
+    if not EMAIL_ONLY and not POSITION_INFO:
+        write_control_file()
+
+    setup()
 
     if EMAIL_ONLY:
         daily_report(True)
+        flush_outbox()
         exit(0)
     if POSITION_INFO:
         write_position_info(json.dumps(get_position_info(), indent=4))
         exit(0)
 
     LOOP = init_orders(False, AUTO_CONF)
-
-    while True:
-        if not SELL_ORDERS and CONF.stop_on_top and CONF.close_on_stop:
-            HIBERNATE = True
-        if not HIBERNATE:
-            if LOOP:
-                daily_report()
-                buy_executed()
-                sell_executed()
-                if not SELL_ORDERS:
-                    if not CONF.stop_on_top:
-                        LOG.info('No sell orders, resetting all orders')
-                        LOOP = init_orders(True, False)
-                    else:
-                        HIBERNATE = True
-                        if CONF.stop_on_top and CONF.close_on_stop:
-                            close_position(CONF.symbol)
-                else:
-                    spread(get_current_price())
-            if not LOOP:
-                adjust_leverage()
-                compensate()
-                if not CONF.stop_on_top:
-                    if not INITIAL_LEVERAGE_SET:
-                        INITIAL_LEVERAGE_SET = set_initial_leverage()
-                    if not SELL_ORDERS:
-                        create_first_sell_order()
-                    if not BUY_ORDERS:
-                        create_first_buy_order()
-                LOG.info('Initialization complete')
-                LOOP = True
-        else:
-            daily_report()
-            LOG.info('Going to hibernate')
-            sleep_for(600, 900)
-            adjust_leverage()
-            HIBERNATE = shall_hibernate()
+    run()
@@ -0,0 +1,149 @@
+#!/usr/bin/python
+import asyncio
+import json
+import sys
+
+import ccxt
+import ccxt.async_support as ccxt_async
+
+import holdntrade
+
+# account endpoints read once per iteration, by exchange
+ACCOUNT_READS = {'bitmex': ['fetch_balance', 'private_get_position'],
+                 'kraken': ['fetch_balance', 'private_post_tradebalance'],
+                 'liquid': ['private_get_trading_accounts', 'private_get_accounts_balance']}
+# exchanges expecting the nonces of an api key in increasing order, their private requests are sent one by one
+SEQUENTIAL = ['kraken']
+
+
+def schedule(exchange, name: str, *args, **kwargs):
+    """
+    Takes the request from the budget of the request scheduler of holdntrade, if there is one
+    :param exchange: async exchange
+    :param name: name of the request method
+    :return awaitable response
+    """
+    if isinstance(holdntrade.EXCHANGE, holdntrade.RequestScheduler):
+        return holdntrade.EXCHANGE.request(exchange, name, *args, **kwargs)
+    return getattr(exchange, name)(*args, **kwargs)
+
+
+async def in_order(requests: list):
+    """
+    Awaits the requests one after the other
+    :return list of the responses or the errors raised
+    """
+    results = []
+    for request in requests:
+        try:
+            results.append(await request)
+        except Exception as error:
+            results.append(error)
+    return results
+
+
+async def prefetch(exchange, open_orders: bool = True):
+    """
+    Issues the independent reads of one iteration (ticker, account, open orders) concurrently and hands the responses
+    to the caches of holdntrade. On exchanges in SEQUENTIAL the private reads are sent one after the other, only the
+    ticker runs alongside them
+    :param exchange: async exchange
+    :param open_orders: whether the open orders are fetched
+    :return set of open order ids or None if they were not fetched
+    """
+    conf = holdntrade.CONF
+    open_orders = open_orders and not (conf.fill_tracking == 'cursor' and
+                                       conf.exchange in holdntrade.CLOSED_SINCE_UPDATE)
+    reads = ACCOUNT_READS.get(conf.exchange, [])
+    private = [schedule(exchange, read) for read in reads]
+    if open_orders:
+        limit = 500 if conf.exchange == 'bitmex' else None
+        private.append(schedule(exchange, 'fetch_open_orders', conf.pair, since=None, limit=limit, params={}))
+    ticker = schedule(exchange, 'fetch_ticker', conf.pair)
+    if conf.exchange in SEQUENTIAL:
+        results = await asyncio.gather(ticker, in_order(private), return_exceptions=True)
+        results = [results[0]] + results[1]
+    else:
+        results = await asyncio.gather(ticker, *private, return_exceptions=True)
+
+    for result in results:
+        if isinstance(result, Exception):
+            holdntrade.LOG.error('Prefetch failed %s %s', type(result).__name__, str(result.args))
+    ticker = results[0]
+    if not isinstance(ticker, Exception) and ticker['bid']:
+        holdntrade.TICKER.update(ticker['bid'])
+    for read, response in zip(reads, results[1:]):
+        if not isinstance(response, Exception):
+            holdntrade.ACCOUNT.put(read, response)
+    if open_orders:
+        orders = results[-1]
+        if not isinstance(orders, Exception):
+            return {order['id'] for order in orders}
+    return None
+
+
+async def run(exchange):
+    """
+    The main loop of holdntrade with concurrent reads and non-blocking waits.
+    The decisions and order placements run in a worker thread, so the event loop stays responsive.
+    """
+    loop = asyncio.get_event_loop()
+    holdntrade.REPORTER.start()
+    try:
+        while True:
+            if not await loop.run_in_executor(None, holdntrade.shall_sleep):
+                # with a feed the fills are pushed, trade() reconciles with the open orders when due
+                open_ids = await prefetch(exchange, holdntrade.FEED is None) if holdntrade.LOOP else None
+                await loop.run_in_executor(None, holdntrade.trade, open_ids)
+                await loop.run_in_executor(None, holdntrade.compact_daily)
+                holdntrade.publish_state()
+                if holdntrade.CADENCE is not None:
+                    await holdntrade.CADENCE.pause(loop)
+            else:
+                holdntrade.publish_state()
+                conditions = await loop.run_in_executor(None, holdntrade.create_wake_conditions)
+                reason = await loop.run_in_executor(None, conditions.check)
+                while reason is None:
+                    await asyncio.sleep(conditions.INTERVAL)
+                    reason = await loop.run_in_executor(None, conditions.check)
+                holdntrade.LOG.info('Waking up: %s', reason)
+                await loop.run_in_executor(None, holdntrade.wake_up, reason)
+    finally:
+        holdntrade.REPORTER.stop()
+        holdntrade.OUTBOX.stop()
+
+
+async def main():
+    if holdntrade.CONF.simulate:
+        raise SystemExit('Simulation is not supported by holdntrade_async.py, use holdntrade.py')
+    exchange = holdntrade.connect_to_exchange(ccxt_async)
+    # the request scheduler of holdntrade paces both clients
+    exchange.enableRateLimit = False
+    try:
+        holdntrade.LOOP = await asyncio.get_event_loop().run_in_executor(None, holdntrade.init_orders, False,
+                                                                         holdntrade.AUTO_CONF)
+        await run(exchange)
+    finally:
+        await exchange.close()
+
+
+if __name__ == '__main__':
+    print('Starting Hold n Trade Bot (asyncio)')
+    print('ccxt version:', ccxt.__version__)
+
+    holdntrade.read_arguments(sys.argv)
+
+    if not holdntrade.EMAIL_ONLY and not holdntrade.POSITION_INFO:
+        holdntrade.write_control_file()
+
+    holdntrade.setup()
+
+    if holdntrade.EMAIL_ONLY:
+        holdntrade.daily_report(True)
+        holdntrade.flush_outbox()
+        sys.exit(0)
+    if holdntrade.POSITION_INFO:
+        holdntrade.write_position_info(json.dumps(holdntrade.get_position_info(), indent=4))
+        sys.exit(0)
+
+    asyncio.run(main())
@@ -0,0 +1,167 @@
+import asyncio
+import unittest
+from unittest import mock
+from unittest.mock import patch
+
+import ccxt
+
+import holdntrade
+import holdntrade_async
+
+
+class HoldntradeAsyncTest(unittest.TestCase):
+
+    @patch('holdntrade.logging')
+    def test_prefetch_should_fill_caches_and_return_open_order_ids(self, mock_logging):
+        holdntrade.CONF = self.create_default_conf()
+        holdntrade.LOG = mock_logging
+        holdntrade.ACCOUNT = holdntrade.AccountSnapshot()
+        holdntrade.TICKER = holdntrade.PriceTicker(60)
+        exchange = mock.MagicMock()
+        exchange.fetch_ticker = mock.AsyncMock(return_value={'bid': 9000})
+        exchange.fetch_balance = mock.AsyncMock(return_value={'BTC': {'used': 1, 'free': 1, 'total': 2}})
+        exchange.private_get_position = mock.AsyncMock(return_value=[{'currentQty': 100}])
+        exchange.fetch_open_orders = mock.AsyncMock(return_value=[{'id': '1s'}, {'id': '1b'}])
+        holdntrade.EXCHANGE = None
+        try:
+            open_ids = asyncio.run(holdntrade_async.prefetch(exchange))
+
+            self.assertEqual({'1s', '1b'}, open_ids)
+            self.assertEqual(9000, holdntrade.get_current_price())
+            self.assertEqual(100, holdntrade.get_position_balance())
+            self.assertEqual(2, holdntrade.get_balance()['total'])
+        finally:
+            holdntrade.EXCHANGE = None
+            holdntrade.ACCOUNT = None
+            holdntrade.TICKER = None
+
+    @patch('holdntrade.logging')
+    def test_prefetch_should_tolerate_failing_reads(self, mock_logging):
+        holdntrade.CONF = self.create_default_conf()
+        holdntrade.LOG = mock_logging
+        holdntrade.ACCOUNT = holdntrade.AccountSnapshot()
+        holdntrade.TICKER = holdntrade.PriceTicker(60)
+        exchange = mock.MagicMock()
+        exchange.fetch_ticker = mock.AsyncMock(return_value={'bid': 9000})
+        exchange.fetch_balance = mock.AsyncMock(side_effect=ccxt.NetworkError('timeout'))
+        exchange.private_get_position = mock.AsyncMock(return_value=[{'currentQty': 100}])
+        exchange.fetch_open_orders = mock.AsyncMock(side_effect=ccxt.NetworkError('timeout'))
+        holdntrade.EXCHANGE = None
+        try:
+            open_ids = asyncio.run(holdntrade_async.prefetch(exchange))
+
+            self.assertIsNone(open_ids)
+            self.assertNotIn('fetch_balance', holdntrade.ACCOUNT.responses)
+            mock_logging.error.assert_called()
+        finally:
+            holdntrade.EXCHANGE = None
+            holdntrade.ACCOUNT = None
+            holdntrade.TICKER = None
+
+    @patch('holdntrade.logging')
+    def test_prefetch_should_leave_open_orders_to_feed(self, mock_logging):
+        holdntrade.CONF = self.create_default_conf()
+        holdntrade.LOG = mock_logging
+        holdntrade.ACCOUNT = holdntrade.AccountSnapshot()
+        holdntrade.TICKER = holdntrade.PriceTicker(60)
+        exchange = mock.MagicMock()
+        exchange.fetch_ticker = mock.AsyncMock(return_value={'bid': 9000})
+        exchange.fetch_balance = mock.AsyncMock(return_value={'BTC': {'used': 1, 'free': 1, 'total': 2}})
+        exchange.private_get_position = mock.AsyncMock(return_value=[{'currentQty': 100}])
+        exchange.fetch_open_orders = mock.AsyncMock(return_value=[{'id': '1s'}])
+        holdntrade.EXCHANGE = None
+        try:
+            open_ids = asyncio.run(holdntrade_async.prefetch(exchange, False))
+            position = holdntrade.get_position_balance()
+        finally:
+            holdntrade.ACCOUNT = None
+            holdntrade.TICKER = None
+
+        self.assertIsNone(open_ids)
+        self.assertEqual(100, position)
+        exchange.fetch_open_orders.assert_not_called()
+
+    def test_main_should_reject_simulation(self):
+        holdntrade.CONF = self.create_default_conf()
+        holdntrade.CONF.simulate = True
+        try:
+            with self.assertRaises(SystemExit):
+                asyncio.run(holdntrade_async.main())
+        finally:
+            holdntrade.CONF.simulate = False
+
+    @patch('holdntrade.logging')
+    def test_prefetch_should_send_private_kraken_reads_one_after_the_other(self, mock_logging):
+        holdntrade.CONF = self.create_default_conf()
+        holdntrade.CONF.exchange = 'kraken'
+        holdntrade.LOG = mock_logging
+        holdntrade.ACCOUNT = holdntrade.AccountSnapshot()
+        holdntrade.TICKER = holdntrade.PriceTicker(60)
+        events = []
+
+        def read(name, response):
+            async def request(*args, **kwargs):
+                events.append(name + ' sent')
+                await asyncio.sleep(0.01)
+                events.append(name + ' received')
+                return response
+            return request
+
+        exchange = mock.MagicMock()
+        exchange.fetch_ticker = mock.AsyncMock(return_value={'bid': 9000})
+        exchange.fetch_balance = read('balance', {'BTC': {'used': 1, 'free': 1, 'total': 2}})
+        exchange.private_post_tradebalance = read('tradebalance', {'result': {'e': '1'}})
+        exchange.fetch_open_orders = read('open orders', [{'id': '1s'}])
+        holdntrade.EXCHANGE = None
+        try:
+            open_ids = asyncio.run(holdntrade_async.prefetch(exchange))
+        finally:
+            holdntrade.ACCOUNT = None
+            holdntrade.TICKER = None
+
+        self.assertEqual({'1s'}, open_ids)
+        self.assertEqual(['balance sent', 'balance received', 'tradebalance sent', 'tradebalance received',
+                          'open orders sent', 'open orders received'], events)
+
+    @patch('holdntrade.logging')
+    def test_prefetch_should_take_requests_from_scheduler_budget(self, mock_logging):
+        holdntrade.CONF = self.create_default_conf()
+        holdntrade.LOG = mock_logging
+        holdntrade.ACCOUNT = holdntrade.AccountSnapshot()
+        holdntrade.TICKER = holdntrade.PriceTicker(60)
+        client = mock.MagicMock()
+        client.rateLimit = 1000
+        holdntrade.EXCHANGE = holdntrade.RequestScheduler(client)
+        exchange = mock.MagicMock()
+        exchange.last_response_headers = {'X-RateLimit-Limit': '120', 'X-RateLimit-Remaining': '100'}
+        exchange.fetch_ticker = mock.AsyncMock(return_value={'bid': 9000})
+        exchange.fetch_balance = mock.AsyncMock(return_value={'BTC': {'used': 1, 'free': 1, 'total': 2}})
+        exchange.private_get_position = mock.AsyncMock(return_value=[{'currentQty': 100}])
+        exchange.fetch_open_orders = mock.AsyncMock(return_value=[{'id': '1s'}])
+        try:
+            open_ids = asyncio.run(holdntrade_async.prefetch(exchange))
+            usage = holdntrade.EXCHANGE.get_usage()
+        finally:
+            holdntrade.EXCHANGE = None
+            holdntrade.ACCOUNT = None
+            holdntrade.TICKER = None
+
+        self.assertEqual({'1s'}, open_ids)
+        self.assertEqual(4, usage['fill']['requests'])
+        self.assertEqual(120, usage['capacity'])
+        self.assertLessEqual(usage['tokens'], 100)
+
+    @staticmethod
+    def create_default_conf():
+        conf = holdntrade.ExchangeConfig
+        conf.exchange = 'bitmex'
+        conf.pair = 'BTC/USD'
+        conf.symbol = 'XBTUSD'
+        conf.base = 'BTC'
+        conf.quote = 'USD'
+        conf.fill_tracking = 'poll'
+        return conf
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,12 +1,18 @@
 import os
 import datetime
 import math
+import pickle
+import shutil
+import threading
 import time
+import types
 import unittest
 from unittest import mock
-from unittest.mock import patch, call
+from unittest.mock import patch, call, MagicMock
 import ccxt
+import requests
 import holdntrade
+import mailer
 
 
 class HoldntradeTest(unittest.TestCase):
@@ -99,6 +105,36 @@ class HoldntradeTest(unittest.TestCase):
         last_line = holdntrade.read_last_line('test.txt')
         self.assertEqual('info = ""\n', last_line)
 
+    def test_read_last_line_should_seek_over_blocks(self):
+        with open('test.csv', 'w') as file:
+            file.write('a' * 5000 + '\n' + 'b' * 5000 + '\n')
+        try:
+            self.assertEqual('b' * 5000 + '\n', holdntrade.read_last_line('test.csv'))
+        finally:
+            os.remove('test.csv')
+
+    def test_csv_store_should_append_and_roll_over_to_yearly_archive(self):
+        with open('test.csv', 'w') as file:
+            file.write('test;2019-12-30 12:10:00 UTC;1\n')
+        store = holdntrade.CsvStore('test.csv', False)
+        try:
+            store.append('test;2019-12-31 12:10:00 UTC;2\n')
+            self.assertEqual('2019-12-31', store.get_last_date())
+            store.append('test;2020-01-01 12:10:00 UTC;3\n')
+
+            self.assertEqual('2020-01-01', store.get_last_date())
+            self.assertEqual('test;2020-01-01 12:10:00 UTC;3\n', store.find('2020-01-01'))
+            self.assertIsNone(store.find('2019-12-30'))
+            with open('test.csv') as file:
+                self.assertEqual(['test;2019-12-31 12:10:00 UTC;2\n', 'test;2020-01-01 12:10:00 UTC;3\n'], list(file))
+            with open('test.2019.csv') as file:
+                self.assertEqual(['test;2019-12-30 12:10:00 UTC;1\n', 'test;2019-12-31 12:10:00 UTC;2\n'], list(file))
+            self.assertEqual('test;2019-12-30 12:10:00 UTC;1\n',
+                             holdntrade.CsvStore('test.2019.csv').find('2019-12-30'))
+        finally:
+            for name in ('test.csv', 'test.csv.idx', 'test.2019.csv', 'test.2019.csv.idx'):
+                os.remove(name)
+
     def test_is_order_below_limit_true(self):
         price = 8000
         amount = 10
@@ -142,6 +178,68 @@ class HoldntradeTest(unittest.TestCase):
         self.assertEqual(0, balance['free'])
         self.assertEqual(100, balance['total'])
 
+    @patch('holdntrade.logging')
+    @mock.patch.object(ccxt.bitmex, 'fetch_balance')
+    def test_account_snapshot_should_fetch_balance_only_once(self, mock_fetch_balance, mock_logging):
+        holdntrade.CONF = self.create_default_conf()
+        holdntrade.CONF.base = 'BTC'
+        holdntrade.LOG = mock_logging
+        holdntrade.EXCHANGE = holdntrade.connect_to_exchange()
+        holdntrade.ACCOUNT = holdntrade.AccountSnapshot()
+        mock_fetch_balance.return_value = {'BTC': {'used': 50, 'free': 50, 'total': 100},
+                                           'info': [{'marginLeverage': 1.5, 'walletBalance': 10000000}]}
+
+        holdntrade.get_balance()
+        holdntrade.get_margin_balance()
+        leverage = holdntrade.get_margin_leverage()
+        wallet_balance = holdntrade.get_wallet_balance()
+        holdntrade.ACCOUNT = None
+
+        self.assertEqual(1, mock_fetch_balance.call_count)
+        self.assertEqual(1.5, leverage)
+        self.assertEqual(0.1, wallet_balance)
+
+    @patch('holdntrade.logging')
+    @patch('ccxt.bitmex')
+    def test_account_snapshot_should_fetch_position_again_after_invalidation(self, mock_bitmex, mock_logging):
+        holdntrade.CONF = self.create_default_conf()
+        holdntrade.LOG = mock_logging
+        holdntrade.EXCHANGE = mock_bitmex
+        holdntrade.ACCOUNT = holdntrade.AccountSnapshot()
+        mock_private_get_position = mock_bitmex.private_get_position
+        mock_private_get_position.side_effect = [[{'currentQty': 100, 'avgEntryPrice': 9000}],
+                                                 [{'currentQty': 200, 'avgEntryPrice': 9000}]]
+
+        before = holdntrade.get_position_balance()
+        holdntrade.get_position_info()
+        holdntrade.invalidate_account()
+        after = holdntrade.get_position_balance()
+        holdntrade.ACCOUNT = None
+
+        self.assertEqual(2, mock_private_get_position.call_count)
+        self.assertEqual(100, before)
+        self.assertEqual(200, after)
+
+    def test_account_snapshot_should_not_keep_response_fetched_while_invalidated(self):
+        snapshot = holdntrade.AccountSnapshot()
+        holdntrade.EXCHANGE = MagicMock()
+
+        def fetch_before_order():
+            # an order of the trading thread invalidates the snapshot while the report is reading it
+            snapshot.invalidate()
+            return [{'currentQty': 100}]
+
+        holdntrade.EXCHANGE.private_get_position.side_effect = fetch_before_order
+
+        self.assertEqual([{'currentQty': 100}], snapshot.get('private_get_position'))
+        self.assertNotIn('private_get_position', snapshot.responses)
+        holdntrade.EXCHANGE.private_get_position.side_effect = None
+        holdntrade.EXCHANGE.private_get_position.return_value = [{'currentQty': 200}]
+        self.assertEqual([{'currentQty': 200}], snapshot.get('private_get_position'))
+        self.assertEqual([{'currentQty': 200}], snapshot.get('private_get_position'))
+        self.assertEqual(2, holdntrade.EXCHANGE.private_get_position.call_count)
+        holdntrade.EXCHANGE = None
+
     @patch('holdntrade.logging')
     @patch('holdntrade.get_balance', return_value={'free': 0.1})
     @patch('holdntrade.get_current_price', return_value=10000)
@@ -303,9 +401,9 @@ class HoldntradeTest(unittest.TestCase):
         mock_create_limit_buy_order.assert_called_with(holdntrade.CONF.pair, amount, price)
 
     @patch('holdntrade.logging')
-    @mock.patch.object(ccxt.bitmex, 'fetch_order_status')
+    @patch('ccxt.bitmex')
     def test_cancel_current_buy_order_should_remove_order_from_buy_orders_and_clear_current_buy_order(self,
-                                                                                                      mock_fetch_order_status,
+                                                                                                      mock_bitmex,
                                                                                                       mock_logging):
         new_order = {'id': '3f463352-8339-cfbb-3bde-45a63ba43e6c', 'price': 99, 'amount': 20, 'side': 'buy',
                      'datetime': datetime.datetime.now()}
@@ -314,23 +412,25 @@ class HoldntradeTest(unittest.TestCase):
         holdntrade.CURR_BUY_ORDER = order
         holdntrade.LOG = mock_logging
         holdntrade.CONF = self.create_default_conf()
-        holdntrade.EXCHANGE = ccxt.bitmex
-        mock_fetch_order_status(order.id).return_value = 'open'
+        holdntrade.EXCHANGE = mock_bitmex
+        mock_bitmex.private_delete_order.return_value = [{'orderID': order.id, 'ordStatus': 'Canceled'}]
 
         holdntrade.cancel_current_buy_order()
 
+        mock_bitmex.private_delete_order.assert_called_with({'orderID': [order.id]})
         self.assertFalse(holdntrade.CURR_BUY_ORDER)
         self.assertFalse(holdntrade.BUY_ORDERS)
         self.assertEqual(0, len(holdntrade.BUY_ORDERS))
 
     def test_stats_add_same_again_day(self):
         today = {'mBal': 0.999, 'price': 10000}
-        stats = holdntrade.Stats(int(datetime.date.today().strftime("%Y%j")), today)
+        stats = holdntrade.Stats()
+        self.assertTrue(stats.add_day(datetime.date.today().toordinal(), today))
         same_day = {'mBal': 0.666, 'price': 9000}
 
-        stats.add_day(int(datetime.date.today().strftime("%Y%j")), same_day)
+        self.assertFalse(stats.add_day(datetime.date.today().toordinal(), same_day))
 
-        day = stats.get_day(int(datetime.date.today().strftime("%Y%j")))
+        day = stats.get_day(datetime.date.today().toordinal())
         self.assertTrue(day['mBal'] == 0.999)
         self.assertTrue(day['price'] == 10000)
 
@@ -339,32 +439,81 @@ class HoldntradeTest(unittest.TestCase):
         h48 = {'mBal': 0.480, 'price': 10048}
         h24 = {'mBal': 0.240, 'price': 10024}
         today = {'mBal': 0.000, 'price': 10000}
-        stats = holdntrade.Stats(int(datetime.date.today().strftime("%Y%j")) - 3, h72)
-        stats.add_day(int(datetime.date.today().strftime("%Y%j")) - 2, h48)
-        stats.add_day(int(datetime.date.today().strftime("%Y%j")) - 1, h24)
-        self.assertTrue(len(stats.days) == 3)
-
-        stats.add_day(int(datetime.date.today().strftime("%Y%j")), today)
+        day = datetime.date.today().toordinal()
+        stats = holdntrade.Stats(3)
+        stats.add_day(day - 3, h72)
+        stats.add_day(day - 2, h48)
+        stats.add_day(day - 1, h24)
+        self.assertTrue(len(stats) == 3)
+
+        stats.add_day(day, today)
+
+        self.assertEqual(3, len(stats))
+        self.assertTrue(stats.get_day(day - 3) is None)
+        self.assertTrue(stats.get_day(day - 2) is not None)
+        self.assertTrue(stats.get_day(day - 1) is not None)
+        self.assertTrue(stats.get_day(day) is not None)
+
+    def test_stats_should_append_records_and_read_last_capacity(self):
+        stats = holdntrade.Stats(3)
+        day = datetime.date(2019, 12, 30).toordinal()
+        try:
+            for offset in range(6):
+                stats.add_day(day + offset, {'mBal': offset, 'price': 9000 + offset})
+                stats.append('test.stats', day + offset)
+            self.assertEqual(6 * holdntrade.Stats.RECORD.size, os.path.getsize('test.stats'))
+            stats.add_day(day + 6, {'mBal': 6})
+            stats.append('test.stats', day + 6)
+            self.assertEqual(3 * holdntrade.Stats.RECORD.size, os.path.getsize('test.stats'))
+
+            read = holdntrade.Stats.read('test.stats', 3)
+        finally:
+            os.remove('test.stats')
+
+        self.assertIsNone(read.get_day(day + 3))
+        self.assertEqual({'day': day + 5, 'mBal': 5, 'price': 9005}, read.get_day(day + 5))
+        self.assertEqual({'day': day + 6, 'mBal': 6}, read.get_day(day + 6))
+
+    def test_load_statistics_should_take_over_legacy_pickle(self):
+        holdntrade.CONF = self.create_default_conf()
+        if os.path.isfile('test.stats'):
+            os.remove('test.stats')
+        legacy = types.SimpleNamespace(days=[{'mBal': 0.5, 'price': 9000, 'day': 2019365},
+                                             {'mBal': 0.6, 'price': 9100, 'day': 2020001}])
+        # pickled by a former version running as script
+        pickled = pickle.dumps(legacy, 3).replace(b'ctypes\nSimpleNamespace', b'c__main__\nStats')
+        self.assertIn(b'__main__\nStats', pickled)
+        with open('test.pkl', 'wb') as file:
+            file.write(pickled)
+        try:
+            stats = holdntrade.load_statistics()
+            self.assertTrue(os.path.isfile('test.stats'))
+            self.assertEqual(2, len(holdntrade.load_statistics()))
+        finally:
+            os.remove('test.pkl')
+            os.remove('test.stats')
 
-        self.assertEqual(3, len(stats.days))
-        self.assertTrue(stats.get_day(int(datetime.date.today().strftime("%Y%j")) - 3) is None)
-        self.assertTrue(stats.get_day(int(datetime.date.today().strftime("%Y%j")) - 2) is not None)
-        self.assertTrue(stats.get_day(int(datetime.date.today().strftime("%Y%j")) - 1) is not None)
-        self.assertTrue(stats.get_day(int(datetime.date.today().strftime("%Y%j"))) is not None)
+        self.assertEqual({'day': datetime.date(2019, 12, 31).toordinal(), 'mBal': 0.5, 'price': 9000},
+                         stats.get_day(datetime.date(2019, 12, 31).toordinal()))
+        self.assertEqual(0.6, stats.get_day(datetime.date(2020, 1, 1).toordinal())['mBal'])
 
     def test_calculate_statistics_first_day(self):
         holdntrade.CONF = self.create_default_conf()
+        holdntrade.STATS = None
 
         today = holdntrade.calculate_daily_statistics(100, 8000.0)
 
         self.assertTrue(today['mBal'] == 100)
         self.assertTrue(today['price'] == 8000.0)
+        self.assertNotIn('mBalChan24', today)
 
     def test_calculate_statistics_positive_change(self):
         holdntrade.CONF = self.create_default_conf()
-        holdntrade.STATS = holdntrade.Stats(int(datetime.date.today().strftime("%Y%j")) - 2,
-                                            {'mBal': 75.15, 'price': 4400.0})
-        holdntrade.STATS.add_day(int(datetime.date.today().strftime("%Y%j")) - 1, {'mBal': 50.1, 'price': 8000.0})
+        day = datetime.date.today().toordinal()
+        holdntrade.STATS = holdntrade.Stats()
+        holdntrade.STATS.add_day(day - 30, {'mBal': 25.05, 'price': 4000.0})
+        holdntrade.STATS.add_day(day - 2, {'mBal': 75.15, 'price': 4400.0})
+        holdntrade.STATS.add_day(day - 1, {'mBal': 50.1, 'price': 8000.0})
 
         today = holdntrade.calculate_daily_statistics(100.2, 8800.0)
 
@@ -372,11 +521,14 @@ class HoldntradeTest(unittest.TestCase):
         self.assertEqual(8800.0, today['price'])
         self.assertEqual(100.0, today['mBalChan24'])
         self.assertEqual(10.0, today['priceChan24'])
+        self.assertNotIn('mBalChan7d', today)
+        self.assertEqual(300.0, today['mBalChan30d'])
+        self.assertEqual(120.0, today['priceChan30d'])
 
     def test_calculate_statistics_negative_change(self):
         holdntrade.CONF = self.create_default_conf()
-        holdntrade.STATS = holdntrade.Stats(int(datetime.date.today().strftime("%Y%j")) - 1,
-                                            {'mBal': 150.3, 'price': 8000.0})
+        holdntrade.STATS = holdntrade.Stats()
+        holdntrade.STATS.add_day(datetime.date.today().toordinal() - 1, {'mBal': 150.3, 'price': 8000.0})
 
         today = holdntrade.calculate_daily_statistics(100.2, 7600.0)
 
@@ -590,25 +742,62 @@ class HoldntradeTest(unittest.TestCase):
         self.assertAlmostEqual(0.00567, order_stats['val'], 5)
 
     @patch('holdntrade.logging')
-    @mock.patch.object(ccxt.bitmex, 'cancel_order')
-    @mock.patch.object(ccxt.bitmex, 'fetch_order_status')
-    def test_cancel_orders(self, mock_fetch_order_status, mock_cancel_order, mock_logging):
+    @patch('ccxt.bitmex')
+    def test_cancel_orders(self, mock_bitmex, mock_logging):
         holdntrade.CONF = self.create_default_conf()
         holdntrade.LOG = mock_logging
-        holdntrade.EXCHANGE = holdntrade.connect_to_exchange()
+        holdntrade.EXCHANGE = mock_bitmex
 
         orders = [holdntrade.Order({'side': 'sell', 'id': '1s', 'price': 10000, 'amount': 10,
                                     'datetime': datetime.datetime.today().isoformat()}),
                   holdntrade.Order({'side': 'sell', 'id': '2s', 'price': 15000, 'amount': 10,
                                     'datetime': datetime.datetime.today().isoformat()})]
 
-        return_values = {'1s': 'open', '2s': 'canceled'}
-        mock_fetch_order_status.side_effect = return_values.get
+        mock_bitmex.private_delete_order.return_value = [
+            {'orderID': '1s', 'ordStatus': 'Canceled'},
+            {'orderID': '2s', 'ordStatus': 'Filled', 'error': 'Unable to cancel order due to existing state: Filled'}]
         holdntrade.cancel_orders(orders)
 
         mock_logging.debug.assert_called()
-        mock_logging.warning.assert_called_with('Cancel %s was in state %s', str(orders[1]), 'canceled')
-        mock_cancel_order.assert_called()
+        mock_logging.warning.assert_called_with('Cancel %s was in state %s', '2s', 'Filled')
+        mock_bitmex.private_delete_order.assert_called_once_with({'orderID': ['1s', '2s']})
+        mock_bitmex.fetch_order_status.assert_not_called()
+
+    @patch('holdntrade.logging')
+    @patch('ccxt.kraken')
+    def test_cancel_orders_should_treat_order_not_found_as_closed(self, mock_kraken, mock_logging):
+        holdntrade.CONF = self.create_default_conf()
+        holdntrade.CONF.exchange = 'kraken'
+        holdntrade.LOG = mock_logging
+        holdntrade.EXCHANGE = mock_kraken
+
+        orders = [holdntrade.Order({'side': 'sell', 'id': '1s', 'price': 10000, 'amount': 10,
+                                    'datetime': datetime.datetime.today().isoformat()}),
+                  holdntrade.Order({'side': 'sell', 'id': '2s', 'price': 15000, 'amount': 10,
+                                    'datetime': datetime.datetime.today().isoformat()})]
+        mock_kraken.cancel_order.side_effect = [ccxt.OrderNotFound('EOrder:Unknown order'), {}]
+
+        holdntrade.cancel_orders(orders)
+
+        mock_kraken.cancel_order.assert_has_calls([call('1s'), call('2s')])
+        mock_kraken.fetch_order_status.assert_not_called()
+        mock_logging.warning.assert_called_with('Cancel %s not found : %s', str(orders[0]), str(('EOrder:Unknown order',)))
+        holdntrade.CONF.exchange = 'bitmex'
+
+    @patch('holdntrade.logging')
+    @patch('ccxt.bitmex')
+    def test_cancel_orders_should_cancel_all_open_orders_at_once(self, mock_bitmex, mock_logging):
+        holdntrade.CONF = self.create_default_conf()
+        holdntrade.LOG = mock_logging
+        holdntrade.EXCHANGE = mock_bitmex
+        mock_bitmex.private_delete_order_all.return_value = []
+        orders = [holdntrade.Order({'side': 'sell', 'id': '1s', 'price': 10000, 'amount': 10,
+                                    'datetime': datetime.datetime.today().isoformat()})]
+
+        holdntrade.cancel_orders(orders, True)
+
+        mock_bitmex.private_delete_order_all.assert_called_with({'symbol': 'XBTUSD'})
+        mock_bitmex.private_delete_order.assert_not_called()
 
     @patch('holdntrade.logging')
     @mock.patch.object(ccxt.bitmex, 'fetch_balance')
@@ -818,13 +1007,15 @@ class HoldntradeTest(unittest.TestCase):
     @patch('holdntrade.get_current_price', return_value=9000)
     @patch('holdntrade.calculate_buy_order_amount', return_value=99)
     @patch('holdntrade.shall_hibernate', return_value=False)
+    @patch('holdntrade.cancel_orders')
     @mock.patch.object(ccxt.bitmex, 'fetch_balance')
     @mock.patch.object(ccxt.bitmex, 'fetch_order_status')
     @mock.patch.object(ccxt.bitmex, 'create_limit_buy_order')
     @mock.patch.object(ccxt.bitmex, 'create_limit_sell_order')
     def test_sell_executed(self, mock_create_limit_sell_order, mock_create_limit_buy_order, mock_fetch_order_status,
-                           mock_fetch_balance,mock_shall_hibernate, mock_calculate_buy_order_amount,
-                           mock_get_current_price, mock_sleep_for, mock_set_leverage, mock_logging):
+                           mock_fetch_balance, mock_cancel_orders, mock_shall_hibernate,
+                           mock_calculate_buy_order_amount, mock_get_current_price, mock_sleep_for, mock_set_leverage,
+                           mock_logging):
         holdntrade.CONF = self.create_default_conf()
         holdntrade.CONF.base = 'BTC'
         holdntrade.LOG = mock_logging
@@ -846,6 +1037,174 @@ class HoldntradeTest(unittest.TestCase):
         mock_create_limit_sell_order.assert_not_called()
         mock_create_limit_buy_order.assert_called_with(holdntrade.CONF.pair, 99, buy_price)
 
+    @patch('holdntrade.logging')
+    @patch('holdntrade.cancel_current_buy_order')
+    @patch('holdntrade.create_buy_order')
+    @patch('holdntrade.get_current_price', return_value=9000)
+    @patch('holdntrade.calculate_buy_order_amount', return_value=99)
+    @patch('holdntrade.shall_hibernate', return_value=False)
+    @patch('holdntrade.adjust_leverage')
+    @patch('holdntrade.fetch_mayer', return_value={'current': 1, 'average': 1})
+    @patch('holdntrade.fetch_order_status', return_value='closed')
+    def test_sell_executed_should_only_fetch_status_of_orders_missing_in_open_orders(
+            self, mock_fetch_order_status, mock_fetch_mayer, mock_adjust_leverage, mock_shall_hibernate,
+            mock_calculate_buy_order_amount, mock_get_current_price, mock_create_buy_order,
+            mock_cancel_current_buy_order, mock_logging):
+        holdntrade.CONF = self.create_default_conf()
+        holdntrade.LOG = mock_logging
+        sell1 = holdntrade.Order({'side': 'sell', 'id': '1s', 'price': 10000, 'amount': 10,
+                                  'datetime': datetime.datetime.today().isoformat()})
+        sell2 = holdntrade.Order({'side': 'sell', 'id': '2s', 'price': 15000, 'amount': 10,
+                                  'datetime': datetime.datetime.today().isoformat()})
+        holdntrade.SELL_ORDERS = [sell1, sell2]
+
+        holdntrade.sell_executed({'2s', '7b'})
+
+        mock_fetch_order_status.assert_called_once_with('1s')
+        self.assertEqual([sell2], holdntrade.SELL_ORDERS)
+        mock_create_buy_order.assert_called_with(9000, 99, False)
+
+    @patch('holdntrade.logging')
+    @patch('holdntrade.fetch_order_status')
+    @patch('holdntrade.get_current_price', return_value=9000)
+    def test_buy_executed_should_not_fetch_status_if_order_is_open(self, mock_get_current_price,
+                                                                   mock_fetch_order_status, mock_logging):
+        holdntrade.CONF = self.create_default_conf()
+        holdntrade.LOG = mock_logging
+        holdntrade.CURR_BUY_ORDER = holdntrade.Order({'side': 'buy', 'id': '1b', 'price': 9000, 'amount': 10,
+                                                      'datetime': datetime.datetime.today().isoformat()})
+        holdntrade.BUY_ORDERS = [holdntrade.CURR_BUY_ORDER]
+
+        holdntrade.buy_executed({'1b'})
+
+        mock_fetch_order_status.assert_not_called()
+        mock_logging.info.assert_not_called()
+
+    @patch('holdntrade.logging')
+    @patch('holdntrade.create_sell_order')
+    @patch('holdntrade.fetch_order_status', return_value='closed')
+    def test_other_buys_executed_should_create_sell_order_for_executed_buy_order(self, mock_fetch_order_status,
+                                                                                 mock_create_sell_order,
+                                                                                 mock_logging):
+        holdntrade.CONF = self.create_default_conf()
+        holdntrade.LOG = mock_logging
+        current = holdntrade.Order({'side': 'buy', 'id': '1b', 'price': 9950, 'amount': 10,
+                                    'datetime': datetime.datetime.today().isoformat()})
+        other = holdntrade.Order({'side': 'buy', 'id': '2b', 'price': 9900, 'amount': 20,
+                                  'datetime': datetime.datetime.today().isoformat()})
+        holdntrade.CURR_BUY_ORDER = current
+        holdntrade.BUY_ORDERS = [current, other]
+
+        holdntrade.other_buys_executed({'1b'})
+
+        mock_fetch_order_status.assert_called_once_with('2b')
+        mock_create_sell_order.assert_called_with(20)
+        self.assertEqual(round(9900 * 1.005 / 0.995), holdntrade.SELL_PRICE)
+        self.assertEqual([current], holdntrade.BUY_ORDERS)
+
+    @patch('holdntrade.logging')
+    @patch('ccxt.bitmex')
+    def test_get_unfilled_order_ids_should_advance_and_persist_cursor_after_fills_are_handled(self, mock_bitmex,
+                                                                                              mock_logging):
+        holdntrade.CONF = self.create_default_conf()
+        holdntrade.LOG = mock_logging
+        holdntrade.EXCHANGE = mock_bitmex
+        holdntrade.FILL_CURSOR = 1500000000000
+        sell = holdntrade.Order({'side': 'sell', 'id': '1s', 'price': 10000, 'amount': 10,
+                                 'datetime': datetime.datetime.today().isoformat()})
+        buy = holdntrade.Order({'side': 'buy', 'id': '1b', 'price': 9900, 'amount': 10,
+                                'datetime': datetime.datetime.today().isoformat()})
+        holdntrade.SELL_ORDERS = [sell]
+        holdntrade.BUY_ORDERS = [buy]
+        mock_bitmex.fetch_closed_orders.return_value = [{'id': '1s', 'timestamp': 1500000001000,
+                                                         'lastTradeTimestamp': 1500000002000}]
+
+        open_ids = holdntrade.get_unfilled_order_ids()
+
+        mock_bitmex.fetch_closed_orders.assert_called_with('BTC/USD', since=1499999940000, limit=500)
+        self.assertEqual({'1b'}, open_ids)
+        self.assertEqual(1500000000000, holdntrade.FILL_CURSOR)
+        self.assertFalse(os.path.isfile('test.cursor'))
+
+        holdntrade.advance_fill_cursor()
+
+        self.assertEqual(1500000002000, holdntrade.FILL_CURSOR)
+        self.assertEqual(1500000002000, holdntrade.load_fill_cursor())
+        self.assertIsNone(holdntrade.FILL_CURSOR_NEXT)
+        os.remove('test.cursor')
+        holdntrade.FILL_CURSOR = None
+
+    @patch('holdntrade.logging')
+    @patch('ccxt.kraken')
+    def test_track_fills_should_poll_open_orders_where_closed_orders_are_filtered_by_creation(self, mock_kraken,
+                                                                                              mock_logging):
+        holdntrade.CONF = self.create_default_conf()
+        holdntrade.CONF.exchange = 'kraken'
+        holdntrade.CONF.fill_tracking = 'cursor'
+        holdntrade.LOG = mock_logging
+        holdntrade.EXCHANGE = mock_kraken
+        holdntrade.FEED = None
+        mock_kraken.fetch_open_orders.return_value = [{'side': 'buy', 'id': '1b', 'price': 9900, 'amount': 10,
+                                                       'datetime': datetime.datetime.today().isoformat()}]
+        try:
+            self.assertEqual({'1b'}, holdntrade.track_fills())
+        finally:
+            holdntrade.CONF.fill_tracking = 'poll'
+
+        mock_kraken.fetch_closed_orders.assert_not_called()
+
+    @patch('holdntrade.sell_executed')
+    @patch('holdntrade.buy_executed', side_effect=ccxt.NetworkError('timeout'))
+    def test_trade_should_keep_fill_cursor_if_fills_are_not_handled(self, mock_buy_executed, mock_sell_executed):
+        holdntrade.CONF = self.create_default_conf()
+        holdntrade.LOOP = True
+        holdntrade.FILL_CURSOR = 1500000000000
+        holdntrade.FILL_CURSOR_NEXT = 1500000002000
+        try:
+            with self.assertRaises(ccxt.NetworkError):
+                holdntrade.trade(set())
+        finally:
+            holdntrade.LOOP = False
+
+        mock_sell_executed.assert_not_called()
+        self.assertEqual(1500000000000, holdntrade.FILL_CURSOR)
+        self.assertFalse(os.path.isfile('test.cursor'))
+        holdntrade.FILL_CURSOR = None
+        holdntrade.FILL_CURSOR_NEXT = None
+
+    @patch('holdntrade.logging')
+    @patch('ccxt.bitmex')
+    def test_track_fills_should_use_pushed_fills_until_reconciliation_is_due(self, mock_bitmex, mock_logging):
+        holdntrade.CONF = self.create_default_conf()
+        holdntrade.CONF.stream_reconcile = 60
+        holdntrade.CONF.fill_tracking = 'poll'
+        holdntrade.LOG = mock_logging
+        holdntrade.EXCHANGE = mock_bitmex
+        holdntrade.FEED = MagicMock()
+        holdntrade.FEED.connected = True
+        holdntrade.FEED.pop_closed_ids.return_value = {'1s'}
+        holdntrade.LAST_RECONCILE = time.time()
+        sell = holdntrade.Order({'side': 'sell', 'id': '1s', 'price': 10000, 'amount': 10,
+                                 'datetime': datetime.datetime.today().isoformat()})
+        buy = holdntrade.Order({'side': 'buy', 'id': '1b', 'price': 9900, 'amount': 10,
+                                'datetime': datetime.datetime.today().isoformat()})
+        holdntrade.SELL_ORDERS = [sell]
+        holdntrade.BUY_ORDERS = [buy]
+
+        self.assertEqual({'1b'}, holdntrade.track_fills())
+        mock_bitmex.fetch_open_orders.assert_not_called()
+
+        holdntrade.LAST_RECONCILE = time.time() - 61
+        mock_bitmex.fetch_open_orders.return_value = [{'side': 'sell', 'id': '1s', 'price': 10000, 'amount': 10,
+                                                        'datetime': datetime.datetime.today().isoformat()},
+                                                       {'side': 'buy', 'id': '1b', 'price': 9900, 'amount': 10,
+                                                        'datetime': datetime.datetime.today().isoformat()}]
+
+        self.assertEqual({'1s', '1b'}, holdntrade.track_fills())
+        mock_bitmex.fetch_open_orders.assert_called()
+        holdntrade.FEED = None
+        holdntrade.LAST_RECONCILE = 0
+
     @patch('holdntrade.logging')
     @patch('holdntrade.get_current_price', return_value=9000)
     @patch('holdntrade.calculate_buy_order_amount', return_value=99)
@@ -961,13 +1320,14 @@ class HoldntradeTest(unittest.TestCase):
     @patch('holdntrade.calculate_buy_order_amount', return_value=100)
     @patch('holdntrade.shall_hibernate', return_value=False)
     @patch('holdntrade.get_position_balance', return_value=800)
+    @patch('holdntrade.place_orders', return_value=[None, None])
     @mock.patch.object(ccxt.bitmex, 'fetch_order_status')
     @mock.patch.object(ccxt.bitmex, 'create_limit_buy_order')
     @mock.patch.object(ccxt.bitmex, 'create_limit_sell_order')
     def test_buy_executed_regular(self, mock_create_limit_sell_order, mock_create_limit_buy_order,
-                                  mock_fetch_order_status, mock_position_balance, mock_shall_hibernate,
-                                  mock_calculate_buy_order_amount, mock_get_current_price, mock_sleep_for,
-                                  mock_set_initial_leverage, mock_set_leverage, mock_logging):
+                                  mock_fetch_order_status, mock_place_orders, mock_position_balance,
+                                  mock_shall_hibernate, mock_calculate_buy_order_amount, mock_get_current_price,
+                                  mock_sleep_for, mock_set_initial_leverage, mock_set_leverage, mock_logging):
         holdntrade.CONF = self.create_default_conf()
         holdntrade.CONF.base = 'BTC'
         holdntrade.LOG = mock_logging
@@ -982,11 +1342,17 @@ class HoldntradeTest(unittest.TestCase):
         price = 9000
         buy_price = round(price * (1 - holdntrade.CONF.change))
         sell_price = round(price * (1 + holdntrade.CONF.change))
+        mock_create_limit_buy_order.return_value = {'side': 'buy', 'id': '2B', 'price': buy_price, 'amount': 100,
+                                                    'datetime': datetime.datetime.today().isoformat()}
+        mock_create_limit_sell_order.return_value = {'side': 'sell', 'id': '2S', 'price': sell_price, 'amount': 222,
+                                                     'datetime': datetime.datetime.today().isoformat()}
 
         holdntrade.buy_executed()
 
         mock_logging.debug.assert_called()
         mock_set_initial_leverage.assert_not_called()
+        mock_place_orders.assert_called_with([('buy', 100, buy_price), ('sell', 222, sell_price)])
+        # created one by one if the orders could not be placed at once
         mock_create_limit_sell_order.assert_called_with(holdntrade.CONF.pair, 222, sell_price)
         mock_create_limit_buy_order.assert_called_with(holdntrade.CONF.pair, 100, buy_price)
 
@@ -1078,50 +1444,71 @@ class HoldntradeTest(unittest.TestCase):
         self.assertEqual(1250, amount)
         mock_calculate_quota.assert_called()
 
+    @patch('holdntrade.create_sell_order')
+    @patch('holdntrade.create_buy_order', return_value=False)
+    @patch('holdntrade.cancel_order')
+    def test_spread_should_not_create_sell_order_if_buy_order_failed(self, mock_cancel_order, mock_create_buy_order,
+                                                                     mock_create_sell_order):
+        holdntrade.CONF = self.create_default_conf()
+        holdntrade.CONF.exchange = 'kraken'
+        buy = holdntrade.Order({'id': '1', 'price': 200, 'amount': 102, 'side': 'buy',
+                                'datetime': datetime.datetime.now()})
+        holdntrade.BUY_ORDERS = holdntrade.OrderBook([buy])
+        holdntrade.SELL_ORDERS = holdntrade.OrderBook([holdntrade.Order({'id': '2', 'price': 400, 'amount': 103,
+                                                                         'side': 'sell',
+                                                                         'datetime': datetime.datetime.now()})])
+
+        holdntrade.spread(300)
+
+        mock_cancel_order.assert_called_with(buy)
+        mock_create_buy_order.assert_called_with(300, 102, False)
+        mock_create_sell_order.assert_not_called()
+
     @patch('holdntrade.logging')
     @patch('holdntrade.get_position_balance', return_value=200)
-    @mock.patch.object(ccxt.bitmex, 'cancel_order')
-    @mock.patch.object(ccxt.bitmex, 'fetch_ticker')
-    @mock.patch.object(ccxt.bitmex, 'fetch_order_status')
     @patch('holdntrade.create_buy_order')
-    @mock.patch.object(ccxt.bitmex, 'create_limit_sell_order')
-    def test_spread_should_cancel_highest_buy_order_and_create_a_new_sell_and_buy_order(self,
-                                                                                        mock_create_limit_sell_order,
+    @patch('ccxt.bitmex')
+    def test_spread_should_cancel_highest_buy_order_and_create_a_new_sell_and_buy_order(self, mock_bitmex,
                                                                                         mock_create_limit_buy_order,
-                                                                                        mock_fetch_order_status,
-                                                                                        mock_fetch_ticker,
-                                                                                        mock_cancel_order,
                                                                                         mock_get_position_balance,
                                                                                         mock_logging):
         holdntrade.CONF = self.create_default_conf()
         holdntrade.CONF.base = 'BTC'
-        holdntrade.EXCHANGE = ccxt.bitmex
+        holdntrade.EXCHANGE = mock_bitmex
         holdntrade.LOG = mock_logging
         buy1 = holdntrade.Order({'id': '1', 'price': 100, 'amount': 101, 'side': 'buy',
                                  'datetime': datetime.datetime.now()})
         buy2 = holdntrade.Order({'id': '2', 'price': 200, 'amount': 102, 'side': 'buy',
                                  'datetime': datetime.datetime.now()})
-        holdntrade.BUY_ORDERS = [buy1, buy2]
+        holdntrade.BUY_ORDERS = holdntrade.OrderBook([buy1, buy2])
         sell1 = holdntrade.Order({'id': '3', 'price': 400, 'amount': 103, 'side': 'sell',
                                   'datetime': datetime.datetime.now()})
         sell2 = holdntrade.Order({'id': '4', 'price': 500, 'amount': 104, 'side': 'sell',
                                   'datetime': datetime.datetime.now()})
-        holdntrade.SELL_ORDERS = [sell1, sell2]
+        holdntrade.SELL_ORDERS = holdntrade.OrderBook([sell1, sell2])
         buy3 = holdntrade.Order({'id': '3', 'price': 301.5, 'amount': 102, 'side': 'buy',
                                  'datetime': datetime.datetime.now()})
         holdntrade.CURR_BUY_ORDER = buy3
         market_price = 300
         holdntrade.SELL_PRICE = round(market_price * (1 + holdntrade.CONF.change))
-        return_values = {'2': 'open'}
-        mock_fetch_order_status.side_effect = return_values.get
-        mock_fetch_ticker.return_value = {'bid': market_price}
+        mock_bitmex.private_delete_order.return_value = [{'orderID': '2', 'ordStatus': 'Canceled'}]
+        mock_bitmex.fetch_ticker.return_value = {'bid': market_price}
+        mock_bitmex.private_post_order_bulk.return_value = [
+            {'id': '5', 'price': 299, 'amount': 102, 'side': 'buy', 'datetime': datetime.datetime.now()},
+            {'id': '6', 'price': holdntrade.SELL_PRICE, 'amount': 102, 'side': 'sell',
+             'datetime': datetime.datetime.now()}]
+        mock_bitmex.parse_order.side_effect = lambda order: order
 
         holdntrade.spread(market_price)
 
-        mock_fetch_order_status.assert_called_with(buy2.id)
-        mock_cancel_order.assert_called_with(buy2.id)
-        mock_create_limit_sell_order.assert_called_with('BTC/USD', 102, holdntrade.SELL_PRICE)
+        mock_bitmex.fetch_order_status.assert_not_called()
+        mock_bitmex.private_delete_order.assert_called_with({'orderID': [buy2.id]})
+        mock_bitmex.private_post_order_bulk.assert_called_with({'orders': [
+            {'symbol': 'XBTUSD', 'side': 'Buy', 'orderQty': 102, 'price': holdntrade.BUY_PRICE, 'ordType': 'Limit'},
+            {'symbol': 'XBTUSD', 'side': 'Sell', 'orderQty': 102, 'price': holdntrade.SELL_PRICE, 'ordType': 'Limit'}]})
+        mock_create_limit_buy_order.assert_not_called()
         self.assertEqual(3, len(holdntrade.SELL_ORDERS))
+        self.assertEqual('5', holdntrade.CURR_BUY_ORDER.id)
 
     @patch('holdntrade.get_margin_balance')
     @patch('holdntrade.get_current_price')
@@ -1249,6 +1636,301 @@ class HoldntradeTest(unittest.TestCase):
         mock_logging.warning.assert_called_with('Price was None')
         self.assertEqual(2, mock_fetch_ticker.call_count)
 
+    @patch('holdntrade.logging')
+    @mock.patch.object(ccxt.bitmex, 'fetch_ticker')
+    def test_get_current_price_should_use_cached_price_unless_fresh_is_requested(self, mock_fetch_ticker,
+                                                                                 mock_logging):
+        holdntrade.CONF = self.create_default_conf()
+        holdntrade.LOG = mock_logging
+        holdntrade.EXCHANGE = holdntrade.connect_to_exchange()
+        holdntrade.TICKER = holdntrade.PriceTicker(60)
+        mock_fetch_ticker.side_effect = [{'bid': 1111}, {'bid': 2222}]
+
+        first = holdntrade.get_current_price()
+        cached = holdntrade.get_current_price()
+        fresh = holdntrade.get_current_price(True)
+        holdntrade.TICKER = None
+
+        self.assertEqual(1111, first)
+        self.assertEqual(1111, cached)
+        self.assertEqual(2222, fresh)
+        self.assertEqual(2, mock_fetch_ticker.call_count)
+
+    def test_price_ticker_should_expire_after_max_age(self):
+        ticker = holdntrade.PriceTicker(5)
+        ticker.update(1111)
+
+        self.assertEqual(1111, ticker.get())
+
+        ticker.fetched -= 6
+
+        self.assertIsNone(ticker.get())
+        self.assertGreater(ticker.age(), 5)
+
+    @patch('holdntrade.logging')
+    @patch('holdntrade.sleep_for')
+    def test_retrying_should_return_result_after_backing_off(self, mock_sleep_for, mock_logging):
+        holdntrade.LOG = mock_logging
+        holdntrade.EXCHANGE = MagicMock()
+        operation = MagicMock(side_effect=[ccxt.NetworkError('timeout'), ccxt.DDoSProtection('rate limit'), 42])
+        operation.__name__ = 'operation'
+
+        result = holdntrade.retrying()(operation)()
+
+        self.assertEqual(42, result)
+        self.assertEqual(3, operation.call_count)
+        mock_sleep_for.assert_has_calls([call(2, 4), call(10, 20)])
+
+    @patch('holdntrade.logging')
+    @patch('holdntrade.sleep_for')
+    def test_retrying_should_raise_last_error_after_deadline(self, mock_sleep_for, mock_logging):
+        holdntrade.LOG = mock_logging
+        holdntrade.EXCHANGE = MagicMock()
+        operation = MagicMock(side_effect=[ccxt.NetworkError('timeout'), ccxt.ExchangeNotAvailable('maintenance'),
+                                         ccxt.ExchangeNotAvailable('maintenance')])
+        operation.__name__ = 'operation'
+
+        with self.assertRaises(ccxt.ExchangeNotAvailable):
+            holdntrade.retrying(deadline=5)(operation)()
+        self.assertIsNone(holdntrade.retrying(deadline=5, give_up_silently=True)(operation)())
+        mock_sleep_for.assert_called_once_with(2, 4)
+
+    @patch('holdntrade.logging')
+    @patch('holdntrade.sleep_for')
+    def test_backoff_should_honour_retry_after_and_deadline(self, mock_sleep_for, mock_logging):
+        holdntrade.LOG = mock_logging
+        holdntrade.EXCHANGE = MagicMock()
+        holdntrade.EXCHANGE.last_response_headers = {'Retry-After': '50'}
+        backoff = holdntrade.Backoff('operation', 90)
+
+        self.assertTrue(backoff.wait(ccxt.NetworkError('rate limit')))
+        mock_sleep_for.assert_called_with(50, 50)
+        self.assertFalse(backoff.wait(ccxt.NetworkError('rate limit')))
+        mock_logging.warning.assert_called_with('Giving up %s after %d attempts', 'operation', 2)
+        self.assertFalse(holdntrade.Backoff('operation').wait(ccxt.InsufficientFunds('insufficient')))
+
+    @patch('holdntrade.time')
+    def test_request_scheduler_should_keep_reserve_for_orders(self, mock_time):
+        clock = [0.0]
+        mock_time.time.side_effect = lambda: clock[0]
+        mock_time.sleep.side_effect = lambda seconds: clock.append(clock.pop() + seconds)
+        exchange = MagicMock()
+        exchange.rateLimit = 1000
+        exchange.last_response_headers = None
+        scheduler = holdntrade.RequestScheduler(exchange)
+        scheduler.capacity = 10
+        scheduler.rate = 1000
+        scheduler.tokens = 2
+
+        scheduler.create_limit_buy_order('BTC/USD', 100, 9000)
+        holdntrade.EXCHANGE = scheduler
+        holdntrade.with_priority('report')(lambda: scheduler.fetch_ticker('BTC/USD'))()
+
+        exchange.create_limit_buy_order.assert_called_with('BTC/USD', 100, 9000)
+        exchange.fetch_ticker.assert_called_with('BTC/USD')
+        self.assertFalse(exchange.enableRateLimit)
+        usage = scheduler.get_usage()
+        self.assertEqual({'requests': 1, 'waited': 0.0}, usage['order'])
+        self.assertEqual(1, usage['report']['requests'])
+        self.assertGreater(usage['report']['waited'], 0)
+        self.assertEqual(0, usage['fill']['requests'])
+        self.assertIsNone(scheduler.priority)
+
+    def test_gather_report_data_should_read_concurrently_with_report_priority(self):
+        holdntrade.CONF = self.create_default_conf()
+        holdntrade.CONF.bot_version = '1.0'
+        holdntrade.STATS = None
+        exchange = MagicMock()
+        exchange.rateLimit = 1000
+        holdntrade.EXCHANGE = holdntrade.RequestScheduler(exchange)
+        # every read waits for all the others, reading one after the other would break the barrier
+        barrier = threading.Barrier(11)
+        priorities = []
+
+        def concurrently(value):
+            def read(*_):
+                priorities.append(holdntrade.EXCHANGE.priority)
+                barrier.wait(5)
+                return value
+            return read
+
+        sell_order = {'id': '1', 'price': 11000, 'amount': 100, 'side': 'sell', 'datetime': '2019'}
+        reads = {'get_current_price': 10000, 'get_open_orders': holdntrade.OpenOrdersSummary([sell_order]),
+                 'get_margin_balance': {'free': 0.3, 'total': 1.0}, 'get_net_deposits': 0.8,
+                 'get_position_info': {'markPrice': 10000, 'liquidationPrice': 5000}, 'get_wallet_balance': 0.9,
+                 'get_interest_rate': 0.01, 'get_position_balance': 1000, 'fetch_mayer': {'current': 1.2, 'average': 1.4},
+                 'read_moving_average': None, 'get_margin_leverage': 1.5}
+        try:
+            with patch.multiple('holdntrade', **{name: concurrently(value) for name, value in reads.items()}):
+                data = holdntrade.gather_report_data()
+            data.update(holdntrade.create_state())
+            content = holdntrade.create_mail_content(data)
+        finally:
+            holdntrade.EXCHANGE = None
+            holdntrade.STATS = None
+            os.remove('test.stats')
+
+        self.assertEqual(['report'] * 11, priorities)
+        self.assertEqual(10000, data['price'])
+        self.assertIn('Wallet balance BTC:             0.9000', content['text'])
+        self.assertIn('Actual leverage:               1.50x', content['text'])
+        self.assertIn('Mayer multiple:                1.20 (< 1.40 = BUY)', content['text'])
+        self.assertIn('Position USD:;1000', content['csv'])
+        record = holdntrade.create_history_record(data)
+        self.assertEqual(1.0, record['margin_balance'])
+        self.assertAlmostEqual(0.2, record['performance'])
+        self.assertEqual(11000, record['lowest_sell_order'])
+        self.assertIsNone(record['highest_buy_order'])
+        self.assertEqual(1.2, record['mayer_multiple'])
+
+    @patch('holdntrade.daily_report')
+    def test_report_worker_should_report_in_own_thread_from_published_state(self, mock_daily_report):
+        holdntrade.CONF = self.create_default_conf()
+        holdntrade.CONF.bot_version = '1.0'
+        reported = threading.Event()
+        threads = []
+        mock_daily_report.side_effect = lambda: threads.append(threading.current_thread().name) or reported.set()
+        worker = holdntrade.ReportWorker(0.01)
+        holdntrade.REPORTER = worker
+        holdntrade.RESET_COUNTER = 3
+        try:
+            holdntrade.publish_state()
+            holdntrade.RESET_COUNTER = 4
+            worker.start()
+            self.assertTrue(reported.wait(5))
+        finally:
+            worker.stop()
+            holdntrade.REPORTER = None
+            holdntrade.RESET_COUNTER = 0
+        worker.thread.join(5)
+
+        self.assertEqual('report', threads[0])
+        self.assertFalse(worker.thread.is_alive())
+        data = worker.get_state()
+        data['generation_time'] = 2.51
+        general = holdntrade.create_mail_part_general(data)
+        self.assertIn('No. of resets:                    3', general)
+        self.assertIn('Generation time:               2.5s', general)
+
+    @patch('holdntrade.logging')
+    @patch('holdntrade.smtplib')
+    def test_send_mail_without_outbox_should_use_configured_port(self, mock_smtplib, mock_logging):
+        holdntrade.CONF = self.create_default_conf()
+        holdntrade.CONF.recipient_addresses = ['recipient@example.com']
+        holdntrade.CONF.sender_address = 'sender@example.com'
+        holdntrade.CONF.sender_password = 'password'
+        holdntrade.CONF.mail_server = 'mail.example.com'
+        holdntrade.CONF.mail_port = 2525
+        holdntrade.CONF.mail_starttls = False
+        holdntrade.LOG = mock_logging
+        holdntrade.OUTBOX = None
+
+        holdntrade.send_mail('Deactivated test', 'Deactivated test')
+
+        mock_smtplib.SMTP.assert_called_with('mail.example.com', 2525, timeout=mailer.TIMEOUT)
+        mock_smtplib.SMTP.return_value.starttls.assert_not_called()
+        mock_smtplib.SMTP.return_value.send_message.assert_called()
+
+    def test_send_mail_should_spool_report_once(self):
+        holdntrade.CONF = self.create_default_conf()
+        holdntrade.CONF.recipient_addresses = ['recipient@example.com']
+        holdntrade.CONF.sender_address = 'sender@example.com'
+        stand_in = mailer.SmtpStandIn()
+        stand_in.start()
+        holdntrade.OUTBOX = mailer.Outbox('test.outbox', '127.0.0.1', 'sender@example.com', 'password',
+                                          stand_in.port, False)
+        try:
+            with open('test.csv', 'w') as file:
+                file.write('test;2019-07-01 12:10:00 UTC;\n')
+            holdntrade.send_mail('Daily report for test', 'Generated: 12:10\nMargin balance', 'test.csv')
+            holdntrade.send_mail('Daily report for test', 'Generated: 12:11\nMargin balance', 'test.csv')
+            holdntrade.OUTBOX.start()
+            self.assertTrue(holdntrade.OUTBOX.flush(10))
+        finally:
+            holdntrade.OUTBOX.stop()
+            holdntrade.OUTBOX = None
+            stand_in.stop()
+            shutil.rmtree('test.outbox')
+            os.remove('test.csv')
+
+        self.assertEqual(1, len(stand_in.messages))
+        message = stand_in.messages[0]
+        self.assertEqual('Daily report for test', message['Subject'])
+        self.assertIsNotNone(message['Date'])
+        self.assertEqual('attachment; filename=test.csv', message.get_payload()[1]['Content-Disposition'])
+
+    def test_request_scheduler_should_adopt_rate_limit_headers(self):
+        exchange = MagicMock()
+        exchange.rateLimit = 2000
+        exchange.last_response_headers = {'X-RateLimit-Limit': '120', 'X-RateLimit-Remaining': '3'}
+        scheduler = holdntrade.RequestScheduler(exchange)
+        self.assertEqual(holdntrade.RequestScheduler.BURST, scheduler.capacity)
+
+        scheduler.fetch_balance()
+
+        self.assertEqual(120, scheduler.capacity)
+        self.assertEqual(2, scheduler.rate)
+        self.assertLessEqual(scheduler.tokens, 3)
+        self.assertEqual({'X-RateLimit-Limit': '120', 'X-RateLimit-Remaining': '3'}, scheduler.last_response_headers)
+
+    @patch('holdntrade.logging')
+    def test_mayer_service_should_serve_cached_value_and_refresh_it_in_background(self, mock_logging):
+        holdntrade.LOG = mock_logging
+        session = MagicMock()
+        session.get.return_value.json.return_value = {'data': {'current_mayer_multiple': '1.2',
+                                                               'average_mayer_multiple': '1.4'}}
+        mayer = holdntrade.MayerService(900, 'test.mayer', session)
+
+        self.assertEqual({'current': 1.2, 'average': 1.4}, mayer.get())
+        self.assertEqual({'current': 1.2, 'average': 1.4}, mayer.get())
+        session.get.assert_called_once_with(holdntrade.MayerService.URL, timeout=holdntrade.MayerService.TIMEOUT)
+
+        mayer.fetched -= 901
+        response = MagicMock()
+        response.json.return_value = {'data': {'current_mayer_multiple': '1.3', 'average_mayer_multiple': '1.4'}}
+        released = threading.Event()
+        session.get.side_effect = lambda url, timeout: released.wait(5) and response
+
+        self.assertEqual({'current': 1.2, 'average': 1.4}, mayer.get())
+        self.assertEqual({'current': 1.2, 'average': 1.4}, mayer.get())
+        released.set()
+        mayer.refreshing.join(5)
+        self.assertEqual({'current': 1.3, 'average': 1.4}, mayer.get())
+        self.assertEqual(2, session.get.call_count)
+        os.remove('test.mayer')
+
+    @patch('holdntrade.logging')
+    def test_mayer_service_should_fetch_if_persisted_value_is_corrupt(self, mock_logging):
+        holdntrade.LOG = mock_logging
+        with open('test.mayer', 'wt') as file:
+            file.write('{"current": 1.1, "aver')
+        session = MagicMock()
+        session.get.return_value.json.return_value = {'data': {'current_mayer_multiple': '1.2',
+                                                               'average_mayer_multiple': '1.4'}}
+        try:
+            mayer = holdntrade.MayerService(900, 'test.mayer', session)
+
+            mock_logging.warning.assert_called()
+            self.assertEqual({'current': 1.2, 'average': 1.4}, mayer.get())
+            session.get.assert_called_once()
+        finally:
+            os.remove('test.mayer')
+
+    @patch('holdntrade.logging')
+    def test_mayer_service_should_serve_persisted_value_if_refresh_fails(self, mock_logging):
+        holdntrade.LOG = mock_logging
+        with open('test.mayer', 'wt') as file:
+            file.write('{"current": 1.1, "average": 1.5, "fetched": 0}')
+        session = MagicMock()
+        session.get.side_effect = requests.exceptions.ReadTimeout('read timeout')
+        mayer = holdntrade.MayerService(900, 'test.mayer', session)
+
+        self.assertEqual({'current': 1.1, 'average': 1.5}, mayer.get())
+        mayer.refreshing.join(5)
+        self.assertEqual({'current': 1.1, 'average': 1.5}, mayer.get())
+        mock_logging.warning.assert_called()
+        os.remove('test.mayer')
+
     def test_keep_buying(self):
         holdntrade.CONF = self.create_default_conf()
         holdntrade.CONF.stop_on_top = True
@@ -1258,18 +1940,179 @@ class HoldntradeTest(unittest.TestCase):
                                   'datetime': datetime.datetime.now()})
         sell2 = holdntrade.Order({'id': '4', 'price': 9950, 'amount': 1000, 'side': 'sell',
                                   'datetime': datetime.datetime.now()})
-        holdntrade.SELL_ORDERS = [sell1, sell2]
+        holdntrade.SELL_ORDERS = holdntrade.OrderBook([sell1, sell2])
 
         self.assertFalse(holdntrade.keep_buying(10000))
 
         self.assertTrue(holdntrade.keep_buying(9999))
 
-        holdntrade.SELL_ORDERS = []
+        holdntrade.SELL_ORDERS = holdntrade.OrderBook()
         self.assertFalse(holdntrade.keep_buying(9000))
 
         holdntrade.CONF.stop_on_top = False
         self.assertTrue(holdntrade.keep_buying(15000))
 
+    def test_order_book_should_keep_lowest_highest_and_totals(self):
+        orders = [holdntrade.Order({'id': str(i), 'price': price, 'amount': 100, 'side': 'sell',
+                                    'datetime': datetime.datetime.now()})
+                  for i, price in enumerate([10000, 10200, 9800, 10100])]
+        book = holdntrade.OrderBook(orders)
+
+        self.assertEqual(9800, book.lowest().price)
+        self.assertEqual(10200, book.highest().price)
+        self.assertEqual(orders[0], book[0])
+        self.assertEqual(orders[-1], book[-1])
+
+        for order in book:
+            if order.price < 10100:
+                book.remove(order)
+
+        self.assertEqual([orders[1], orders[3]], book)
+        self.assertNotIn(orders[2], book)
+        self.assertEqual(10100, book.lowest().price)
+        self.assertEqual(200, book.get_stats()['qty'])
+        self.assertAlmostEqual(10150, book.get_stats()['avg'])
+        self.assertAlmostEqual(100 / 10200 + 100 / 10100, book.get_stats()['val'])
+        self.assertEqual(holdntrade.calculate_order_stats(list(book)), book.get_stats())
+
+        del book[-1]
+        del book[0]
+
+        self.assertFalse(book)
+        self.assertIsNone(book.highest())
+        self.assertEqual({'avg': 0, 'qty': 0}, book.get_stats())
+
+    @patch('holdntrade.get_current_price')
+    @patch('holdntrade.fetch_mayer')
+    def test_wake_conditions_should_fire_on_mayer_price_and_command(self, mock_fetch_mayer, mock_get_current_price):
+        holdntrade.CONF = self.create_default_conf()
+        holdntrade.INSTANCE = 'test'
+        holdntrade.TICKER = holdntrade.PriceTicker(5)
+        mock_fetch_mayer.return_value = {'current': 2.5, 'average': 1.5}
+        try:
+            conditions = holdntrade.WakeConditions(mock_fetch_mayer(), 10100)
+
+            self.assertIsNone(conditions.check())
+            holdntrade.TICKER.update(10100)
+            self.assertEqual('price 10100', conditions.check())
+
+            conditions = holdntrade.WakeConditions(mock_fetch_mayer(), 10100)
+            mock_fetch_mayer.return_value = {'current': 2.2, 'average': 1.5}
+            self.assertEqual('Mayer multiple 2.20', conditions.check())
+
+            open('test.wake', 'w').close()
+            self.assertEqual('command', conditions.check())
+            self.assertFalse(os.path.isfile('test.wake'))
+            mock_get_current_price.assert_not_called()
+        finally:
+            holdntrade.TICKER = None
+
+    @patch('holdntrade.shall_hibernate', return_value=True)
+    @patch('holdntrade.adjust_leverage')
+    @patch('holdntrade.sell_executed')
+    @patch('holdntrade.track_fills', return_value={'2'})
+    @patch('holdntrade.fetch_mayer', return_value={'current': 2.5, 'average': 1.5})
+    def test_wake_up_on_price_should_handle_sell_fills_and_arm_price_for_next_sell_only(self, mock_fetch_mayer,
+                                                                                         mock_track_fills,
+                                                                                         mock_sell_executed,
+                                                                                         mock_adjust_leverage,
+                                                                                         mock_shall_hibernate):
+        holdntrade.CONF = self.create_default_conf()
+        sell1 = holdntrade.Order({'id': '1', 'price': 10100, 'amount': 100, 'side': 'sell', 'datetime': '2019'})
+        sell2 = holdntrade.Order({'id': '2', 'price': 10200, 'amount': 100, 'side': 'sell', 'datetime': '2019'})
+        holdntrade.SELL_ORDERS = holdntrade.OrderBook([sell1, sell2])
+        try:
+            self.assertEqual(10100, holdntrade.create_wake_conditions().price_above)
+
+            holdntrade.wake_up('price 10100')
+
+            mock_sell_executed.assert_called_with({'2'})
+            mock_adjust_leverage.assert_called()
+            self.assertTrue(holdntrade.HIBERNATE)
+            self.assertIsNone(holdntrade.create_wake_conditions().price_above)
+            holdntrade.SELL_ORDERS.remove(sell1)
+            self.assertEqual(10200, holdntrade.create_wake_conditions().price_above)
+
+            holdntrade.wake_up('deadline')
+            mock_sell_executed.assert_called_once()
+        finally:
+            holdntrade.PRICE_WOKEN = None
+            holdntrade.HIBERNATE = False
+
+    @patch('holdntrade.get_leverage', return_value=3.2)
+    @patch('holdntrade.time')
+    @patch('holdntrade.fetch_mayer')
+    def test_wake_conditions_should_retry_leverage_and_follow_target(self, mock_fetch_mayer, mock_time,
+                                                                     mock_get_leverage):
+        holdntrade.CONF = self.create_default_conf()
+        holdntrade.CONF.auto_leverage = True
+        holdntrade.INSTANCE = 'test'
+        mock_time.time.return_value = 1000
+        mock_fetch_mayer.return_value = {'current': 1.2, 'average': 1.5}
+        conditions = holdntrade.WakeConditions(mock_fetch_mayer(), None)
+
+        self.assertIsNone(conditions.check())
+        mock_time.time.return_value = 1061
+        self.assertEqual('leverage above target', conditions.check())
+
+        conditions = holdntrade.WakeConditions(None, None)
+        mock_fetch_mayer.return_value = {'current': 0.8, 'average': 1.5}
+        self.assertEqual('target leverage 2.5', conditions.check())
+        mock_time.time.return_value = 5000
+        self.assertEqual('deadline', conditions.check())
+
+    @patch('holdntrade.get_leverage', return_value=3.0)
+    @patch('holdntrade.time')
+    @patch('holdntrade.fetch_mayer')
+    def test_wake_conditions_should_not_retry_leverage_at_target(self, mock_fetch_mayer, mock_time,
+                                                                 mock_get_leverage):
+        holdntrade.CONF = self.create_default_conf()
+        holdntrade.CONF.auto_leverage = True
+        holdntrade.INSTANCE = 'test'
+        mock_time.time.return_value = 1000
+        mock_fetch_mayer.return_value = {'current': 1.2, 'average': 1.5}
+        conditions = holdntrade.WakeConditions(mock_fetch_mayer(), None)
+
+        mock_time.time.return_value = 1061
+        self.assertIsNone(conditions.check())
+        mock_get_leverage.assert_called_once()
+
+    def test_cadence_should_follow_distance_to_nearest_trigger(self):
+        holdntrade.CONF = self.create_default_conf()
+        holdntrade.CONF.change = 0.01
+        holdntrade.CONF.spread_factor = 2
+        cadence = holdntrade.Cadence(30, 0.01)
+        sell_orders = holdntrade.OrderBook([holdntrade.Order({'id': '1', 'price': 11000, 'amount': 100,
+                                                              'side': 'sell', 'datetime': '2019'})])
+        buy_orders = holdntrade.OrderBook([holdntrade.Order({'id': '2', 'price': 9000, 'amount': 100,
+                                                             'side': 'buy', 'datetime': '2019'})])
+
+        self.assertEqual(30, cadence.get_delay(10000))
+        cadence.update(sell_orders, buy_orders)
+
+        self.assertEqual([9000, 9000 / 0.98, 11000 / 1.02, 11000], cadence.triggers)
+        self.assertEqual(0, cadence.get_delay(11000))
+        self.assertEqual(30, cadence.get_delay(10000))
+        self.assertAlmostEqual(30 * (90 / 9090 - 0.0025) / 0.0175, cadence.get_delay(9090))
+
+    @patch('holdntrade.get_cached_price')
+    @patch('holdntrade.get_current_price', return_value=10000)
+    @patch('holdntrade.time')
+    def test_cadence_wait_should_end_early_near_trigger(self, mock_time, mock_get_current_price,
+                                                         mock_get_cached_price):
+        holdntrade.CONF = self.create_default_conf()
+        holdntrade.CONF.change = 0.01
+        holdntrade.SELL_ORDERS = holdntrade.OrderBook([holdntrade.Order({'id': '1', 'price': 11000, 'amount': 100,
+                                                                         'side': 'sell', 'datetime': '2019'})])
+        holdntrade.BUY_ORDERS = holdntrade.OrderBook()
+        mock_get_cached_price.side_effect = [10000, 10990]
+        cadence = holdntrade.Cadence(30, 0.01)
+
+        cadence.wait()
+
+        self.assertEqual(2, mock_time.sleep.call_count)
+        self.assertEqual({'passes': 1, 'idle': 1, 'average': 10.0}, cadence.get_stats())
+
     @patch('holdntrade.get_balance')
     @patch('holdntrade.get_margin_balance')
     def test_compensate(self, mock_get_margin_balance, mock_get_balance):
@@ -1300,6 +2143,26 @@ class HoldntradeTest(unittest.TestCase):
         self.assertEqual(first_call, mock_set_leverage.mock_calls[0])
         self.assertEqual(last_call, mock_set_leverage.mock_calls[-1])
 
+    @patch('holdntrade.compact_position')
+    @patch('holdntrade.datetime')
+    def test_compact_daily_should_compact_once_before_report(self, mock_datetime, mock_compact_position):
+        holdntrade.CONF = self.create_default_conf()
+        holdntrade.CONF.send_emails = True
+        holdntrade.COMPACTED = 0
+        mock_datetime.datetime.side_effect = datetime.datetime
+        mock_datetime.datetime.utcnow.return_value = datetime.datetime(2019, 7, 2, 12, 5)
+
+        holdntrade.compact_daily()
+        mock_compact_position.assert_not_called()
+
+        mock_datetime.datetime.utcnow.return_value = datetime.datetime(2019, 7, 2, 12, 11)
+        holdntrade.compact_daily()
+        holdntrade.compact_daily()
+
+        mock_compact_position.assert_called_once()
+        self.assertEqual(2, holdntrade.COMPACTED)
+        holdntrade.COMPACTED = 0
+
     @patch('holdntrade.set_leverage')
     @patch('holdntrade.calculate_used_margin_percentage', return_value=95)
     def test_compact_position_percentage_too_high(self, mock_calculate_used_margin_percentage, mock_set_leverage):
@@ -1454,6 +2317,7 @@ class HoldntradeTest(unittest.TestCase):
         conf.base = currency[0]
         conf.quote = currency[1]
         conf.info = ""
+        conf.stats_days = 365
         return conf
 
 
@@ -0,0 +1,289 @@
+#!/usr/bin/python
+import email
+import email.policy
+import hashlib
+import logging
+import os
+import smtplib
+import socketserver
+import threading
+import time
+
+SMTP_PORT = 587
+TIMEOUT = 30
+# seconds a delivered message is remembered to drop duplicates
+DEDUP_TTL = 172800
+
+
+class Outbox:
+    """
+    Spools outgoing mails to a directory and delivers them in a background thread over one authenticated SMTP
+    connection, which is reused while there is mail to send. A failed delivery is retried with backoff, a message
+    already spooled or delivered recently is dropped. Putting a mail never waits for the mail server.
+    """
+    __slots__ = 'directory', 'server', 'port', 'sender', 'password', 'starttls', 'idle', 'log', 'connection', \
+                'used', 'backoff', 'due', 'lock', 'wake', 'delivered', 'stopped', 'thread'
+
+    FIRST_BACKOFF = 10
+    MAX_BACKOFF = 900
+
+    def __init__(self, directory: str, server: str, sender: str, password: str, port: int = SMTP_PORT,
+                 starttls: bool = True, idle: float = 60, log: logging.Logger = None):
+        """
+        :param directory: path of the spool, created if missing
+        :param server: host name of the mail server
+        :param sender: sender address, also used to log in
+        :param password: password of the sender, no login if empty
+        :param port: port of the mail server
+        :param starttls: whether the connection is secured with STARTTLS
+        :param idle: seconds after which an unused connection is closed
+        :param log: logger, the module logger if None
+        """
+        self.directory = directory
+        self.server = server
+        self.port = port
+        self.sender = sender
+        self.password = password
+        self.starttls = starttls
+        self.idle = idle
+        self.log = log if log is not None else logging.getLogger('mailer')
+        self.connection = None
+        self.used = 0
+        self.backoff = 0
+        self.due = 0
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        # set while the spool is empty
+        self.delivered = threading.Event()
+        self.stopped = False
+        self.thread = None
+        os.makedirs(directory, exist_ok=True)
+
+    def put(self, message: email.message.Message, key: str = None):
+        """
+        Spools a message for delivery
+        :param message: the mail
+        :param key: identifies duplicates, the digest of the message if None
+        :return False if the message was dropped as a duplicate
+        """
+        if key is None:
+            key = hashlib.sha256(message.as_bytes()).hexdigest()
+        path = os.path.join(self.directory, key + '.eml')
+        if os.path.isfile(path) or os.path.isfile(path + '.sent'):
+            self.log.info('Dropping duplicate mail %s', message['Subject'])
+            return False
+        with self.lock:
+            with open(path + '.tmp', 'wb') as file:
+                file.write(message.as_bytes())
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(path + '.tmp', path)
+            self.delivered.clear()
+        self.wake.set()
+        return True
+
+    def pending(self):
+        """
+        :return paths of the spooled messages, oldest first
+        """
+        paths = [os.path.join(self.directory, name) for name in os.listdir(self.directory) if name.endswith('.eml')]
+        return sorted(paths, key=os.path.getmtime)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name='mailer', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stops the sender without waiting for it, messages not yet delivered stay in the spool
+        """
+        self.stopped = True
+        self.wake.set()
+
+    def flush(self, timeout: float):
+        """
+        Waits at most timeout seconds until the spool is delivered
+        :return True if nothing is left to deliver
+        """
+        self.wake.set()
+        return self.delivered.wait(timeout)
+
+    def run(self):
+        while not self.stopped:
+            self.wake.clear()
+            if time.time() >= self.due:
+                self.deliver_pending()
+            with self.lock:
+                if not self.pending():
+                    self.delivered.set()
+            if self.delivered.is_set():
+                self.prune()
+            if self.connection is not None and time.time() - self.used > self.idle:
+                self.disconnect()
+            self.wake.wait(max(0.0, self.due - time.time()) if self.backoff else self.idle)
+        self.disconnect()
+
+    def deliver_pending(self):
+        for path in self.pending():
+            if self.stopped:
+                return
+            try:
+                self.deliver(path)
+                self.backoff = 0
+            except (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError) as error:
+                if not is_permanent(error):
+                    self.retry_later(error)
+                    return
+                self.log.error('Mail server rejected %s %s', os.path.basename(path), str(error.args))
+                os.replace(path, path + '.failed')
+            except (smtplib.SMTPException, OSError) as error:
+                self.retry_later(error)
+                return
+
+    def deliver(self, path: str):
+        with open(path, 'rb') as file:
+            message = email.message_from_binary_file(file, policy=email.policy.SMTP)
+        connection = self.connect()
+        try:
+            connection.send_message(message)
+        except smtplib.SMTPServerDisconnected:
+            # the server dropped the reused connection, try once on a new one
+            self.connection = None
+            self.connect().send_message(message)
+        self.used = time.time()
+        with open(path + '.sent', 'wb'):
+            pass
+        os.remove(path)
+        self.log.info('Sent email to %s', message['To'])
+
+    def retry_later(self, error: Exception):
+        self.backoff = min(self.MAX_BACKOFF, self.backoff * 2 or self.FIRST_BACKOFF)
+        self.due = time.time() + self.backoff
+        self.log.warning('Failed to send mail %s %s, retrying in %d seconds', type(error).__name__, str(error.args),
+                         self.backoff)
+        self.disconnect()
+
+    def connect(self):
+        """
+        :return the open connection to the mail server, connecting and logging in if there is none
+        """
+        if self.connection is None:
+            connection = smtplib.SMTP(self.server, self.port, timeout=TIMEOUT)
+            try:
+                if self.starttls:
+                    connection.starttls()
+                if self.password:
+                    connection.login(self.sender, self.password)
+            except (smtplib.SMTPException, OSError):
+                connection.close()
+                raise
+            self.connection = connection
+        return self.connection
+
+    def disconnect(self):
+        if self.connection is not None:
+            try:
+                self.connection.quit()
+            except (smtplib.SMTPException, OSError):
+                self.connection.close()
+            self.connection = None
+
+    def prune(self):
+        """
+        Forgets delivered messages after DEDUP_TTL seconds
+        """
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith('.sent') and time.time() - os.path.getmtime(path) > DEDUP_TTL:
+                os.remove(path)
+
+
+def is_permanent(error: smtplib.SMTPException):
+    """
+    :return True if the mail server refused the message for good (5xx), False if it may be accepted later (4xx)
+    """
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in error.recipients.values())
+    return error.smtp_code >= 500
+
+
+class SmtpStandIn:
+    """
+    Local SMTP server standing in for the mail server. It accepts any login and keeps the received messages and the
+    number of connections. Messages to the rejected addresses are refused temporarily.
+    """
+    def __init__(self, port: int = 0, rejected: tuple = ()):
+        self.messages = []
+        self.connections = 0
+        self.rejected = rejected
+        self.server = socketserver.ThreadingTCPServer(('127.0.0.1', port), self.create_handler())
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name='smtp-stand-in', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join(10)
+
+    def create_handler(self):
+        stand_in = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def reply(self, line: str):
+                self.wfile.write(line.encode() + b'\r\n')
+
+            def handle(self):
+                stand_in.connections += 1
+                self.reply('220 stand-in ESMTP')
+                recipients = []
+                while True:
+                    line = self.rfile.readline()
+                    if not line:
+                        return
+                    command = line.decode().strip()
+                    verb = command.split(' ', 1)[0].upper()
+                    if verb == 'EHLO':
+                        self.reply('250-stand-in')
+                        self.reply('250 AUTH PLAIN LOGIN')
+                    elif verb == 'HELO':
+                        self.reply('250 stand-in')
+                    elif verb == 'AUTH':
+                        self.reply('235 Authentication successful')
+                    elif verb == 'RCPT':
+                        address = command.split(':', 1)[1].strip(' <>')
+                        if address in stand_in.rejected:
+                            self.reply('450 Mailbox busy')
+                        else:
+                            recipients.append(address)
+                            self.reply('250 OK')
+                    elif verb == 'DATA':
+                        if not recipients:
+                            self.reply('554 No valid recipients')
+                            continue
+                        self.reply('354 End data with <CR><LF>.<CR><LF>')
+                        stand_in.messages.append(email.message_from_bytes(self.read_data()))
+                        recipients = []
+                        self.reply('250 OK')
+                    elif verb == 'RSET':
+                        recipients = []
+                        self.reply('250 OK')
+                    elif verb == 'QUIT':
+                        self.reply('221 Bye')
+                        return
+                    else:
+                        self.reply('250 OK')
+
+            def read_data(self):
+                lines = []
+                while True:
+                    line = self.rfile.readline()
+                    if not line or line in (b'.\r\n', b'.\n'):
+                        return b''.join(lines)
+                    lines.append(line[1:] if line.startswith(b'..') else line)
+
+        return Handler
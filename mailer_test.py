@@ -0,0 +1,90 @@
+import os
+import shutil
+import time
+import unittest
+from email.mime.text import MIMEText
+from unittest.mock import patch
+
+import mailer
+from mailer import Outbox, SmtpStandIn
+
+
+def create_message(subject: str, recipient: str = 'recipient@example.com'):
+    message = MIMEText('Text of ' + subject)
+    message['Subject'] = subject
+    message['From'] = 'sender@example.com'
+    message['To'] = recipient
+    return message
+
+
+class MailerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.stand_in = SmtpStandIn()
+        self.stand_in.start()
+
+    def tearDown(self):
+        if self.stand_in is not None:
+            self.stand_in.stop()
+        shutil.rmtree('test.outbox', ignore_errors=True)
+
+    def create_outbox(self, port: int = None):
+        return Outbox('test.outbox', '127.0.0.1', 'sender@example.com', 'password',
+                      self.stand_in.port if port is None else port, False)
+
+    def test_outbox_should_deliver_over_one_connection_and_drop_duplicates(self):
+        outbox = self.create_outbox()
+
+        self.assertTrue(outbox.put(create_message('first')))
+        self.assertTrue(outbox.put(create_message('second'), 'second'))
+        self.assertFalse(outbox.put(create_message('second again'), 'second'))
+        outbox.start()
+        try:
+            self.assertTrue(outbox.flush(10))
+            self.assertFalse(outbox.put(create_message('first')))
+        finally:
+            outbox.stop()
+
+        self.assertEqual(['first', 'second'], [message['Subject'] for message in self.stand_in.messages])
+        self.assertEqual(1, self.stand_in.connections)
+        self.assertEqual([], outbox.pending())
+
+    @patch.object(mailer.Outbox, 'FIRST_BACKOFF', 0.1)
+    def test_outbox_should_retry_after_temporary_rejection(self):
+        self.stand_in.rejected = ('busy@example.com',)
+        outbox = self.create_outbox()
+        outbox.put(create_message('report', 'busy@example.com'))
+        outbox.start()
+        try:
+            deadline = time.time() + 10
+            while not outbox.backoff and time.time() < deadline:
+                time.sleep(0.01)
+            self.assertFalse(outbox.delivered.is_set())
+            self.stand_in.rejected = ()
+            self.assertTrue(outbox.flush(10))
+        finally:
+            outbox.stop()
+
+        self.assertEqual(['report'], [message['Subject'] for message in self.stand_in.messages])
+        self.assertGreater(self.stand_in.connections, 1)
+
+    def test_put_should_not_wait_for_unreachable_server(self):
+        port = self.stand_in.port
+        self.stand_in.stop()
+        self.stand_in = None
+        outbox = self.create_outbox(port)
+        outbox.start()
+        started = time.time()
+        try:
+            outbox.put(create_message('deactivated'))
+            self.assertFalse(outbox.flush(0.5))
+        finally:
+            outbox.stop()
+
+        self.assertLess(time.time() - started, 2)
+        self.assertEqual(1, len(outbox.pending()))
+        self.assertTrue(os.path.isfile(outbox.pending()[0]))
+
+
+if __name__ == '__main__':
+    unittest.main()
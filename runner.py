@@ -0,0 +1,120 @@
+#!/usr/bin/python
+import concurrent.futures
+import importlib.util
+import logging
+import os
+import sys
+import threading
+import time
+
+import ccxt
+import requests
+from requests.adapters import HTTPAdapter
+
+import holdntrade
+
+SOURCE = holdntrade.__file__
+# seconds until a crashed instance is restarted, like osiris does
+RESTART_DELAY = 300
+
+
+def load_instance(name: str):
+    """
+    Loads a private copy of the holdntrade module, its globals are the state of one bot instance.
+    Imported libraries like ccxt are shared, only the module itself is executed again.
+    :param name: name of the instance (configuration file without .txt)
+    :return module
+    """
+    spec = importlib.util.spec_from_file_location('holdntrade_' + name, SOURCE)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def create_session(size: int):
+    """
+    Creates the http session shared by all instances, with a connection pool big enough for all of them
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=10, pool_maxsize=max(size, 10))
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+class Host:
+    """
+    Hosts several bot instances in one process, each in its own thread and with its own copy of the holdntrade module.
+    The instances share the http session (and thus the connections per exchange), the Mayer multiple and the price of
+    instances trading the same pair on the same exchange.
+    """
+    __slots__ = 'names', 'auto_conf', 'session', 'mayer', 'tickers', 'instances', 'lock', 'log'
+
+    def __init__(self, names: [str], auto_conf: bool = False):
+        self.names = names
+        self.auto_conf = auto_conf
+        self.session = create_session(len(names))
+        self.mayer = None
+        self.tickers = {}
+        self.instances = {}
+        self.lock = threading.Lock()
+        self.log = logging.getLogger('runner')
+
+    def start(self, name: str):
+        """
+        Loads and sets up an instance, attaching it to the shared resources
+        :return the module of the instance
+        """
+        bot = load_instance(name)
+        bot.SESSION = self.session
+        bot.read_arguments(['runner', name] + (['-ac'] if self.auto_conf else []))
+        bot.write_control_file()
+        bot.setup()
+        with self.lock:
+            if self.mayer is None:
+                self.mayer = bot.MayerService(bot.CONF.mayer_ttl, 'runner.mayer', self.session)
+            # the shared Mayer multiple is as fresh as the most demanding instance requires
+            self.mayer.ttl = min(self.mayer.ttl, bot.CONF.mayer_ttl)
+            bot.MAYER = self.mayer
+            if bot.FEED is None:
+                # the feed of an instance pushes its prices to the ticker it was started with
+                key = (bot.CONF.exchange, bot.CONF.pair, bool(getattr(bot.CONF, 'test', False)))
+                ticker = self.tickers.setdefault(key, bot.TICKER)
+                ticker.max_age = min(ticker.max_age, bot.CONF.price_max_age)
+                bot.TICKER = ticker
+            self.instances[name] = bot
+        return bot
+
+    def serve(self, name: str):
+        """
+        Runs an instance until it is deactivated, restarting it after a crash
+        """
+        while True:
+            try:
+                bot = self.start(name)
+                bot.LOOP = bot.init_orders(False, bot.AUTO_CONF)
+                bot.run()
+            except SystemExit:
+                self.log.info('%s stopped', name)
+                return
+            except Exception:
+                self.log.exception('%s crashed, restarting in %d seconds', name, RESTART_DELAY)
+                time.sleep(RESTART_DELAY)
+
+    def run(self):
+        with concurrent.futures.ThreadPoolExecutor(len(self.names), 'bot') as executor:
+            for name in self.names:
+                executor.submit(self.serve, name)
+
+
+if __name__ == '__main__':
+    print('Starting Hold n Trade Bot host')
+    print('ccxt version:', ccxt.__version__)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(threadName)s - %(message)s')
+    AUTO_CONF = '-ac' in sys.argv[1:]
+    NAMES = [os.path.basename(arg) for arg in sys.argv[1:] if arg != '-ac']
+    if not NAMES:
+        print('Usage: runner.py [-ac] config1 [config2 ...]')
+        sys.exit(1)
+    Host(NAMES, AUTO_CONF).run()
@@ -0,0 +1,52 @@
+import os
+import shutil
+import unittest
+
+import runner
+
+
+class RunnerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.names = ['test_a', 'test_b']
+        with open('config.txt') as file:
+            config = file.read().replace('"EXCHANGE_NAME"', '"bitmex"')
+        for name in self.names:
+            with open(name + '.txt', 'w') as file:
+                file.write(config if name == 'test_a' else config.replace('mayer_ttl = 900', 'mayer_ttl = 300'))
+        self.host = runner.Host(self.names)
+
+    def tearDown(self):
+        for bot in self.host.instances.values():
+            bot.OUTBOX.stop()
+        for name in self.names:
+            for suffix in ('.txt', '.pid', '.mayer'):
+                if os.path.isfile(name + suffix):
+                    os.remove(name + suffix)
+            if os.path.isfile(os.path.join('log', name + '.log')):
+                os.remove(os.path.join('log', name + '.log'))
+            shutil.rmtree(name + '.outbox', ignore_errors=True)
+
+    def test_instances_should_have_own_state_and_share_resources(self):
+        host = self.host
+
+        first = host.start('test_a')
+        second = host.start('test_b')
+
+        self.assertIsNot(first, second)
+        self.assertEqual('test_a', first.CONF.bot_instance)
+        self.assertEqual('test_b', second.CONF.bot_instance)
+        self.assertIsNot(first.SELL_ORDERS, second.SELL_ORDERS)
+        self.assertIsNot(first.LOG, second.LOG)
+        self.assertIs(host.session, first.EXCHANGE.exchange.session)
+        self.assertIs(host.session, second.EXCHANGE.exchange.session)
+        self.assertIs(first.TICKER, second.TICKER)
+        self.assertIs(first.MAYER, second.MAYER)
+        self.assertEqual(300, first.MAYER.ttl)
+        self.assertIs(first.ccxt, second.ccxt)
+        self.assertEqual({'test_a': first, 'test_b': second}, host.instances)
+        self.assertTrue(os.path.isfile('test_a.pid'))
+
+
+if __name__ == '__main__':
+    unittest.main()
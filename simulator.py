@@ -0,0 +1,400 @@
+#!/usr/bin/python
+import csv
+import datetime
+import itertools
+import math
+import random
+
+import ccxt
+
+SATOSHI_FACTOR = 0.00000001
+
+
+class PathExhausted(Exception):
+    """
+    Raised when the price path of the simulation has come to its end
+    """
+
+
+class SimulatedExchange:
+    """
+    In-process exchange implementing the subset of ccxt used by holdntrade for bitmex, kraken and liquid.
+    Limit orders are matched against a price path, the account is a margin account in the base currency holding
+    a long position in an inverse contract (amounts in quote, balances in base), which is how bitmex works.
+    Kraken and liquid take and return order amounts in base, they are converted with the order price.
+    The position is long only: sell orders exceeding the position are rejected.
+    """
+
+    def __init__(self, flavour: str = 'bitmex', prices=None, balance: float = 1.0, leverage: float = 1.0,
+                 maker_fee: float = -0.00025, taker_fee: float = 0.00075, spread: float = 0.5, interval: int = 60,
+                 symbol: str = None, base: str = 'BTC', quote: str = 'USD', funding_rate: float = 0.0001,
+                 step_on_ticker: bool = True, config: dict = None):
+        """
+        :param flavour: bitmex, kraken or liquid - determines the response shapes
+        :param prices: iterable of bid prices, a random walk if None
+        :param balance: initial wallet balance in base
+        :param leverage: initial leverage
+        :param maker_fee: fee rate of resting limit orders (negative for a rebate)
+        :param taker_fee: fee rate of market orders and limit orders crossing the spread
+        :param spread: difference between ask and bid
+        :param interval: seconds between two prices of the path
+        :param step_on_ticker: every fetch_ticker advances the path by one price
+        :param config: ccxt style options (api keys and the like), ignored
+        """
+        self.id = flavour
+        self.flavour = flavour
+        self.prices = iter(prices) if prices is not None else random_walk()
+        self.price = None
+        self.maker_fee = maker_fee
+        self.taker_fee = taker_fee
+        self.spread = spread
+        self.interval = interval
+        self.base = base
+        self.quote = quote
+        self.pair = base + '/' + quote
+        self.symbol = symbol if symbol is not None else 'XBTUSD' if flavour == 'bitmex' else base + quote
+        self.funding_rate = funding_rate
+        self.step_on_ticker = step_on_ticker
+        self.options = config if config is not None else {}
+        self.urls = {'api': 'simulator', 'test': 'simulator'}
+        self.rateLimit = 1
+        self.enableRateLimit = False
+        self.last_response_headers = None
+
+        self.now = int(datetime.datetime(2020, 1, 1).timestamp() * 1000)
+        self.wallet = balance
+        self.deposited = balance
+        self.leverage = leverage
+        self.quantity = 0
+        self.entry = None
+        self.orders = {}
+        self.ids = itertools.count(1)
+        self.advance()
+
+    # ------------------------------------------------------------------ simulation
+
+    def advance(self, steps: int = 1):
+        """
+        Moves along the price path, matching the open orders against every new price
+        :param steps: number of prices to advance
+        """
+        for _ in range(steps):
+            try:
+                self.price = float(next(self.prices))
+            except StopIteration:
+                raise PathExhausted('The price path is exhausted after {}'.format(self.price))
+            self.now += self.interval * 1000
+            self.match()
+
+    def ask(self):
+        return self.price + self.spread
+
+    def match(self):
+        for order in list(self.orders.values()):
+            if order['status'] != 'open':
+                continue
+            if order['side'] == 'buy' and self.price <= order['price'] or \
+                    order['side'] == 'sell' and self.price >= order['price']:
+                self.fill(order, order['price'], self.maker_fee)
+
+    def fill(self, order: dict, price: float, fee_rate: float):
+        quantity = order['quantity']
+        self.wallet -= quantity / price * fee_rate
+        if order['side'] == 'buy':
+            value = self.quantity / self.entry if self.quantity else 0
+            self.quantity += quantity
+            self.entry = self.quantity / (value + quantity / price)
+        else:
+            self.wallet += quantity * (1 / self.entry - 1 / price)
+            self.quantity -= quantity
+            if not self.quantity:
+                self.entry = None
+        order['status'] = 'closed'
+        order['average'] = price
+        order['lastTradeTimestamp'] = self.now
+
+    def place(self, side: str, order_type: str, amount: float, price: float = None):
+        """
+        Validates and places an order, orders crossing the spread and market orders are filled right away
+        :return the placed order
+        """
+        fill_price = self.ask() if side == 'buy' else self.price
+        quantity = amount if self.flavour == 'bitmex' else amount * (price if price is not None else fill_price)
+        if side == 'sell' and self.flavour == 'kraken' and order_type == 'market' and not amount:
+            # kraken closes the whole position with a volume of 0
+            quantity = self.quantity
+        if quantity <= 0:
+            raise ccxt.InvalidOrder('Invalid orderQty ' + str(amount))
+        if side == 'buy' and quantity / (price or fill_price) / self.leverage > self.get_free_margin():
+            raise ccxt.InsufficientFunds('Account has insufficient Available Balance')
+        if side == 'sell' and quantity > self.quantity - self.get_pending_sells():
+            raise ccxt.InsufficientFunds('Account has insufficient position to sell ' + str(amount))
+
+        order = {'id': str(next(self.ids)), 'side': side, 'type': order_type, 'amount': amount, 'quantity': quantity,
+                 'price': price, 'average': None, 'status': 'open', 'timestamp': self.now,
+                 'lastTradeTimestamp': None}
+        self.orders[order['id']] = order
+        if order_type == 'market':
+            order['price'] = fill_price
+            self.fill(order, fill_price, self.taker_fee)
+        elif side == 'buy' and price >= self.ask() or side == 'sell' and price <= self.price:
+            self.fill(order, fill_price, self.taker_fee)
+        return order
+
+    def close(self):
+        if self.quantity:
+            self.place('sell', 'market', self.quantity if self.flavour == 'bitmex' else self.quantity / self.price)
+
+    # ------------------------------------------------------------------ account
+
+    def get_pending_sells(self):
+        return sum(order['quantity'] for order in self.orders.values()
+                   if order['status'] == 'open' and order['side'] == 'sell')
+
+    def get_unrealised_pnl(self):
+        if not self.quantity:
+            return 0.0
+        return self.quantity * (1 / self.entry - 1 / self.price)
+
+    def get_equity(self):
+        return self.wallet + self.get_unrealised_pnl()
+
+    def get_used_margin(self):
+        used = self.quantity / self.entry / self.leverage if self.quantity else 0.0
+        return used + sum(order['quantity'] / order['price'] / self.leverage for order in self.orders.values()
+                          if order['status'] == 'open' and order['side'] == 'buy')
+
+    def get_free_margin(self):
+        return self.get_equity() - self.get_used_margin()
+
+    def get_margin_leverage(self):
+        return self.quantity / self.price / self.get_equity() if self.quantity else 0.0
+
+    def get_liquidation_price(self):
+        if not self.quantity:
+            return 0.0
+        return 1 / (self.wallet / self.quantity + 1 / self.entry)
+
+    # ------------------------------------------------------------------ responses
+
+    def unified(self, order: dict):
+        filled = order['amount'] if order['status'] == 'closed' else 0
+        return {'id': order['id'], 'clientOrderId': None, 'timestamp': order['timestamp'],
+                'datetime': self.iso8601(order['timestamp']), 'lastTradeTimestamp': order['lastTradeTimestamp'],
+                'symbol': self.pair, 'type': order['type'], 'side': order['side'], 'price': order['price'],
+                'average': order['average'], 'amount': order['amount'], 'filled': filled,
+                'remaining': order['amount'] - filled, 'status': order['status'], 'fee': None, 'info': order}
+
+    def raw(self, order: dict):
+        states = {'open': 'New', 'closed': 'Filled', 'canceled': 'Canceled'}
+        return {'orderID': order['id'], 'symbol': self.symbol, 'side': order['side'].capitalize(),
+                'orderQty': order['amount'], 'price': order['price'], 'ordType': order['type'].capitalize(),
+                'ordStatus': states[order['status']], 'timestamp': self.iso8601(order['timestamp']),
+                'transactTime': self.iso8601(order['lastTradeTimestamp'] or order['timestamp'])}
+
+    def parse_order(self, raw: dict, market=None):
+        return self.unified(self.orders[raw['orderID']])
+
+    @staticmethod
+    def iso8601(timestamp: int):
+        return datetime.datetime.utcfromtimestamp(timestamp / 1000).isoformat(timespec='milliseconds') + 'Z'
+
+    def get_order(self, order_id: str):
+        if order_id not in self.orders:
+            raise ccxt.OrderNotFound('Order not found: ' + str(order_id))
+        return self.orders[order_id]
+
+    # ------------------------------------------------------------------ unified ccxt api
+
+    def fetch_ticker(self, symbol: str = None, params: dict = None):
+        if self.step_on_ticker:
+            self.advance()
+        return {'symbol': self.pair, 'timestamp': self.now, 'datetime': self.iso8601(self.now), 'bid': self.price,
+                'ask': self.ask(), 'last': self.price}
+
+    def fetch_balance(self, params: dict = None):
+        equity = self.get_equity()
+        used = min(equity, self.get_used_margin())
+        balance = {'free': equity - used, 'used': used, 'total': equity}
+        info = [{'currency': 'XBt', 'walletBalance': round(self.wallet / SATOSHI_FACTOR),
+                 'marginBalance': round(equity / SATOSHI_FACTOR), 'marginLeverage': self.get_margin_leverage()}]
+        return {'info': info, self.base: balance, 'free': {self.base: balance['free']},
+                'used': {self.base: balance['used']}, 'total': {self.base: balance['total']}}
+
+    def fetch_order(self, order_id: str, symbol: str = None, params: dict = None):
+        return self.unified(self.get_order(order_id))
+
+    def fetch_order_status(self, order_id: str, symbol: str = None, params: dict = None):
+        return self.get_order(order_id)['status']
+
+    def fetch_open_orders(self, symbol: str = None, since: int = None, limit: int = None, params: dict = None):
+        orders = [self.unified(order) for order in self.orders.values() if order['status'] == 'open' and
+                  (since is None or order['timestamp'] >= since)]
+        return orders[:limit] if limit is not None else orders
+
+    def fetch_closed_orders(self, symbol: str = None, since: int = None, limit: int = None, params: dict = None):
+        orders = [self.unified(order) for order in self.orders.values() if order['status'] != 'open' and
+                  (since is None or (order['lastTradeTimestamp'] or order['timestamp']) >= since)]
+        return orders[:limit] if limit is not None else orders
+
+    def create_order(self, symbol: str, order_type: str, side: str, amount: float, price: float = None,
+                     params: dict = None):
+        return self.unified(self.place(side, order_type, amount, price))
+
+    def create_limit_buy_order(self, symbol: str, amount: float, price: float, params: dict = None):
+        return self.create_order(symbol, 'limit', 'buy', amount, price, params)
+
+    def create_limit_sell_order(self, symbol: str, amount: float, price: float, params: dict = None):
+        return self.create_order(symbol, 'limit', 'sell', amount, price, params)
+
+    def create_market_buy_order(self, symbol: str, amount: float, params: dict = None):
+        return self.create_order(symbol, 'market', 'buy', amount, None, params)
+
+    def create_market_sell_order(self, symbol: str, amount: float, params: dict = None):
+        return self.create_order(symbol, 'market', 'sell', amount, None, params)
+
+    def cancel_order(self, order_id: str, symbol: str = None, params: dict = None):
+        order = self.get_order(order_id)
+        if order['status'] != 'open':
+            raise ccxt.OrderNotFound('Unable to cancel order due to existing state: ' + order['status'])
+        order['status'] = 'canceled'
+        order['lastTradeTimestamp'] = self.now
+        return self.unified(order)
+
+    def fetch_deposits(self, code: str = None, since: int = None, limit: int = None, params: dict = None):
+        return [{'currency': self.base, 'amount': self.deposited, 'status': 'ok'}]
+
+    # ------------------------------------------------------------------ bitmex
+
+    def private_get_position(self, params: dict = None):
+        return [{'symbol': self.symbol, 'currency': 'XBt', 'currentQty': self.quantity,
+                 'avgEntryPrice': self.entry, 'leverage': self.leverage, 'isOpen': bool(self.quantity),
+                 'unrealisedPnl': round(self.get_unrealised_pnl() / SATOSHI_FACTOR), 'markPrice': self.price,
+                 'liquidationPrice': self.get_liquidation_price()}]
+
+    def private_post_position_leverage(self, params: dict):
+        self.leverage = float(params['leverage'])
+        return self.private_get_position()[0]
+
+    def private_post_order_closeposition(self, params: dict = None):
+        self.close()
+        return self.private_get_position()[0]
+
+    def private_post_order_bulk(self, params: dict):
+        responses = []
+        for request in params['orders']:
+            try:
+                order = self.place(request['side'].lower(), request.get('ordType', 'Limit').lower(),
+                                   request['orderQty'], request.get('price'))
+                responses.append(self.raw(order))
+            except ccxt.InsufficientFunds as error:
+                responses.append({'orderID': None, 'ordStatus': 'Rejected', 'ordRejReason': str(error)})
+        return responses
+
+    def private_delete_order(self, params: dict):
+        ids = params['orderID'] if isinstance(params['orderID'], list) else [params['orderID']]
+        responses = []
+        for order_id in ids:
+            order = self.get_order(order_id)
+            if order['status'] == 'open':
+                self.cancel_order(order_id)
+                responses.append(self.raw(order))
+            else:
+                response = self.raw(order)
+                response['error'] = 'Unable to cancel order due to existing state: ' + response['ordStatus']
+                responses.append(response)
+        return responses
+
+    def private_delete_order_all(self, params: dict = None):
+        return [self.raw(self.cancel_order(order['id'])['info']) for order in list(self.orders.values())
+                if order['status'] == 'open']
+
+    def private_get_user_wallet(self, params: dict = None):
+        return {'currency': 'XBt', 'deposited': round(self.deposited / SATOSHI_FACTOR), 'withdrawn': 0}
+
+    def public_get_funding(self, params: dict = None):
+        return [{'symbol': self.symbol, 'fundingRate': self.funding_rate / 3, 'fundingRateDaily': self.funding_rate}]
+
+    # ------------------------------------------------------------------ kraken
+
+    def private_post_tradebalance(self, params: dict = None):
+        equity = self.get_equity()
+        used = self.get_used_margin()
+        level = equity / used * 100 if used else 0
+        result = {'eb': self.wallet, 'tb': self.wallet, 'm': used, 'n': self.get_unrealised_pnl(), 'e': equity,
+                  'mf': equity - used, 'ml': level}
+        return {'error': [], 'result': {key: str(value) for key, value in result.items()}}
+
+    def private_post_openpositions(self, params: dict = None):
+        positions = []
+        if self.quantity:
+            positions.append({'symbol': self.symbol, 'vol': self.quantity / self.entry, 'cost': self.quantity,
+                              'unrealisedPnl': self.get_unrealised_pnl()})
+        return {'result': 'success', 'openPositions': positions}
+
+    def private_post_ledgers(self, params: dict = None):
+        return {'error': [], 'result': {'ledger': {}, 'count': 0}}
+
+    # ------------------------------------------------------------------ liquid
+
+    def private_get_trading_accounts(self, params: dict = None):
+        equity = self.get_equity()
+        used = self.get_used_margin()
+        return [{'currency_pair_code': self.symbol, 'funding_currency': self.base, 'margin': str(used),
+                 'free_margin': str(equity - used), 'equity': str(equity), 'leverage_level': self.leverage,
+                 'position': str(self.quantity / self.entry if self.quantity else 0),
+                 'pnl': str(self.get_unrealised_pnl())}]
+
+    def private_get_accounts_balance(self, params: dict = None):
+        return [{'currency': self.base, 'balance': str(self.wallet)}]
+
+    def private_get_trades(self, params: dict = None):
+        models = []
+        if self.quantity:
+            models.append({'currency_pair_code': self.pair, 'open_price': str(self.entry),
+                           'quantity': str(self.quantity / self.entry), 'unrealisedPnl': self.get_unrealised_pnl()})
+        return {'models': models}
+
+    def private_get_orders(self, params: dict = None):
+        params = params if params is not None else {}
+        side = params.get('side')
+        models = [{'id': order['id'], 'side': order['side'], 'quantity': str(order['amount']),
+                   'price': str(order['price'])} for order in self.orders.values()
+                  if order['status'] == 'open' and (side is None or order['side'] == side)]
+        return {'models': models}
+
+    def private_put_trades_close_all(self, params: dict = None):
+        self.close()
+        return []
+
+
+def random_walk(start: float = 10000, volatility: float = 0.002, seed: int = None):
+    """
+    Endless geometric random walk of prices
+    :param start: first price
+    :param volatility: standard deviation of the relative change per step
+    :param seed: makes the walk reproducible
+    """
+    generator = random.Random(seed)
+    price = start
+    while True:
+        yield round(price, 1)
+        price *= math.exp(generator.gauss(0, volatility))
+
+
+def load_prices(filename: str = None):
+    """
+    Reads a price path from a csv file, using the last column of every row holding a number
+    :param filename: path of the csv file, a random walk if empty
+    :return iterator over the prices
+    """
+    if not filename:
+        return random_walk()
+    prices = []
+    with open(filename, newline='') as file:
+        for row in csv.reader(file):
+            try:
+                prices.append(float(row[-1]))
+            except (ValueError, IndexError):
+                continue
+    return iter(prices)
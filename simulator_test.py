@@ -0,0 +1,111 @@
+import unittest
+from unittest.mock import patch
+
+import ccxt
+
+import holdntrade
+import simulator
+from simulator import SimulatedExchange
+
+
+class SimulatorTest(unittest.TestCase):
+
+    def test_limit_buy_should_fill_when_price_drops_and_open_position(self):
+        exchange = SimulatedExchange('bitmex', [10000, 9950, 9900], balance=1.0, maker_fee=0)
+        order = exchange.create_limit_buy_order('BTC/USD', 1000, 9950)
+
+        self.assertEqual('open', exchange.fetch_order_status(order['id']))
+        self.assertEqual(1, len(exchange.fetch_open_orders('BTC/USD')))
+
+        exchange.fetch_ticker('BTC/USD')
+
+        self.assertEqual('closed', exchange.fetch_order_status(order['id']))
+        position = exchange.private_get_position({'symbol': 'XBTUSD'})[0]
+        self.assertEqual(1000, position['currentQty'])
+        self.assertEqual(9950, position['avgEntryPrice'])
+        self.assertTrue(position['isOpen'])
+        self.assertEqual([], exchange.fetch_open_orders('BTC/USD'))
+        self.assertEqual(1, len(exchange.fetch_closed_orders('BTC/USD')))
+
+    def test_limit_sell_should_realise_profit_and_charge_fees(self):
+        exchange = SimulatedExchange('bitmex', [10000, 10100], balance=1.0, maker_fee=0.001, taker_fee=0.001)
+        exchange.create_market_buy_order('BTC/USD', 1000)
+        exchange.create_limit_sell_order('BTC/USD', 1000, 10100)
+        exchange.advance()
+
+        fees = 1000 / 10000.5 * 0.001 + 1000 / 10100 * 0.001
+        profit = 1000 * (1 / 10000.5 - 1 / 10100)
+        self.assertAlmostEqual(1.0 + profit - fees, exchange.fetch_balance()['BTC']['total'])
+        self.assertFalse(exchange.private_get_position()[0]['isOpen'])
+
+    def test_orders_exceeding_margin_or_position_should_be_rejected(self):
+        exchange = SimulatedExchange('bitmex', [10000], balance=0.1, leverage=2)
+
+        with self.assertRaises(ccxt.InsufficientFunds):
+            exchange.create_limit_buy_order('BTC/USD', 2001, 9000)
+        with self.assertRaises(ccxt.InsufficientFunds):
+            exchange.create_limit_sell_order('BTC/USD', 10, 11000)
+        response = exchange.private_post_order_bulk({'orders': [
+            {'symbol': 'XBTUSD', 'side': 'Buy', 'orderQty': 100, 'price': 9000, 'ordType': 'Limit'},
+            {'symbol': 'XBTUSD', 'side': 'Sell', 'orderQty': 100, 'price': 11000, 'ordType': 'Limit'}]})
+        self.assertEqual('New', response[0]['ordStatus'])
+        self.assertEqual('Rejected', response[1]['ordStatus'])
+        self.assertEqual(9000, exchange.parse_order(response[0])['price'])
+
+    def test_cancel_should_raise_if_order_is_not_open(self):
+        exchange = SimulatedExchange('bitmex', [10000])
+        order = exchange.create_limit_buy_order('BTC/USD', 100, 9000)
+        exchange.cancel_order(order['id'])
+
+        self.assertEqual('canceled', exchange.fetch_order_status(order['id']))
+        with self.assertRaises(ccxt.OrderNotFound):
+            exchange.cancel_order(order['id'])
+        with self.assertRaises(ccxt.OrderNotFound):
+            exchange.fetch_order_status('unknown')
+        self.assertIn('error', exchange.private_delete_order({'orderID': [order['id']]})[0])
+
+    def test_kraken_and_liquid_should_take_crypto_amounts(self):
+        kraken = SimulatedExchange('kraken', [10000, 9000], leverage=2, taker_fee=0)
+        kraken.create_market_buy_order('BTC/USD', 0.1, {'leverage': 2})
+        result = kraken.private_post_tradebalance({'asset': 'BTC'})['result']
+        self.assertAlmostEqual(1000.05 / 10000.5 / 2, float(result['m']))
+        self.assertEqual('success', kraken.private_post_openpositions()['result'])
+
+        liquid = SimulatedExchange('liquid', [10000], leverage=2)
+        liquid.create_limit_buy_order('BTC/USD', 0.1, 9000)
+        account = liquid.private_get_trading_accounts()[0]
+        self.assertAlmostEqual(900 / 9000 / 2, float(account['margin']))
+        self.assertEqual('0.1', liquid.private_get_orders({'status': 'live', 'side': 'buy'})['models'][0]['quantity'])
+
+    def test_path_end_should_stop_the_simulation(self):
+        exchange = SimulatedExchange('bitmex', [10000])
+
+        with self.assertRaises(simulator.PathExhausted):
+            exchange.fetch_ticker('BTC/USD')
+
+    @patch('holdntrade.logging')
+    def test_connect_to_exchange_should_select_simulator_and_serve_bot_reads(self, mock_logging):
+        holdntrade.LOG = mock_logging
+        holdntrade.CONF = holdntrade.ExchangeConfig
+        conf = holdntrade.CONF
+        conf.exchange = 'bitmex'
+        conf.pair = 'BTC/USD'
+        conf.symbol = 'XBTUSD'
+        conf.base = 'BTC'
+        conf.quote = 'USD'
+        conf.satoshi_factor = 0.00000001
+        conf.simulate = True
+        conf.simulate_prices = ''
+        try:
+            holdntrade.EXCHANGE = holdntrade.connect_to_exchange()
+
+            self.assertIsInstance(holdntrade.EXCHANGE, SimulatedExchange)
+            self.assertEqual(0, holdntrade.get_position_balance())
+            self.assertAlmostEqual(1.0, holdntrade.get_net_deposits())
+            self.assertAlmostEqual(1.0, holdntrade.get_wallet_balance())
+        finally:
+            conf.simulate = False
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,156 @@
+#!/usr/bin/python
+import configparser
+import csv
+import itertools
+import multiprocessing
+import os
+import sqlite3
+import sys
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import backtest
+from backtest import Backtest, Candles, Settings
+
+# columns of the shared history
+COLUMNS = ('time', 'open', 'high', 'low', 'close', 'mayer')
+METRICS = ('relative_performance', 'performance', 'fiat_performance', 'max_drawdown', 'margin_balance',
+           'actual_leverage', 'fills', 'fees', 'hibernated', 'liquidated')
+
+# history of the worker process, attached to the shared memory
+HISTORY = None
+
+
+def expand(grid: dict):
+    """
+    Builds every combination of the parameter values, skipping inconsistent leverage and Mayer multiple bands
+    :param grid: parameter name and list of values
+    :return list of dicts
+    """
+    names = list(grid)
+    combinations = []
+    for values in itertools.product(*(grid[name] for name in names)):
+        params = dict(zip(names, values))
+        settings = Settings(**params)
+        if not settings.leverage_low <= settings.leverage_default <= settings.leverage_high:
+            continue
+        if not settings.mm_floor <= settings.mm_ceil <= settings.mm_stop_buy:
+            continue
+        combinations.append(params)
+    return combinations
+
+
+def read_grid(filename: str):
+    """
+    Reads the grid section of a file, each line a setting and its comma separated values
+    :param filename: path of the grid file
+    :return dict parameter name and list of values
+    """
+    config = configparser.RawConfigParser()
+    config.read(filename)
+    try:
+        props = dict(config.items('grid'))
+    except configparser.NoSectionError:
+        raise SystemExit('invalid grid ' + filename)
+    defaults = Settings()
+    grid = {}
+    for name, values in props.items():
+        if name not in Settings.__slots__:
+            raise SystemExit('unknown setting ' + name)
+        default = getattr(defaults, name)
+        values = [value.strip().strip('"') for value in values.split(',')]
+        if isinstance(default, bool):
+            grid[name] = [value.lower() == 'true' for value in values]
+        else:
+            grid[name] = [type(default)(float(value)) for value in values]
+    return grid
+
+
+def share(candles: Candles):
+    """
+    Copies the candles and their Mayer multiples into one shared memory block
+    :return the shared memory
+    """
+    mayer = backtest.mayer_multiples(candles)
+    memory = shared_memory.SharedMemory(create=True, size=max(len(candles), 1) * len(COLUMNS) * 8)
+    table = np.ndarray((len(COLUMNS), len(candles)), dtype=np.float64, buffer=memory.buf)
+    for row, values in enumerate((candles.time, candles.open, candles.high, candles.low, candles.close, mayer)):
+        table[row] = values
+    return memory
+
+
+def attach(name: str, size: int):
+    """
+    Initializer of the workers: maps the shared history without copying it
+    """
+    global HISTORY
+
+    memory = shared_memory.SharedMemory(name=name)
+    table = np.ndarray((len(COLUMNS), size), dtype=np.float64, buffer=memory.buf)
+    candles = Candles(table[0], table[1], table[2], table[3], table[4])
+    HISTORY = (memory, candles, table[5])
+
+
+def evaluate(params: dict):
+    """
+    Runs the backtest of one combination in a worker
+    :return the parameters and the metrics
+    """
+    _, candles, mayer = HISTORY
+    metrics = Backtest(candles, Settings(**params), mayer).run().get_metrics()
+    return params, metrics
+
+
+def sweep(candles: Candles, grid: dict, processes: int = None, rank_by: str = 'relative_performance'):
+    """
+    Backtests all combinations of the grid on a process pool, the candles are shared with the workers
+    :param candles: the history
+    :param grid: parameter name and list of values
+    :param processes: number of workers, all cores if None
+    :param rank_by: metric to rank by, descending, ties are broken by the lower drawdown
+    :return list of (parameters, metrics), best first
+    """
+    combinations = expand(grid)
+    memory = share(candles)
+    try:
+        with multiprocessing.Pool(processes, attach, (memory.name, len(candles))) as pool:
+            chunksize = max(1, len(combinations) // ((processes or os.cpu_count()) * 4))
+            results = list(pool.imap_unordered(evaluate, combinations, chunksize))
+    finally:
+        memory.close()
+        memory.unlink()
+    return sorted(results, key=lambda result: (-result[1][rank_by], result[1]['max_drawdown']))
+
+
+def write(results: list, filename: str):
+    """
+    Writes the ranked results to a csv file or, for the extensions .db and .sqlite, to the table results of an
+    SQLite database
+    """
+    names = list(results[0][0]) if results else []
+    header = ['rank'] + names + list(METRICS)
+    rows = [[rank] + [params[name] for name in names] + [metrics[metric] for metric in METRICS]
+            for rank, (params, metrics) in enumerate(results, 1)]
+    if filename.endswith(('.db', '.sqlite')):
+        with sqlite3.connect(filename) as connection:
+            connection.execute('DROP TABLE IF EXISTS results')
+            connection.execute('CREATE TABLE results ({})'.format(', '.join(header)))
+            connection.executemany('INSERT INTO results VALUES ({})'.format(', '.join('?' * len(header))), rows)
+        connection.close()
+    else:
+        with open(filename, 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(header)
+            writer.writerows(rows)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 4:
+        print('Usage: sweep.py candles.csv grid.txt results.csv|results.db')
+        sys.exit(1)
+    RESULTS = sweep(Candles.read(sys.argv[1]), read_grid(sys.argv[2]))
+    write(RESULTS, sys.argv[3])
+    if RESULTS:
+        print('Best of {}: {}'.format(len(RESULTS), RESULTS[0][0]))
+        print(backtest.format_report(RESULTS[0][1]))
@@ -0,0 +1,63 @@
+import csv
+import os
+import sqlite3
+import unittest
+
+import numpy as np
+
+import sweep
+from backtest import Candles
+
+
+def create_candles(size: int):
+    closes = 10000 * (1 + 0.05 * np.sin(np.arange(size) / 50))
+    times = 1546300800000 + np.arange(size, dtype=np.int64) * 3600000
+    return Candles(times, closes, closes * 1.001, closes * 0.999, closes)
+
+
+class SweepTest(unittest.TestCase):
+
+    def test_expand_should_skip_inconsistent_bands(self):
+        grid = {'change': [0.004, 0.005], 'leverage_default': [1, 2], 'leverage_high': [1.5]}
+
+        combinations = sweep.expand(grid)
+
+        self.assertEqual([{'change': 0.004, 'leverage_default': 1, 'leverage_high': 1.5},
+                          {'change': 0.005, 'leverage_default': 1, 'leverage_high': 1.5}], combinations)
+
+    def test_read_grid(self):
+        with open('test.grid', 'w') as file:
+            file.write('[grid]\nchange = 0.004, 0.006\nauto_quota = true, false\nquota = 4\n')
+        try:
+            grid = sweep.read_grid('test.grid')
+        finally:
+            os.remove('test.grid')
+
+        self.assertEqual({'change': [0.004, 0.006], 'auto_quota': [True, False], 'quota': [4]}, grid)
+
+    def test_sweep_should_rank_results_of_all_combinations(self):
+        candles = create_candles(1000)
+        grid = {'change': [0.004, 0.005, 0.01], 'quota': [3, 5]}
+
+        results = sweep.sweep(candles, grid, 2)
+
+        self.assertEqual(6, len(results))
+        performances = [metrics['relative_performance'] for _, metrics in results]
+        self.assertEqual(sorted(performances, reverse=True), performances)
+        try:
+            sweep.write(results, 'test.csv')
+            sweep.write(results, 'test.db')
+            with open('test.csv', newline='') as file:
+                rows = list(csv.reader(file))
+            self.assertEqual(['rank', 'change', 'quota', 'relative_performance'], rows[0][:4])
+            self.assertEqual(7, len(rows))
+            connection = sqlite3.connect('test.db')
+            self.assertEqual(6, connection.execute('SELECT COUNT(*) FROM results').fetchone()[0])
+            connection.close()
+        finally:
+            os.remove('test.csv')
+            os.remove('test.db')
+
+
+if __name__ == '__main__':
+    unittest.main()